@@ -39,6 +39,30 @@ const ChatContainer: React.FC = () => {
     setMessages(prev => [...prev, { id: Date.now(), text, sender, action, images }]);
   };
 
+  const updateMessage = (id: number, changes: any) => {
+    setMessages(prev => prev.map(msg => (msg.id === id ? { ...msg, ...changes } : msg)));
+  };
+
+  // Handle action injection
+  const applyAction = (action: any) => {
+    if (!action) return;
+    const { type, orderDetails, productInfo, sizes } = action;
+    switch(type) {
+      case 'showShippingModal':
+        setShippingDetails(orderDetails);
+        setShowShipping(true);
+        break;
+      case 'showProductOptions':
+        setProductAction(productInfo);
+        break;
+      case 'showQuantitySelector':
+        setQuantityAction({ sizes, onConfirm: handleQuantityConfirm });
+        break;
+      default:
+        break;
+    }
+  };
+
   const handleSend = async (text: string) => {
     if (window.uploadRequiresCompletion) return;
     if (!text.trim() && !window.currentUpload) return;
@@ -46,39 +70,82 @@ const ChatContainer: React.FC = () => {
     // Add user message
     addMessage(text, 'user');
     setLoading(true);
+
+    // Bot reply is filled in as text deltas arrive
+    const botMessageId = Date.now() + 1;
+    let botText = '';
+    let botMessageAdded = false;
+    let cardShown = false;
+    const appendBotText = (delta: string) => {
+      botText += delta;
+      if (!botMessageAdded) {
+        botMessageAdded = true;
+        setLoading(false);
+        setMessages(prev => [...prev, { id: botMessageId, text: botText, sender: 'bot' }]);
+      } else {
+        updateMessage(botMessageId, { text: botText });
+      }
+    };
+
     try {
-      const response = await fetch(`${API_BASE_URL}/api/chat`, {
+      const response = await fetch(`${API_BASE_URL}/api/chat/stream`, {
         method: 'POST', headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ message: text, user_id: userId })
       });
-      const data = await response.json();
-      setLoading(false);
-
-      // Add bot response
-      addMessage(data.text, 'bot', data.action, data.images);
-
-      // Handle action injection
-      if (data.action) {
-        const { type, orderDetails, productInfo, sizes } = data.action;
-        switch(type) {
-          case 'showShippingModal':
-            setShippingDetails(orderDetails);
-            setShowShipping(true);
+      if (!response.ok || !response.body) throw new Error(`Chat request failed: ${response.status}`);
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      const handleEvent = (event: string, data: any) => {
+        switch(event) {
+          case 'card':
+            // Product card arrives before the pitch text
+            cardShown = true;
+            setLoading(false);
+            data.images?.forEach((img: any) => addProductImage(img.url, img.alt));
+            applyAction(data.action);
             break;
-          case 'showProductOptions':
-            setProductAction(productInfo);
+          case 'delta':
+            appendBotText(data.text);
             break;
-          case 'showQuantitySelector':
-            setQuantityAction({ sizes, onConfirm: handleQuantityConfirm });
+          case 'done':
+            setLoading(false);
+            if (!botMessageAdded) {
+              botMessageAdded = true;
+              addMessage(data.text, 'bot', data.action, data.images);
+            } else {
+              // The final text is authoritative (handlers may append notes after streaming)
+              updateMessage(botMessageId, { text: data.text, action: data.action, images: data.images });
+            }
+            if (!cardShown) {
+              applyAction(data.action);
+              data.images?.forEach((img: any) => addProductImage(img.url, img.alt));
+            }
             break;
           default:
             break;
         }
-      }
-
-      // Display images
-      if (data.images) {
-        data.images.forEach((img: any) => addProductImage(img.url, img.alt));
+      };
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary = buffer.indexOf('\n\n');
+        while (boundary !== -1) {
+          const raw = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          let event = 'message';
+          let data = '';
+          raw.split('\n').forEach(line => {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) data += line.slice(5).trim();
+          });
+          if (data) handleEvent(event, JSON.parse(data));
+          boundary = buffer.indexOf('\n\n');
+        }
       }
     } catch (err) {
       setLoading(false);
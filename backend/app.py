@@ -3,7 +3,7 @@ from flask_cors import CORS
 import logging
 from routes import init_routes
 from plato_bot import PlatoBot
-from config import PORT, DEBUG
+from config import PORT, DEBUG, CATALOG_WATCH_SECONDS
 from apscheduler.schedulers.background import BackgroundScheduler
 import asyncio
 
@@ -27,6 +27,13 @@ def create_app():
             'interval',
             minutes=30
         )
+        # Each worker picks up catalog file changes on its own, without a restart
+        if CATALOG_WATCH_SECONDS > 0:
+            scheduler.add_job(
+                plato_bot.reload_catalog_if_changed,
+                'interval',
+                seconds=CATALOG_WATCH_SECONDS
+            )
         scheduler.start()
         
         logger.info("Successfully initialized PlatoBot and cleanup scheduler")
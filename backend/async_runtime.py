@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Iterator, Optional, TypeVar
+from config import ASYNC_BLOCKING_WORKERS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class AsyncRuntime:
+    """
+    Owns a single long-lived asyncio event loop per worker process.
+
+    Flask views stay synchronous; they hand coroutines to this loop and wait for
+    the result. All outbound LLM calls are multiplexed on the one loop, so a
+    worker shares one connection pool across every conversation it serves.
+    """
+
+    def __init__(self, blocking_workers: int = ASYNC_BLOCKING_WORKERS):
+        self.blocking_workers = blocking_workers
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the loop thread on first use (and again after a fork)."""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                # Blocking work (Firestore, PayPal, catalog lookups) is pushed here via asyncio.to_thread
+                loop.set_default_executor(ThreadPoolExecutor(
+                    max_workers=self.blocking_workers,
+                    thread_name_prefix="plato-blocking"
+                ))
+                thread = threading.Thread(
+                    target=self._run_loop, args=(loop,), name="plato-async-loop", daemon=True
+                )
+                thread.start()
+                self._loop = loop
+                self._thread = thread
+                self._pid = os.getpid()
+                logger.info(f"Started async runtime loop in process {self._pid}")
+            return self._loop
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop) -> None:
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._ensure_loop()
+
+    def run(self, coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """Run a coroutine on the runtime loop and block the calling thread for its result."""
+        loop = self._ensure_loop()
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("AsyncRuntime.run() called from the runtime loop; await the coroutine instead")
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        return future.result(timeout)
+
+    def iterate(self, agen: AsyncIterator[T]) -> Iterator[T]:
+        """Drive an async generator on the runtime loop, yielding its items to synchronous code."""
+        async def _next():
+            return await agen.__anext__()
+
+        try:
+            while True:
+                try:
+                    yield self.run(_next())
+                except StopAsyncIteration:
+                    break
+        finally:
+            self.run(agen.aclose())
+
+runtime = AsyncRuntime()
+
+def run_sync(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """Run a coroutine on the shared runtime loop from synchronous code."""
+    return runtime.run(coro, timeout)
+
+def iterate_sync(agen: AsyncIterator[T]) -> Iterator[T]:
+    """Consume an async generator on the shared runtime loop from synchronous code."""
+    return runtime.iterate(agen)
@@ -0,0 +1,101 @@
+"""
+Latency and ranking-agreement benchmark for the color match metrics (COLOR_MATCH_METRIC).
+
+Runs get_closest_products_by_color for every category and a set of color queries (each color
+family, alone and with the light/dark/bright modifiers) with the HSL metric and with CIEDE2000,
+and reports their latency, how often both pick the same top product and the mean overlap of
+their top 10. Then times ColorIndex.nearest's vectorized scan against the KD-tree over random
+Lab colors of growing size, which is what TREE_MIN_COLORS is set from. Runs without Claude:
+queries that don't resolve to a hex code locally are skipped.
+
+    python benchmark_color_metric.py [--repeat 50]
+"""
+import argparse
+import logging
+import time
+from typing import Callable, Dict, List
+import numpy as np
+from color_index import LabTree, delta_e_2000, TREE_MIN_COLORS, TREE_OVERSAMPLE
+from product_decision_tree import ProductDecisionTree, COLOR_FAMILIES
+
+MODIFIERS = ("", "light", "dark", "bright")
+TOP = 10
+
+def queries(tree: ProductDecisionTree) -> List[str]:
+    """Family names with each modifier, where the name resolves to a hex code locally."""
+    resolved = []
+    for family in COLOR_FAMILIES:
+        for modifier in MODIFIERS:
+            query = f"{modifier} {family}".strip()
+            if tree.get_color_hex(query) != tree.COLOR_HEX_MAP.get("red", "#FF0000"):
+                resolved.append(query)
+    return resolved
+
+def timed(fn: Callable, repeat: int):
+    """Result of fn and its median latency in seconds."""
+    result = fn()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return result, float(np.median(latencies))
+
+def key(product: Dict) -> tuple:
+    return product['style_number'], product['color']
+
+def compare_metrics(tree: ProductDecisionTree, repeat: int) -> None:
+    latencies = {"hsl": [], "ciede2000": []}
+    same_top, overlap, runs = 0, 0.0, 0
+    for category in tree.categories:
+        for query in queries(tree):
+            picks = {}
+            for metric in latencies:
+                tree.color_metric = metric
+                results, seconds = timed(lambda: tree.get_closest_products_by_color(category, query, max_products=TOP), repeat)
+                picks[metric] = [key(p) for p in results]
+                latencies[metric].append(seconds)
+            runs += 1
+            if picks["hsl"][:1] == picks["ciede2000"][:1]:
+                same_top += 1
+            if picks["hsl"]:
+                overlap += len(set(picks["hsl"]) & set(picks["ciede2000"])) / len(picks["hsl"])
+    print(f"{runs} category/query pairs")
+    for metric, values in latencies.items():
+        print(f"  {metric:>10}: p50 {np.percentile(values, 50) * 1000:.3f}ms, p95 {np.percentile(values, 95) * 1000:.3f}ms")
+    print(f"  same top product: {same_top / runs:.1%}, top-{TOP} overlap: {overlap / runs:.1%}")
+
+def compare_search(repeat: int) -> None:
+    rng = np.random.default_rng(0)
+    print(f"nearest {TOP} of n random Lab colors (TREE_MIN_COLORS = {TREE_MIN_COLORS})")
+    for size in (64, 256, 512, 2048, 8192, 32768):
+        lab = rng.uniform([0, -100, -100], [100, 100, 100], (size, 3))
+        ids = np.arange(size)
+        lab_tree = LabTree(lab, ids)
+        targets = rng.uniform([0, -100, -100], [100, 100, 100], (20, 3))
+        scan_seconds, tree_seconds, recall = [], [], 0.0
+        for target in targets:
+            exact, seconds = timed(lambda: np.argsort(delta_e_2000(target, lab), kind="stable")[:TOP], repeat)
+            scan_seconds.append(seconds)
+
+            def search():
+                candidates = lab_tree.query(target, TOP * TREE_OVERSAMPLE)
+                return candidates[np.argsort(delta_e_2000(target, lab[candidates]), kind="stable")[:TOP]]
+
+            found, seconds = timed(search, repeat)
+            tree_seconds.append(seconds)
+            recall += len(set(exact) & set(found)) / TOP
+        print(f"  n={size:>6}: scan {np.median(scan_seconds) * 1000:.3f}ms, "
+              f"tree {np.median(tree_seconds) * 1000:.3f}ms, tree recall {recall / len(targets):.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    compare_metrics(ProductDecisionTree(), args.repeat)
+    compare_search(args.repeat)
+
+if __name__ == "__main__":
+    main()
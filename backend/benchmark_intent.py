@@ -0,0 +1,117 @@
+"""
+Offline accuracy benchmark for the local intent classifier.
+
+Runs k-fold cross-validation over the labelled examples, then scores a model trained on
+all of them against a hand-written held-out set. For each confidence threshold it reports
+how many messages would be answered locally (hit rate) and how accurate those local
+answers are. Everything else would go to Claude.
+
+The seed examples are largely generated from templates ("I need N <color> <garment>"),
+so variants of one template share a group and are held out together; otherwise a fold
+would test on near-copies of its training data. The held-out messages are phrased the way
+customers write (placement and quantity wording the rules don't catch), and
+INTENT_CLASSIFIER_THRESHOLD is chosen from them.
+
+    python benchmark_intent.py [--examples data/intent_examples.jsonl] [--heldout data/intent_heldout.jsonl] [--folds 5]
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List
+from config import INTENT_EXAMPLES_PATH
+from intent_classifier import IntentClassifier, IntentModel, load_examples
+
+THRESHOLDS = (0.5, 0.7, 0.8, 0.9, 0.95, 0.99)
+HELDOUT_PATH = "data/intent_heldout.jsonl"
+# The held-out set is small, so the threshold keeps this far above its most confident mistake
+MARGIN = 0.05
+
+def cross_validate(examples, folds: int, seed: int):
+    """Yield (train, test) splits with every example held out exactly once, a group at a time."""
+    groups = defaultdict(list)
+    for example in examples:
+        groups[example.get("group") or example["text"]].append(example)
+    keys = sorted(groups)
+    random.Random(seed).shuffle(keys)
+    for k in range(folds):
+        held_out = set(keys[k::folds])
+        test = [e for key in keys if key in held_out for e in groups[key]]
+        train = [e for key in keys if key not in held_out for e in groups[key]]
+        yield train, test
+
+class Tally:
+    """Local answers and their accuracy per threshold over a set of scored examples."""
+
+    def __init__(self):
+        self.total = 0
+        self.model_correct = 0
+        self.answered = defaultdict(int)
+        self.correct = defaultdict(int)
+        self.timings: List[float] = []
+        self.errors = []
+
+    def score(self, model: IntentModel, examples: List[Dict]) -> None:
+        classifier = IntentClassifier(model)
+        for example in examples:
+            start = time.perf_counter()
+            prediction = classifier.predict(example["text"])
+            self.timings.append(time.perf_counter() - start)
+            self.total += 1
+            self.model_correct += model.predict(example["text"]).label == example["label"]
+            for threshold in THRESHOLDS:
+                if prediction.confidence >= threshold:
+                    self.answered[threshold] += 1
+                    self.correct[threshold] += prediction.label == example["label"]
+            if prediction.label != example["label"]:
+                self.errors.append((example, prediction))
+
+    def accuracy(self, threshold: float) -> float:
+        hits = self.answered[threshold]
+        return self.correct[threshold] / hits if hits else 1.0
+
+    def report(self, title: str) -> None:
+        print(f"{title}: {self.total} examples, model alone: accuracy {self.model_correct / self.total:.1%}")
+        print(f"{'threshold':>10} {'hit rate':>9} {'local accuracy':>15} {'wrong':>6}")
+        for threshold in THRESHOLDS:
+            hits = self.answered[threshold]
+            print(f"{threshold:>10.2f} {hits / self.total:>9.1%} {self.accuracy(threshold):>15.1%} "
+                  f"{hits - self.correct[threshold]:>6}")
+        if self.errors:
+            print("Misclassified:")
+            for example, prediction in self.errors:
+                print(f"  [{example['label']} -> {prediction.label} {prediction.confidence:.2f} {prediction.source}] {example['text']}")
+        print()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--examples", default=INTENT_EXAMPLES_PATH)
+    parser.add_argument("--heldout", default=HELDOUT_PATH)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    examples = load_examples(args.examples)
+    cross_validated = Tally()
+    for train, test in cross_validate(examples, args.folds, args.seed):
+        cross_validated.score(IntentModel.train(train), test)
+    cross_validated.report(f"{args.folds}-fold cross-validation, grouped by template")
+
+    heldout = Tally()
+    heldout.score(IntentModel.train(examples), load_examples(args.heldout))
+    heldout.report(f"Held-out set {args.heldout}, model trained on every example")
+
+    timings = sorted(cross_validated.timings + heldout.timings)
+    print(f"Latency per message: p50 {timings[len(timings) // 2] * 1e6:.0f}us, "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1e6:.0f}us")
+    worst = max((p.confidence for _, p in cross_validated.errors + heldout.errors), default=0.0)
+    safe = [t for t in THRESHOLDS if t >= worst + MARGIN]
+    print(f"Most confident wrong prediction: {worst:.2f}")
+    if safe:
+        print(f"Suggested INTENT_CLASSIFIER_THRESHOLD: {safe[0]:.2f} "
+              f"(held-out hit rate {heldout.answered[safe[0]] / heldout.total:.1%})")
+    else:
+        print("No threshold clears the wrong predictions; keep the classifier to its rules")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Accuracy and latency benchmark for the ambiguity-gated product rerank.
+
+For every labelled case, runs the local ranking (rank_with_confidence) and the Claude rerank
+over the same candidates, then reports, per confidence threshold, how often Claude would be
+asked, how accurate the gated picks are and their latency. "claude" is the ungated rerank
+(the previous behaviour); "local" never asks Claude. Uses the configured Claude endpoint, so
+point CLAUDE_BASE_URL at claude_stub_server.py for a dry run.
+
+    python benchmark_rerank.py [--cases data/rerank_cases.jsonl]
+"""
+import argparse
+import json
+import logging
+import time
+from typing import Dict, List
+from claude_client import ClaudeClient
+from product_decision_tree import ProductDecisionTree
+
+THRESHOLDS = (0.05, 0.1, 0.2, 0.3, 0.5)
+
+def load_cases(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def is_correct(product: Dict, case: Dict) -> bool:
+    """The pick has an acceptable color, and the expected material and brand when the case names them."""
+    if product is None or product["color"] not in case["expected_colors"]:
+        return False
+    if case.get("expected_material") and product["material"] != case["expected_material"]:
+        return False
+    if case.get("expected_brand") and not product["product_name"].lower().startswith(case["expected_brand"].lower()):
+        return False
+    return True
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+def report(name: str, results: List[Dict]) -> None:
+    """results: one {"correct", "claude", "seconds"} dict per case."""
+    total = len(results)
+    latencies = [r["seconds"] for r in results]
+    print(f"{name:>10} {sum(r['claude'] for r in results) / total:>12.1%} "
+          f"{sum(r['correct'] for r in results) / total:>9.1%} "
+          f"{percentile(latencies, 0.5) * 1000:>8.1f}ms {percentile(latencies, 0.95) * 1000:>8.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", default="data/rerank_cases.jsonl")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    tree = ProductDecisionTree(ClaudeClient())
+    tree.rerank_threshold = None
+    runs = []
+    for case in load_cases(args.cases):
+        start = time.perf_counter()
+        candidates = tree.rerank_candidates(case["category"], case["preferences"])
+        local_pick, confidence = tree.rank_with_confidence(candidates, case["preferences"])
+        local_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        claude_pick, _ = tree.select_product_with_claude(case["category"], case["query"], case["preferences"])
+        claude_seconds = time.perf_counter() - start
+        runs.append({
+            "case": case,
+            "confidence": confidence,
+            "local": (is_correct(local_pick, case), local_seconds),
+            "claude": (is_correct(claude_pick, case), claude_seconds)
+        })
+
+    print(f"{len(runs)} cases")
+    print(f"{'mode':>10} {'claude calls':>12} {'accuracy':>9} {'p50':>10} {'p95':>10}")
+    report("claude", [{"correct": r["claude"][0], "claude": True, "seconds": r["claude"][1]} for r in runs])
+    for threshold in THRESHOLDS:
+        gated = []
+        for r in runs:
+            ask = r["confidence"] < threshold
+            correct = r["claude"][0] if ask else r["local"][0]
+            # The gated path always ranks locally first, and only then asks Claude
+            seconds = r["local"][1] + (r["claude"][1] if ask else 0.0)
+            gated.append({"correct": correct, "claude": ask, "seconds": seconds})
+        report(f"gate {threshold:.2f}", gated)
+    report("local", [{"correct": r["local"][0], "claude": False, "seconds": r["local"][1]} for r in runs])
+
+    disagreements = [r for r in runs if r["local"][0] != r["claude"][0]]
+    if disagreements:
+        print("Local and Claude disagree on correctness:")
+        for r in disagreements:
+            print(f"  [confidence {r['confidence']:.2f}, local {'ok' if r['local'][0] else 'wrong'}, "
+                  f"claude {'ok' if r['claude'][0] else 'wrong'}] {r['case']['query']}")
+
+if __name__ == "__main__":
+    main()
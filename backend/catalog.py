@@ -0,0 +1,207 @@
+"""
+The product catalog, loaded from data/catalog.json instead of being defined in code.
+
+The file lists categories, their styles and each style's colorways. Every style field is
+shared by its colors; a color entry may override any of them (e.g. a price) and may give
+the color's hex code for colors the product tree doesn't know. Catalog.load validates the
+file, including that every product image exists, and compiles the lookups the bot uses, so
+a bad edit is rejected as a whole and the running catalog stays in place.
+"""
+import json
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the file layout changes
+FORMAT_VERSION = 1
+STYLE_FIELDS = ("style_number", "product_name", "price", "material", "colors")
+IMAGE_PREFIX = "/productimages/"
+PRICE_RE = re.compile(r"^\$\d+(\.\d{1,2})?$")
+HEX_RE = re.compile(r"^#[0-9A-Fa-f]{6}$")
+
+class CatalogError(Exception):
+    """The catalog file is missing, unreadable or invalid; errors lists every problem found."""
+
+    def __init__(self, path: str, errors: List[str]):
+        self.path = path
+        self.errors = errors
+        shown = "; ".join(errors[:10]) + (f"; and {len(errors) - 10} more" if len(errors) > 10 else "")
+        super().__init__(f"Invalid catalog {path}: {shown}")
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """(modification time, size) of the file, or None if it doesn't exist; changes on every rewrite."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def read_source(path: str) -> Tuple[bytes, Optional[Tuple[int, int]]]:
+    """Contents of the catalog file and its signature, taken before reading so a concurrent rewrite is seen as a change."""
+    signature = file_signature(path)
+    try:
+        with open(path, "rb") as f:
+            return f.read(), signature
+    except OSError as e:
+        raise CatalogError(path, [str(e)])
+
+def image_dirs(images_dir: str) -> Dict[str, int]:
+    """
+    Modification time of images_dir and of every directory under it, by path relative to it;
+    adding, removing or renaming an image changes its directory's. Empty if it doesn't exist.
+    """
+    return {os.path.relpath(root, images_dir): os.stat(root).st_mtime_ns for root, _, _ in os.walk(images_dir)}
+
+def image_dirs_unchanged(images_dir: str, dirs: Dict[str, int]) -> bool:
+    """Whether the directories image_dirs returned have the same modification times, checked without listing them."""
+    if not dirs:
+        return not os.path.isdir(images_dir)
+    try:
+        return all(os.stat(os.path.join(images_dir, path)).st_mtime_ns == mtime for path, mtime in dirs.items())
+    except OSError:
+        return False
+
+def price_value(price: str) -> float:
+    return float(price.replace("$", ""))
+
+class Catalog:
+    """
+    One validated catalog version: products per category, in file order (dicts, or the
+    ProductRow views of a CatalogStore), and lookups by key, style and price. Material and
+    brand filters go through the store's mask, which checks each distinct value once.
+    """
+
+    def __init__(self, categories: Dict[str, List[Dict]], category_names: Dict[str, str],
+                 color_hex: Dict[str, str], version: int = 0, path: Optional[str] = None,
+                 signature: Optional[Tuple[int, int]] = None):
+        self.categories = categories
+        self.category_names = category_names
+        self.color_hex = color_hex
+        self.version = version
+        self.path = path
+        self.signature = signature
+        self.loaded_at = time.time()
+        # The CatalogStore the products were read from, if any
+        self.store = None
+
+        # Position of every product across all categories, in file order (the store's row)
+        self.rows: Dict[int, int] = {}
+        self.by_key: Dict[str, Dict] = {}
+        self.by_style: Dict[str, List[Dict]] = defaultdict(list)
+        # Products of each category from cheapest to priciest, file order among equal prices
+        self.by_price: Dict[str, List[Tuple[float, Dict]]] = {}
+        for category, products in categories.items():
+            for product in products:
+                self.rows[id(product)] = len(self.rows)
+                self.by_key[f"{product['style_number']}_{product['color']}"] = product
+                self.by_style[product["style_number"]].append(product)
+            self.by_price[category] = sorted(((price_value(p["price"]), p) for p in products), key=lambda x: x[0])
+
+    @classmethod
+    def load(cls, path: str, images_dir: Optional[str] = None) -> "Catalog":
+        """The catalog in path; raises CatalogError listing every problem if it is invalid."""
+        source, signature = read_source(path)
+        return cls.parse(source, path, images_dir, signature)
+
+    @classmethod
+    def parse(cls, source: bytes, path: str, images_dir: Optional[str] = None,
+              signature: Optional[Tuple[int, int]] = None) -> "Catalog":
+        """The catalog in source, the contents of the file at path; raises CatalogError if it is invalid."""
+        try:
+            data = json.loads(source)
+        except ValueError as e:
+            raise CatalogError(path, [str(e)])
+        categories, category_names, color_hex, errors = cls._parse(data, images_dir)
+        if errors:
+            raise CatalogError(path, errors)
+        catalog = cls(categories, category_names, color_hex, data.get("version", 0), path, signature)
+        logger.info(f"Loaded catalog v{catalog.version} from {path}: {len(catalog.by_key)} products "
+                    f"in {len(categories)} categories")
+        return catalog
+
+    @staticmethod
+    def _parse(data: Dict, images_dir: Optional[str]):
+        """Products, category names, color hex codes and validation errors of a catalog file's data."""
+        categories: Dict[str, List[Dict]] = {}
+        category_names: Dict[str, str] = {}
+        color_hex: Dict[str, str] = {}
+        errors: List[str] = []
+        if not isinstance(data, dict) or data.get("format") != FORMAT_VERSION:
+            return categories, category_names, color_hex, [f"format must be {FORMAT_VERSION}"]
+        seen = set()
+        for i, category in enumerate(data.get("categories") or []):
+            key = category.get("key")
+            if not key or not category.get("name") or not category.get("styles"):
+                errors.append(f"categories[{i}] needs a key, a name and styles")
+                continue
+            if key in categories:
+                errors.append(f"category {key} is listed twice")
+                continue
+            category_names[key] = category["name"]
+            products = categories[key] = []
+            for style in category["styles"]:
+                where = f"{key} style {style.get('style_number')}"
+                missing = [field for field in STYLE_FIELDS if not style.get(field)]
+                if missing:
+                    errors.append(f"{where} is missing {', '.join(missing)}")
+                    continue
+                if not PRICE_RE.match(str(style["price"])):
+                    errors.append(f"{where} has an invalid price {style['price']!r}")
+                shared = {k: v for k, v in style.items() if k not in ("style_number", "product_name", "colors")}
+                for entry in style["colors"]:
+                    color = entry.get("color")
+                    if not color:
+                        errors.append(f"{where} has a color without a name")
+                        continue
+                    if (style["style_number"], color) in seen:
+                        errors.append(f"{where} color {color} is listed twice")
+                        continue
+                    seen.add((style["style_number"], color))
+                    overrides = {k: v for k, v in entry.items() if k not in ("color", "images", "hex")}
+                    product = {"style_number": style["style_number"], "product_name": style["product_name"],
+                               "color": color, **shared, **overrides, "images": entry.get("images")}
+                    if "price" in overrides and not PRICE_RE.match(str(overrides["price"])):
+                        errors.append(f"{where} color {color} has an invalid price {overrides['price']!r}")
+                    errors.extend(Catalog._image_errors(f"{where} color {color}", product["images"], images_dir))
+                    if entry.get("hex"):
+                        if HEX_RE.match(entry["hex"]):
+                            color_hex[color] = entry["hex"]
+                        else:
+                            errors.append(f"{where} color {color} has an invalid hex code {entry['hex']}")
+                    products.append(product)
+        if not categories:
+            errors.append("no categories")
+        return categories, category_names, color_hex, errors
+
+    @staticmethod
+    def _image_errors(where: str, images: Optional[Dict], images_dir: Optional[str]) -> List[str]:
+        if not isinstance(images, dict) or not images.get("front") or not images.get("back"):
+            return [f"{where} needs front and back images"]
+        errors = []
+        for side, image in images.items():
+            if not image.startswith(IMAGE_PREFIX):
+                errors.append(f"{where} {side} image must be under {IMAGE_PREFIX}")
+            elif images_dir is not None and not os.path.isfile(os.path.join(images_dir, image[len(IMAGE_PREFIX):])):
+                errors.append(f"{where} {side} image {image} not found")
+        return errors
+
+    def rows_of(self, products: List[Dict]) -> List[int]:
+        """Rows of catalog products (the dicts themselves, not copies)."""
+        return [self.rows[id(product)] for product in products]
+
+    def colors_of(self, style_number: str) -> List[str]:
+        return sorted(p["color"] for p in self.by_style.get(style_number, []))
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "products": len(self.by_key),
+            "categories": {key: len(products) for key, products in self.categories.items()},
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.loaded_at))
+        }
@@ -0,0 +1,361 @@
+"""
+Columnar build of the product catalog, memory-mapped read-only by every worker.
+
+compile_store turns a validated Catalog and its ColorIndex into one file of fixed-width
+columns. Product fields are dictionary-encoded as ids into a shared string table, list
+fields (features) as ranges of a list pool, and every catalog color has its hex, RGB,
+HSL, Lab, family and modifiers. A worker opens the file with CatalogStore.open and maps it,
+so the columns live once in the page cache for all gunicorn workers. A worker whose store
+matches the catalog file (source_hash) starts without parsing or validating the JSON or
+recomputing color features. Its products are ProductRow views that decode a field from
+the columns when it's read, so a worker holds no per-product dicts. The header records
+the modification times of the product image directories, and a store is recompiled
+when one changed, without listing them. The file is replaced atomically. A worker keeps
+the mapping it opened until it reloads.
+
+    python catalog_store.py        # compile data/catalog.json ahead of a deploy
+"""
+import copy
+import json
+import logging
+import mmap
+import os
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from catalog import Catalog, image_dirs_unchanged
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PLATOCAT"
+# Bumped when the file layout changes; a store with another format is recompiled
+FORMAT_VERSION = 2
+ALIGN = 64
+# Returned by CatalogStore.value for a field the product doesn't have
+MISSING = object()
+
+class _Strings:
+    """String table under construction: one id per distinct string."""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+
+    def id(self, value: str) -> int:
+        return self.ids.setdefault(value, len(self.ids))
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        encoded = [value.encode("utf-8") for value in self.ids]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        return {"string_offsets": offsets, "string_bytes": np.frombuffer(b"".join(encoded), dtype=np.uint8)}
+
+def _field_kind(values: List[Any]) -> Tuple[str, List[str]]:
+    """Column encoding for the values a field takes: str, bool, list (of str), map (str values) or json."""
+    if all(isinstance(v, str) for v in values):
+        return "str", []
+    if all(isinstance(v, bool) for v in values):
+        return "bool", []
+    if all(isinstance(v, list) and all(isinstance(x, str) for x in v) for v in values):
+        return "list", []
+    if all(isinstance(v, dict) and all(isinstance(x, str) for x in v.values()) for v in values):
+        keys = []
+        for v in values:
+            keys.extend(k for k in v if k not in keys)
+        return "map", keys
+    return "json", []
+
+def compile_store(catalog: Catalog, color_index, source_hash: str, image_dirs: Dict[str, int]) -> bytes:
+    """The store file for a catalog and the ColorIndex built from it; image_dirs is catalog.image_dirs of its images."""
+    strings = _Strings()
+    list_pool: List[int] = []
+    lists: Dict[Tuple[int, ...], Tuple[int, int]] = {}
+
+    def list_range(values: Sequence[str]) -> Tuple[int, int]:
+        # Equal lists (a style's features, shared by all its colors) are stored once
+        ids = tuple(strings.id(v) for v in values)
+        if ids not in lists:
+            lists[ids] = (len(list_pool), len(list_pool) + len(ids))
+            list_pool.extend(ids)
+        return lists[ids]
+
+    products = [p for key in catalog.categories for p in catalog.categories[key]]
+    count = len(products)
+    fields: List[Dict] = []
+    names: List[str] = []
+    for product in products:
+        names.extend(k for k in product if k not in names)
+    columns: Dict[str, np.ndarray] = {}
+    for name in names:
+        kind, keys = _field_kind([p[name] for p in products if name in p])
+        fields.append({"name": name, "kind": kind, "keys": keys})
+        if kind == "bool":
+            column = np.full(count, -1, dtype=np.int8)
+            for i, p in enumerate(products):
+                if name in p:
+                    column[i] = int(p[name])
+            columns[f"field:{name}"] = column
+        elif kind == "list":
+            column = np.full((count, 2), -1, dtype=np.int32)
+            for i, p in enumerate(products):
+                if name in p:
+                    column[i] = list_range(p[name])
+            columns[f"field:{name}"] = column
+        else:
+            for key in keys or [None]:
+                column = np.full(count, -1, dtype=np.int32)
+                for i, p in enumerate(products):
+                    if name not in p or (key is not None and key not in p[name]):
+                        continue
+                    value = p[name] if key is None else p[name][key]
+                    column[i] = strings.id(json.dumps(value) if kind == "json" else value)
+                columns[f"field:{name}" if key is None else f"field:{name}/{key}"] = column
+
+    colors = len(color_index.names)
+    columns["color_name"] = np.array([strings.id(n) for n in color_index.names], dtype=np.int32)
+    columns["color_hex"] = np.array([strings.id(h) for h in color_index.hex], dtype=np.int32)
+    columns["color_family"] = np.array([strings.id(str(f)) for f in color_index.family], dtype=np.int32)
+    columns["color_modifiers"] = np.array([list_range(m) for m in color_index.modifiers], dtype=np.int32).reshape(colors, 2)
+    for feature in ("rgb", "hsl", "lab"):
+        columns[f"color_{feature}"] = np.ascontiguousarray(getattr(color_index, feature), dtype=np.float64)
+    columns["product_color_row"] = np.array([color_index.rows[p["color"]] for p in products], dtype=np.int32)
+    columns["list_pool"] = np.array(list_pool, dtype=np.int32)
+    columns.update(strings.columns())
+
+    layout, offset = {}, 0
+    for name, column in columns.items():
+        layout[name] = {"dtype": column.dtype.str, "shape": list(column.shape), "offset": offset}
+        offset += -(-column.nbytes // ALIGN) * ALIGN
+    categories, start = [], 0
+    for key, category_products in catalog.categories.items():
+        categories.append([key, catalog.category_names[key], start, start + len(category_products)])
+        start += len(category_products)
+    header = json.dumps({
+        "format": FORMAT_VERSION,
+        "version": catalog.version,
+        "source_hash": source_hash,
+        "image_dirs": image_dirs,
+        "categories": categories,
+        "color_hex": catalog.color_hex,
+        "fields": fields,
+        "columns": layout
+    }).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+    out = bytearray(data_start + offset)
+    out[:len(MAGIC)] = MAGIC
+    out[len(MAGIC):len(MAGIC) + 8] = len(header).to_bytes(8, "little")
+    out[len(MAGIC) + 8:len(MAGIC) + 8 + len(header)] = header
+    for name, column in columns.items():
+        position = data_start + layout[name]["offset"]
+        out[position:position + column.nbytes] = column.tobytes()
+    return bytes(out)
+
+def write_store(path: str, data: bytes) -> None:
+    """Write the store next to its final path and rename it over the old one, so readers never see half a file."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+def _read_header(buffer) -> Tuple[Optional[Dict], int]:
+    if len(buffer) < len(MAGIC) + 8 or bytes(buffer[:len(MAGIC)]) != MAGIC:
+        return None, 0
+    length = int.from_bytes(buffer[len(MAGIC):len(MAGIC) + 8], "little")
+    header = json.loads(bytes(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + length]))
+    return header, -(-(len(MAGIC) + 8 + length) // ALIGN) * ALIGN
+
+class ProductRow(Mapping):
+    """
+    One product of a CatalogStore, read-only like the store: each field is decoded from the
+    columns when it's read. copy() (or dict()) gives a plain dict to change or keep.
+    """
+
+    __slots__ = ("store", "row")
+
+    def __init__(self, store: "CatalogStore", row: int):
+        self.store = store
+        self.row = row
+
+    def __getitem__(self, name: str) -> Any:
+        value = self.store.value(name, self.row)
+        if value is MISSING:
+            raise KeyError(name)
+        return value
+
+    def __iter__(self):
+        return (name for name in self.store.field_names if self.store.value(name, self.row) is not MISSING)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def copy(self) -> Dict:
+        return dict(self)
+
+    def __deepcopy__(self, memo) -> Dict:
+        return copy.deepcopy(dict(self), memo)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+class CatalogStore:
+    """
+    A compiled catalog: columns are read-only NumPy views of the file mapping (or of an
+    in-memory build when the store can't be written).
+    """
+
+    def __init__(self, buffer, header: Dict, data_start: int, path: Optional[str] = None):
+        self.buffer = buffer
+        self.header = header
+        self.data_start = data_start
+        self.path = path
+        self.version = header["version"]
+        self.source_hash = header["source_hash"]
+        self._columns: Dict[str, np.ndarray] = {}
+        self._strings: Dict[int, str] = {}
+        self._lists: Dict[Tuple[int, int], List[str]] = {}
+        self._fields = {field["name"]: field for field in header["fields"]}
+        self.field_names = list(self._fields)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CatalogStore":
+        header, data_start = _read_header(data)
+        return cls(data, header, data_start)
+
+    @classmethod
+    def open(cls, path: str, source_hash: Optional[str] = None,
+             images_dir: Optional[str] = None) -> Optional["CatalogStore"]:
+        """
+        The store at path, or None if there is none, it's unreadable, it was compiled from
+        another source, or a directory under images_dir changed since.
+        """
+        try:
+            with open(path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            header, data_start = _read_header(buffer)
+        except ValueError:
+            header = None
+        if header is None or header.get("format") != FORMAT_VERSION:
+            logger.warning(f"Ignoring catalog store {path}: not a format {FORMAT_VERSION} store")
+            return None
+        if source_hash is not None and header.get("source_hash") != source_hash:
+            logger.info(f"Catalog store {path} was compiled from another catalog version")
+            return None
+        if images_dir is not None and not image_dirs_unchanged(images_dir, header.get("image_dirs", {})):
+            logger.info(f"Catalog store {path} was compiled before {images_dir} changed")
+            return None
+        return cls(buffer, header, data_start, path)
+
+    def column(self, name: str) -> np.ndarray:
+        column = self._columns.get(name)
+        if column is None:
+            spec = self.header["columns"][name]
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"]))
+            column = np.frombuffer(self.buffer, dtype=dtype, count=count,
+                                   offset=self.data_start + spec["offset"]).reshape(spec["shape"])
+            self._columns[name] = column
+        return column
+
+    def string(self, string_id: int) -> str:
+        value = self._strings.get(string_id)
+        if value is None:
+            offsets = self.column("string_offsets")
+            value = self.column("string_bytes")[offsets[string_id]:offsets[string_id + 1]].tobytes().decode("utf-8")
+            self._strings[string_id] = value
+        return value
+
+    def strings(self, list_range: Sequence[int]) -> List[str]:
+        start, end = int(list_range[0]), int(list_range[1])
+        return [self.string(i) for i in self.column("list_pool")[start:end].tolist()]
+
+    def value(self, name: str, row: int) -> Any:
+        """Field name of the product in row, or MISSING if it doesn't have one."""
+        field = self._fields.get(name)
+        if field is None:
+            return MISSING
+        kind = field["kind"]
+        if kind == "map":
+            value = {}
+            for key in field["keys"]:
+                string_id = int(self.column(f"field:{name}/{key}")[row])
+                if string_id >= 0:
+                    value[key] = self.string(string_id)
+            return value or MISSING
+        column = self.column(f"field:{name}")
+        if kind == "list":
+            list_range = tuple(column[row].tolist())
+            if list_range[0] < 0:
+                return MISSING
+            if list_range not in self._lists:
+                # Products sharing a list (a style's features) share one copy, as when loaded from JSON
+                self._lists[list_range] = self.strings(list_range)
+            return self._lists[list_range]
+        value = int(column[row])
+        if value < 0:
+            return MISSING
+        if kind == "bool":
+            return bool(value)
+        return json.loads(self.string(value)) if kind == "json" else self.string(value)
+
+    def catalog(self, path: str, signature: Optional[Tuple[int, int]] = None) -> Catalog:
+        """The Catalog stored here, of ProductRow views; path and signature are those of the catalog file it was compiled from."""
+        categories = {key: [ProductRow(self, row) for row in range(start, end)]
+                      for key, _, start, end in self.header["categories"]}
+        names = {key: name for key, name, _, _ in self.header["categories"]}
+        catalog = Catalog(categories, names, dict(self.header["color_hex"]), self.version, path, signature)
+        catalog.store = self
+        return catalog
+
+    def color_features(self) -> Tuple[List[str], Dict]:
+        """Color names and their precomputed features, for ColorIndex."""
+        names = [self.string(i) for i in self.column("color_name").tolist()]
+        features = {
+            "hex": [self.string(i) for i in self.column("color_hex").tolist()],
+            "rgb": self.column("color_rgb"),
+            "hsl": self.column("color_hsl"),
+            "lab": self.column("color_lab"),
+            "family": np.array([self.string(i) for i in self.column("color_family").tolist()]),
+            "modifiers": [self.strings(r) for r in self.column("color_modifiers").tolist()]
+        }
+        return names, features
+
+    def category_color_rows(self) -> Dict[str, np.ndarray]:
+        """Color rows of each category's products, aligned with its product list."""
+        rows = self.column("product_color_row").astype(np.intp)
+        return {key: rows[start:end] for key, _, start, end in self.header["categories"]}
+
+    def mask(self, field: str, rows: Sequence[int], predicate: Callable[[str], bool]) -> np.ndarray:
+        """
+        Which of the products in rows have a string field value satisfying predicate. The
+        predicate runs once per distinct value among them, not once per product.
+        """
+        ids = self.column(f"field:{field}")[np.asarray(rows, dtype=np.intp)]
+        distinct, inverse = np.unique(ids, return_inverse=True)
+        keep = np.array([i >= 0 and predicate(self.string(int(i))) for i in distinct], dtype=bool)
+        return keep[inverse.reshape(-1)] if len(ids) else np.zeros(0, dtype=bool)
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "mapped": isinstance(self.buffer, mmap.mmap),
+            "bytes": len(self.buffer),
+            "strings": int(self.column("string_offsets").shape[0]) - 1
+        }
+
+def main():
+    import argparse
+    from product_decision_tree import ProductDecisionTree
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    # The tree compiles the store when it doesn't match the catalog file
+    tree = ProductDecisionTree()
+    store = tree.catalog.store
+    stats = store.stats() if store is not None else "disabled (CATALOG_STORE_PATH is empty)"
+    print(f"Catalog v{tree.catalog.version}: {len(tree.catalog.by_key)} products, store {stats}")
+
+if __name__ == "__main__":
+    main()
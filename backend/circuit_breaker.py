@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+from llm_metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Permits returned by allow(): an ordinary call, or the half-open probe
+CALL = "call"
+PROBE = "probe"
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream service while its breaker is open."""
+
+class CircuitBreaker:
+    """
+    Circuit breaker over a rolling window of recent call outcomes.
+
+    Trips open when, with at least min_calls in the window, the error rate reaches
+    error_rate_threshold or the latency percentile reaches latency_threshold. While
+    open, calls are rejected immediately. After open_seconds one probe call is let
+    through (half-open): success closes the breaker, failure re-opens it. allow() returns a
+    permit that the caller passes back with the call's outcome, so only the probe itself can
+    decide the half-open state or free its slot.
+    """
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, error_rate_threshold: float = 0.5,
+                 latency_threshold: float = 20.0, latency_percentile: float = 0.95, open_seconds: float = 30.0):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.latency_threshold = latency_threshold
+        self.latency_percentile = latency_percentile
+        self.open_seconds = open_seconds
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+            logger.info(f"Circuit breaker '{self.name}' half-open, allowing a probe call")
+        return self._state
+
+    def is_open(self) -> bool:
+        """True while calls are being rejected (a half-open breaker counts as closed for routing)."""
+        return self.state == OPEN
+
+    def allow(self) -> Optional[str]:
+        """CALL or PROBE if a call may go upstream now, else None."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return CALL
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return PROBE
+            self.rejected += 1
+            return None
+
+    def release(self, permit: Optional[str]) -> None:
+        """Give back the half-open probe slot if permit holds it, for a call that was allowed but never sent."""
+        if permit != PROBE:
+            return
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self, latency: float, permit: Optional[str] = CALL) -> None:
+        self._record(True, latency, permit)
+
+    def record_failure(self, latency: float, permit: Optional[str] = CALL) -> None:
+        self._record(False, latency, permit)
+
+    def _record(self, ok: bool, latency: float, permit: Optional[str]) -> None:
+        with self._lock:
+            state = self._current_state()
+            if state == HALF_OPEN:
+                if permit != PROBE:
+                    # A call that started before the breaker opened; only the probe decides
+                    return
+                self._probe_in_flight = False
+                if ok and latency < self.latency_threshold:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    logger.info(f"Circuit breaker '{self.name}' closed after successful probe")
+                else:
+                    self._trip("probe failed")
+                return
+            if state == OPEN:
+                # A call that started before the breaker opened; it doesn't change anything
+                return
+
+            self._outcomes.append((ok, latency))
+            if len(self._outcomes) < self.min_calls:
+                return
+            error_rate = sum(1 for success, _ in self._outcomes if not success) / len(self._outcomes)
+            if error_rate >= self.error_rate_threshold:
+                self._trip(f"error rate {error_rate:.0%}")
+                return
+            latency_at = percentile(sorted(l for _, l in self._outcomes), self.latency_percentile)
+            if latency_at >= self.latency_threshold:
+                self._trip(f"p{int(self.latency_percentile * 100)} latency {latency_at:.1f}s")
+
+    def _trip(self, reason: str) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.times_opened += 1
+        logger.warning(f"Circuit breaker '{self.name}' opened: {reason}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "window_calls": len(self._outcomes)
+            }
@@ -1,104 +1,624 @@
+import asyncio
+import json
 import logging
+import time
+import weakref
 import requests
-from typing import Dict, List
+import httpx
+from typing import AsyncIterator, Callable, Dict, List, Optional
 from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from config import CLAUDE_API_KEY, CLAUDE_BASE_URL, CLAUDE_MODEL
+from config import (
+    CLAUDE_API_KEY, CLAUDE_BASE_URL, CLAUDE_MODEL,
+    CLAUDE_MAX_CONNECTIONS, CLAUDE_MAX_KEEPALIVE_CONNECTIONS,
+    CLAUDE_MAX_CONCURRENCY, CLAUDE_HTTP2,
+    LLM_CACHE_ENABLED, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS, LLM_CACHE_PATH,
+    SINGLE_FLIGHT_ENABLED,
+    CLAUDE_BREAKER_WINDOW, CLAUDE_BREAKER_MIN_CALLS, CLAUDE_BREAKER_ERROR_RATE,
+    CLAUDE_BREAKER_LATENCY_SECONDS, CLAUDE_BREAKER_LATENCY_PERCENTILE, CLAUDE_BREAKER_OPEN_SECONDS,
+    CLAUDE_RATE_LIMIT_ENABLED, CLAUDE_RPM_LIMIT, CLAUDE_INPUT_TPM_LIMIT, CLAUDE_OUTPUT_TPM_LIMIT,
+    CLAUDE_RATE_LIMIT_MAX_WAIT_SECONDS, CLAUDE_RATE_LIMIT_PATH
+)
+from llm_cache import LLMCache
+from llm_profiles import LLMProfile, get_profile
+from llm_metrics import metrics
+from http_retry import RetryStats, post_with_retries, apost_with_retries
+from deadline import DeadlineExceeded, current_deadline
+from single_flight import SingleFlight
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from rate_limiter import RateLimiter, RateLimitExceeded, Reservation, estimate_input_tokens
+import structured_output
 
 logger = logging.getLogger(__name__)
 
+ERROR_RESPONSE = "I encountered an error. Please try again or contact support if the issue persists."
+
+# Breaker permit of a cascade fast-model call: it never takes the half-open probe and isn't recorded
+FAST_PERMIT = "fast"
+# HTTP status equivalent of an error event in a stream whose response was already a 200
+STREAM_ERROR_STATUS = {"overloaded_error": "529", "api_error": "500"}
+
 class ClaudeClient:
     def __init__(self):
         if not CLAUDE_API_KEY:
             logger.error("CLAUDE_API_KEY not set in environment!")
             raise Exception("Missing CLAUDE_API_KEY")
-            
+
         self.session = self._setup_session()
         self.model = CLAUDE_MODEL or "claude-3-7-sonnet-20250219"
-        
+
+        # httpx clients and semaphores are bound to the event loop that created them
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._semaphores = weakref.WeakKeyDictionary()
+
+        self.cache = LLMCache(
+            max_entries=LLM_CACHE_MAX_ENTRIES,
+            ttl_seconds=LLM_CACHE_TTL_SECONDS,
+            disk_path=LLM_CACHE_PATH
+        ) if LLM_CACHE_ENABLED else None
+        self.inflight = SingleFlight("claude") if SINGLE_FLIGHT_ENABLED else None
+        self.breaker = CircuitBreaker(
+            "claude",
+            window=CLAUDE_BREAKER_WINDOW,
+            min_calls=CLAUDE_BREAKER_MIN_CALLS,
+            error_rate_threshold=CLAUDE_BREAKER_ERROR_RATE,
+            latency_threshold=CLAUDE_BREAKER_LATENCY_SECONDS,
+            latency_percentile=CLAUDE_BREAKER_LATENCY_PERCENTILE,
+            open_seconds=CLAUDE_BREAKER_OPEN_SECONDS
+        )
+        self.rate_limiter = RateLimiter(
+            "claude",
+            requests_per_minute=CLAUDE_RPM_LIMIT,
+            input_tokens_per_minute=CLAUDE_INPUT_TPM_LIMIT,
+            output_tokens_per_minute=CLAUDE_OUTPUT_TPM_LIMIT,
+            max_wait_seconds=CLAUDE_RATE_LIMIT_MAX_WAIT_SECONDS,
+            state_path=CLAUDE_RATE_LIMIT_PATH
+        ) if CLAUDE_RATE_LIMIT_ENABLED else None
+
+        # Cumulative token usage for this process, including Anthropic prompt cache reads/writes
+        self.usage_totals = {
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cache_read_input_tokens": 0,
+            "cache_creation_input_tokens": 0
+        }
+
+    @property
+    def degraded(self) -> bool:
+        """True while the circuit breaker is open and callers should use their rules-based fallbacks."""
+        return self.breaker.is_open()
+
+    def _allow(self, profile: LLMProfile) -> Optional[str]:
+        """
+        Breaker permit for a call, None while the breaker rejects it. Fast-model failures are
+        recovered by escalating to the regular model, so they don't count toward opening it.
+        """
+        if profile.fast:
+            return None if self.breaker.is_open() else FAST_PERMIT
+        return self.breaker.allow()
+
+    def _record_outcome(self, status: str, latency: float, permit: str) -> None:
+        """Feed a call's outcome to the breaker; other 4xx responses are our fault, not Claude's."""
+        if permit == FAST_PERMIT:
+            return
+        if status in ("rate_limited", "deadline"):
+            # Shed locally, or cut short by the turn's own budget: says nothing about Claude's health
+            self.breaker.release(permit)
+        elif status.isdigit() and int(status) < 500 and int(status) not in (408, 429):
+            self.breaker.record_success(latency, permit)
+        else:
+            self.breaker.record_failure(latency, permit)
+
+    @staticmethod
+    def _shareable(response_text: str) -> bool:
+        """Whether callers coalesced onto a call may take its reply; a failure is theirs to retry."""
+        return response_text != ERROR_RESPONSE
+
+    @staticmethod
+    def _failure_status(error: Exception) -> str:
+        """"deadline" when the call failed because the turn's budget ran out, else "error"."""
+        if isinstance(error, DeadlineExceeded):
+            return "deadline"
+        deadline = current_deadline()
+        # http_retry shrinks the attempt timeout to the remaining budget, so such a timeout ends at the deadline
+        if isinstance(error, (requests.Timeout, httpx.TimeoutException)) and deadline is not None and deadline.expired():
+            return "deadline"
+        return "error"
+
+    @staticmethod
+    def _queue_seconds(reservation: Optional[Reservation]) -> float:
+        return reservation.wait_seconds if reservation is not None else 0.0
+
+    def _on_throttle(self, retry_after: float) -> None:
+        if self.rate_limiter is not None:
+            self.rate_limiter.pause(retry_after)
+
+    def _reject_open(self, profile: LLMProfile) -> None:
+        logger.warning(f"Claude circuit breaker open, skipping call (site: {profile.name})")
+        metrics.increment("circuit_open", profile.name)
+
     def _setup_session(self) -> requests.Session:
-        """Setup requests session with retry logic."""
+        """Setup pooled requests session; retries are handled by http_retry so their cost can be measured."""
         session = requests.Session()
-        retries = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["POST", "GET"]
-        )
-        session.mount('https://', HTTPAdapter(max_retries=retries))
+        session.mount('https://', HTTPAdapter())
         return session
-    
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Get the pooled HTTP/2 client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                http2=CLAUDE_HTTP2,
+                limits=httpx.Limits(
+                    max_connections=CLAUDE_MAX_CONNECTIONS,
+                    max_keepalive_connections=CLAUDE_MAX_KEEPALIVE_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(60.0, connect=10.0)
+            )
+            self._async_clients[loop] = client
+            self._semaphores[loop] = asyncio.Semaphore(CLAUDE_MAX_CONCURRENCY)
+        return client
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Get the in-flight request limiter for the running event loop."""
+        self._get_async_client()
+        return self._semaphores[asyncio.get_running_loop()]
+
+    async def aclose(self) -> None:
+        """Close the pooled async client for the running event loop."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def _prepare_system(self, messages: List[Dict]) -> List[Dict]:
+        """
+        Collect system messages into native system blocks.
+
+        A system message flagged with "cache": True gets a cache_control breakpoint,
+        so its text (and every block before it) is served from Anthropic's prompt cache.
+        Static prompts should therefore come before per-turn context.
+        """
+        system_blocks = []
+        for msg in messages:
+            if msg["role"] != "system":
+                continue
+            block = {"type": "text", "text": msg["content"]}
+            if msg.get("cache"):
+                block["cache_control"] = {"type": "ephemeral"}
+            system_blocks.append(block)
+        return system_blocks
+
     def _prepare_messages(self, messages: List[Dict]) -> List[Dict]:
-        """Prepare messages for Claude API."""
-        prepared_messages = []
-        
-        for i, msg in enumerate(messages):
-            if msg["role"] == "system":
-                # Convert system messages to user messages with instructions
-                prepared_messages.append({
-                    "role": "user",
-                    "content": f"<instructions>\n{msg['content']}\n</instructions>"
-                })
-            else:
-                # Keep other messages as they are
-                prepared_messages.append(msg)
-        
+        """Prepare the conversation messages for Claude API (system prompts are sent separately)."""
         # Remove any consecutive user messages by combining them
         final_messages = []
-        for msg in prepared_messages:
-            if (final_messages and 
-                final_messages[-1]["role"] == "user" and 
+        for msg in messages:
+            if msg["role"] == "system":
+                continue
+            if (final_messages and
+                final_messages[-1]["role"] == "user" and
                 msg["role"] == "user"):
                 # Combine with previous user message
                 final_messages[-1]["content"] += f"\n\n{msg['content']}"
             else:
-                final_messages.append(msg)
-        
+                final_messages.append({"role": msg["role"], "content": msg["content"]})
+
         return final_messages
-        
-    def call_api(self, messages: List[Dict], temperature: float = 0.7) -> str:
-        """Call Claude API with messages."""
-        logger.info(f"Calling Claude API with messages (model: {self.model})")
+
+    def _headers(self) -> Dict:
+        return {
+            "x-api-key": CLAUDE_API_KEY,
+            "content-type": "application/json",
+            "anthropic-version": "2023-06-01"
+        }
+
+    def _build_request(self, messages: List[Dict], profile: LLMProfile, tool: Optional[Dict] = None) -> Dict:
+        """Build the Messages API request body; with a tool, Claude is forced to call it."""
+        data = {
+            "model": profile.model,
+            "messages": self._prepare_messages(messages),
+            "temperature": profile.temperature,
+            "max_tokens": profile.max_tokens
+        }
+        if profile.stop_sequences:
+            data["stop_sequences"] = list(profile.stop_sequences)
+        system_blocks = self._prepare_system(messages)
+        if system_blocks:
+            data["system"] = system_blocks
+        if tool is not None:
+            data["tools"] = [tool]
+            data["tool_choice"] = {"type": "tool", "name": tool["name"]}
+        return data
+
+    def _record_usage(self, usage: Dict) -> None:
+        """Log token usage for a call, including prompt cache reads and writes, and add it to the running totals."""
+        if not usage:
+            return
+        for field in self.usage_totals:
+            self.usage_totals[field] += usage.get(field) or 0
+        logger.info(
+            f"Claude API usage: input={usage.get('input_tokens', 0)}, output={usage.get('output_tokens', 0)}, "
+            f"cache_read={usage.get('cache_read_input_tokens') or 0}, cache_write={usage.get('cache_creation_input_tokens') or 0}"
+        )
+
+    def _extract_text(self, response_json: Dict, tool: Optional[Dict] = None) -> str:
+        """
+        Extract text from the first content item, or for a tool call the tool_use block
+        ({"id", "name", "input"}) as JSON so it can be cached like any other response.
+        """
+        self._record_usage(response_json.get('usage'))
+        if tool is not None:
+            for block in response_json.get('content') or []:
+                if block.get('type') == 'tool_use' and block.get('name') == tool['name']:
+                    return json.dumps({"id": block['id'], "name": block['name'], "input": block['input']})
+            logger.error(f"No {tool['name']} tool call in Claude API response")
+            return "Error: No tool call in response"
+        if response_json.get('content') and len(response_json['content']) > 0:
+            return response_json['content'][0]['text']
+        logger.error("No content in Claude API response")
+        return "Error: No content in response"
+
+    @staticmethod
+    def _is_cacheable(response_text: str, tool: Optional[Dict] = None) -> bool:
+        """Errors aren't cached, nor tool inputs that fail their schema (call_tool caches the repaired one)."""
+        if response_text == ERROR_RESPONSE or response_text.startswith("Error: "):
+            return False
+        return tool is None or not structured_output.decode(response_text, tool)[1]
+
+    def _cache_key(self, messages: List[Dict], profile: LLMProfile, tool: Optional[Dict] = None) -> str:
+        params = {"max_tokens": profile.max_tokens, "stop_sequences": profile.stop_sequences}
+        if tool is not None:
+            params["tool"] = tool
+        return LLMCache.make_key(messages, profile.model, profile.temperature, **params)
+
+    def call_api(self, messages: List[Dict], temperature: Optional[float] = None,
+                 cache: Optional[bool] = None, profile: Optional[str] = None, tool: Optional[Dict] = None,
+                 fast: bool = False) -> str:
+        """
+        Call Claude API with messages using the named call-site profile (explicit arguments override it).
+        fast sends the call to the site's cascade model, if it has one.
+        """
+        profile = get_profile(profile, temperature=temperature, cache=cache)
+        if fast and profile.fast_model:
+            profile = profile.as_fast()
+        key = self._cache_key(messages, profile, tool)
+        use_cache = profile.cache and self.cache is not None
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info(f"Claude API cache hit ({profile.name})")
+                metrics.increment("cache_hits", profile.name)
+                return cached
+
+        def fetch() -> str:
+            response_text = self._call_api(messages, profile, tool)
+            if use_cache and self._is_cacheable(response_text, tool):
+                self.cache.set(key, response_text)
+            return response_text
+
+        if self.inflight is None:
+            return fetch()
         try:
-            # Prepare messages for Claude API
-            prepared_messages = self._prepare_messages(messages)
-            
-            headers = {
-                "x-api-key": CLAUDE_API_KEY,
-                "content-type": "application/json",
-                "anthropic-version": "2023-06-01"
-            }
-            
-            data = {
-                "model": self.model,
-                "messages": prepared_messages,
-                "temperature": temperature,
-                "max_tokens": 4000
-            }
-            
-            logger.info(f"Sending request to Claude API with {len(prepared_messages)} messages")
-            
-            response = self.session.post(
+            return self.inflight.do(key, fetch, shareable=self._shareable)
+        except DeadlineExceeded as e:
+            logger.warning(f"Claude API ({profile.name}): {e}")
+            return ERROR_RESPONSE
+
+    def _call_api(self, messages: List[Dict], profile: LLMProfile, tool: Optional[Dict] = None) -> str:
+        permit = self._allow(profile)
+        if not permit:
+            self._reject_open(profile)
+            return ERROR_RESPONSE
+        logger.info(f"Calling Claude API with messages (site: {profile.name}, model: {profile.model})")
+        start = time.perf_counter()
+        retry = RetryStats()
+        status = "error"
+        usage = None
+        reservation = None
+        try:
+            data = self._build_request(messages, profile, tool)
+            if self.rate_limiter is not None:
+                reservation = self.rate_limiter.acquire(estimate_input_tokens(messages), profile.max_tokens)
+
+            logger.info(f"Sending request to Claude API with {len(data['messages'])} messages")
+
+            response = post_with_retries(
+                self.session,
                 CLAUDE_BASE_URL,
-                headers=headers,
+                stats=retry,
+                label="Claude API",
+                headers=self._headers(),
                 json=data,
-                timeout=60
+                timeout=profile.timeout,
+                on_throttle=self._on_throttle
             )
-            
+            status = str(response.status_code)
+
             logger.info(f"Claude API response status: {response.status_code}")
-            
+
             if response.status_code != 200:
                 logger.error(f"Claude API error response: {response.text}")
                 response.raise_for_status()
-            
+
             response_json = response.json()
-            # Extract text from the first content item
-            if response_json.get('content') and len(response_json['content']) > 0:
-                return response_json['content'][0]['text']
-            else:
-                logger.error("No content in Claude API response")
-                return "Error: No content in response"
-            
+            usage = response_json.get('usage')
+            return self._extract_text(response_json, tool)
+
+        except RateLimitExceeded as e:
+            logger.warning(f"Shedding Claude API call: {e}")
+            status = "rate_limited"
+            return ERROR_RESPONSE
         except Exception as e:
             logger.exception("Error in Claude API call")
-            return "I encountered an error. Please try again or contact support if the issue persists."
\ No newline at end of file
+            if status == "error":
+                status = self._failure_status(e)
+            return ERROR_RESPONSE
+        finally:
+            wall = time.perf_counter() - start
+            queued = self._queue_seconds(reservation)
+            if reservation is not None:
+                self.rate_limiter.settle(reservation, usage)
+            self._record_outcome(status, wall - queued, permit)
+            metrics.record_call(profile.name, wall, retry.retry_seconds, status, usage, queue_seconds=queued)
+
+    async def acall_api(self, messages: List[Dict], temperature: Optional[float] = None,
+                        cache: Optional[bool] = None, profile: Optional[str] = None,
+                        tool: Optional[Dict] = None, fast: bool = False) -> str:
+        """Call Claude API without blocking the event loop, using the named call-site profile."""
+        profile = get_profile(profile, temperature=temperature, cache=cache)
+        if fast and profile.fast_model:
+            profile = profile.as_fast()
+        key = self._cache_key(messages, profile, tool)
+        use_cache = profile.cache and self.cache is not None
+        if use_cache:
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                logger.info(f"Claude API cache hit ({profile.name})")
+                metrics.increment("cache_hits", profile.name)
+                return cached
+
+        async def fetch() -> str:
+            response_text = await self._acall_api(messages, profile, tool)
+            if use_cache and self._is_cacheable(response_text, tool):
+                await self.cache.aset(key, response_text)
+            return response_text
+
+        if self.inflight is None:
+            return await fetch()
+        try:
+            return await self.inflight.ado(key, fetch, shareable=self._shareable)
+        except DeadlineExceeded as e:
+            logger.warning(f"Claude API ({profile.name}): {e}")
+            return ERROR_RESPONSE
+
+    async def _acall_api(self, messages: List[Dict], profile: LLMProfile, tool: Optional[Dict] = None) -> str:
+        permit = self._allow(profile)
+        if not permit:
+            self._reject_open(profile)
+            return ERROR_RESPONSE
+        logger.info(f"Calling Claude API asynchronously (site: {profile.name}, model: {profile.model})")
+        start = time.perf_counter()
+        retry = RetryStats()
+        status = "error"
+        usage = None
+        reservation = None
+        try:
+            data = self._build_request(messages, profile, tool)
+            client = self._get_async_client()
+            if self.rate_limiter is not None:
+                reservation = await self.rate_limiter.aacquire(estimate_input_tokens(messages), profile.max_tokens)
+
+            async with self._get_semaphore():
+                logger.info(f"Sending async request to Claude API with {len(data['messages'])} messages")
+                response = await apost_with_retries(
+                    client,
+                    CLAUDE_BASE_URL,
+                    stats=retry,
+                    label="Claude API",
+                    headers=self._headers(),
+                    json=data,
+                    timeout=profile.timeout,
+                    on_throttle=self._on_throttle
+                )
+            status = str(response.status_code)
+
+            logger.info(f"Claude API response status: {response.status_code}")
+
+            if response.status_code != 200:
+                logger.error(f"Claude API error response: {response.text}")
+                response.raise_for_status()
+
+            response_json = response.json()
+            usage = response_json.get('usage')
+            return self._extract_text(response_json, tool)
+
+        except RateLimitExceeded as e:
+            logger.warning(f"Shedding Claude API call: {e}")
+            status = "rate_limited"
+            return ERROR_RESPONSE
+        except Exception as e:
+            logger.exception("Error in async Claude API call")
+            if status == "error":
+                status = self._failure_status(e)
+            return ERROR_RESPONSE
+        finally:
+            wall = time.perf_counter() - start
+            queued = self._queue_seconds(reservation)
+            if reservation is not None:
+                await self.rate_limiter.asettle(reservation, usage)
+            self._record_outcome(status, wall - queued, permit)
+            metrics.record_call(profile.name, wall, retry.retry_seconds, status, usage, queue_seconds=queued)
+
+    @staticmethod
+    def _record_cascade(site: str, escalated: bool, reason: str = "") -> None:
+        if escalated:
+            logger.info(f"Escalating {site} to the large model: {reason}")
+            metrics.increment("cascade_escalated", site)
+        else:
+            metrics.increment("cascade_fast", site)
+
+    def _fast_tool_input(self, site: str, response: str, tool: Dict) -> Optional[Dict]:
+        """The fast model's tool input if it is valid and not marked low confidence, else None (escalate)."""
+        block, errors = structured_output.decode(response, tool)
+        if block is None or errors:
+            self._record_cascade(site, True, "; ".join(errors))
+            return None
+        if block["input"].get("confidence") == "low":
+            self._record_cascade(site, True, "low confidence")
+            return None
+        self._record_cascade(site, False)
+        return block["input"]
+
+    def call_cascade(self, messages: List[Dict], accept: Callable[[str], bool], profile: Optional[str] = None) -> str:
+        """
+        Text call for a cascade site: the fast model's reply if accept() passes it, else the
+        reply of the site's regular model. Sites without a fast model call the regular model.
+        """
+        resolved = get_profile(profile)
+        if resolved.fast_model:
+            response = self.call_api(messages, profile=profile, fast=True)
+            if accept(response):
+                self._record_cascade(resolved.name, False)
+                return response
+            self._record_cascade(resolved.name, True, f"rejected reply {response[:40]!r}")
+        return self.call_api(messages, profile=profile)
+
+    def _check_tool_input(self, site: str, response: str, tool: Dict, repaired: bool):
+        """
+        The validated tool input, the repair messages to send when it is invalid and can still
+        be repaired, or neither when the call failed for good.
+        """
+        block, errors = structured_output.decode(response, tool)
+        if block is not None and not errors:
+            return block["input"], None
+        if block is not None and not repaired:
+            logger.warning(f"Invalid {tool['name']} input ({site}): {'; '.join(errors)}, asking for a repair")
+            metrics.increment("tool_repair", site)
+            return None, errors
+        if response != ERROR_RESPONSE:
+            logger.error(f"No valid {tool['name']} input ({site}): {'; '.join(errors)}")
+            metrics.increment("tool_invalid", site)
+        return None, None
+
+    def _repair_cache_key(self, messages: List[Dict], profile: Optional[str], tool: Dict) -> Optional[str]:
+        """Cache key of the regular model's answer to messages, or None when the site doesn't cache."""
+        resolved = get_profile(profile)
+        if not resolved.cache or self.cache is None:
+            return None
+        return self._cache_key(messages, resolved, tool)
+
+    def call_tool(self, messages: List[Dict], tool: Dict, profile: Optional[str] = None) -> Optional[Dict]:
+        """
+        Force Claude to call the tool and return its validated input, or None when the call failed.
+        Cascade sites try the fast model first. On the regular model, an input that fails schema
+        validation gets one repair turn with the errors.
+        """
+        resolved = get_profile(profile)
+        site = resolved.name
+        if resolved.fast_model:
+            tool_input = self._fast_tool_input(site, self.call_api(messages, profile=profile, tool=tool, fast=True), tool)
+            if tool_input is not None:
+                return tool_input
+        response = self.call_api(messages, profile=profile, tool=tool)
+        tool_input, errors = self._check_tool_input(site, response, tool, repaired=False)
+        if errors is None:
+            return tool_input
+        block = json.loads(response)
+        # The repair turn itself isn't cached; a valid repaired input is stored under the original
+        # prompt instead, so the next hit for it doesn't pay for the repair again
+        response = self.call_api(structured_output.repair_messages(messages, block, errors),
+                                 profile=profile, tool=tool, cache=False)
+        tool_input = self._check_tool_input(site, response, tool, repaired=True)[0]
+        key = self._repair_cache_key(messages, profile, tool)
+        if tool_input is not None and key is not None:
+            self.cache.set(key, response)
+        return tool_input
+
+    async def acall_tool(self, messages: List[Dict], tool: Dict, profile: Optional[str] = None) -> Optional[Dict]:
+        """Async version of call_tool."""
+        resolved = get_profile(profile)
+        site = resolved.name
+        if resolved.fast_model:
+            response = await self.acall_api(messages, profile=profile, tool=tool, fast=True)
+            tool_input = self._fast_tool_input(site, response, tool)
+            if tool_input is not None:
+                return tool_input
+        response = await self.acall_api(messages, profile=profile, tool=tool)
+        tool_input, errors = self._check_tool_input(site, response, tool, repaired=False)
+        if errors is None:
+            return tool_input
+        block = json.loads(response)
+        response = await self.acall_api(structured_output.repair_messages(messages, block, errors),
+                                        profile=profile, tool=tool, cache=False)
+        tool_input = self._check_tool_input(site, response, tool, repaired=True)[0]
+        key = self._repair_cache_key(messages, profile, tool)
+        if tool_input is not None and key is not None:
+            await self.cache.aset(key, response)
+        return tool_input
+
+    async def astream_api(self, messages: List[Dict], temperature: Optional[float] = None,
+                          profile: Optional[str] = None) -> AsyncIterator[str]:
+        """Stream Claude's reply as text deltas using the Messages API SSE format (raises when the breaker is open)."""
+        profile = get_profile(profile, temperature=temperature)
+        logger.info(f"Streaming from Claude API (site: {profile.name}, model: {profile.model})")
+        data = self._build_request(messages, profile)
+        data["stream"] = True
+        client = self._get_async_client()
+        start = time.perf_counter()
+        status = "error"
+        usage = {}
+        deadline = current_deadline()
+
+        permit = self._allow(profile)
+        if not permit:
+            self._reject_open(profile)
+            raise CircuitOpenError("Claude circuit breaker is open")
+        reservation = None
+        try:
+            if self.rate_limiter is not None:
+                try:
+                    reservation = await self.rate_limiter.aacquire(estimate_input_tokens(messages), profile.max_tokens)
+                except RateLimitExceeded:
+                    status = "rate_limited"
+                    raise
+            async with self._get_semaphore():
+                timeout = deadline.timeout(profile.timeout) if deadline else profile.timeout
+                async with client.stream("POST", CLAUDE_BASE_URL, headers=self._headers(), json=data,
+                                         timeout=timeout) as response:
+                    status = str(response.status_code)
+                    logger.info(f"Claude API stream response status: {response.status_code}")
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        logger.error(f"Claude API error response: {body.decode(errors='replace')}")
+                        response.raise_for_status()
+
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        event = json.loads(line[len("data:"):].strip())
+                        event_type = event.get("type")
+                        if event_type == "content_block_delta" and event["delta"].get("type") == "text_delta":
+                            yield event["delta"]["text"]
+                        elif event_type == "message_start":
+                            usage.update(event["message"].get("usage") or {})
+                        elif event_type == "message_delta":
+                            # Carries the final output token count
+                            usage.update(event.get("usage") or {})
+                        elif event_type == "error":
+                            status = STREAM_ERROR_STATUS.get((event.get("error") or {}).get("type"), "error")
+                            raise RuntimeError(f"Claude stream error: {event.get('error')}")
+                        elif event_type == "message_stop":
+                            break
+                    self._record_usage(usage)
+        except Exception as e:
+            # A "200" here failed mid-stream (dropped or timed out), so it isn't a success either
+            if status in ("error", "200"):
+                status = self._failure_status(e)
+            raise
+        finally:
+            wall = time.perf_counter() - start
+            queued = self._queue_seconds(reservation)
+            if reservation is not None:
+                await self.rate_limiter.asettle(reservation, usage)
+            self._record_outcome(status, wall - queued, permit)
+            metrics.record_call(profile.name, wall, 0.0, status, usage, queue_seconds=queued)
@@ -0,0 +1,252 @@
+"""
+Local stand-in for the Anthropic Messages API, for exercising ClaudeClient without network access.
+
+Also accepts Message Batches (POST /v1/messages/batches); a batch is answered as soon as it is
+created. Simulates prompt caching: the system/message prefix up to the last cache_control breakpoint is
+remembered for five minutes, and the usage block reports cache_creation_input_tokens on the first
+request and cache_read_input_tokens on repeats, the same way the real API does. Prefixes shorter
+than the minimum cacheable length are not cached, matching the API.
+
+Usage:
+    python claude_stub_server.py [port]
+    CLAUDE_BASE_URL=http://127.0.0.1:8765/v1/messages CLAUDE_API_KEY=stub python app.py
+
+Environment:
+    STUB_MIN_CACHE_TOKENS  minimum cacheable prefix in tokens (default 1024, as for Sonnet models)
+    STUB_DELAY             seconds to wait before answering (default 0)
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL_SECONDS = 300
+MIN_CACHE_TOKENS = int(os.environ.get("STUB_MIN_CACHE_TOKENS", 1024))
+DELAY_SECONDS = float(os.environ.get("STUB_DELAY", 0))
+
+_prompt_cache = {}
+_prompt_cache_lock = threading.Lock()
+_batches = {}
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+def _block_text(block) -> str:
+    if isinstance(block, str):
+        return block
+    return block.get("text", "")
+
+def _content_blocks(content):
+    return [{"type": "text", "text": content}] if isinstance(content, str) else content
+
+def split_cached_prefix(body: dict):
+    """Return (cacheable prefix text, remaining text), splitting at the last cache_control breakpoint."""
+    blocks = []
+    system = body.get("system") or []
+    for block in _content_blocks(system):
+        blocks.append(block)
+    for message in body.get("messages", []):
+        for block in _content_blocks(message["content"]):
+            blocks.append(block)
+
+    breakpoint_index = -1
+    for i, block in enumerate(blocks):
+        if isinstance(block, dict) and block.get("cache_control"):
+            breakpoint_index = i
+
+    prefix = "".join(_block_text(b) for b in blocks[:breakpoint_index + 1])
+    rest = "".join(_block_text(b) for b in blocks[breakpoint_index + 1:])
+    return prefix, rest
+
+def compute_usage(body: dict, output_text: str) -> dict:
+    """Build a usage block, simulating cache writes and reads for the cached prefix."""
+    prefix, rest = split_cached_prefix(body)
+    usage = {
+        "input_tokens": estimate_tokens(rest),
+        "output_tokens": estimate_tokens(output_text),
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": 0
+    }
+    if not prefix:
+        return usage
+
+    prefix_tokens = estimate_tokens(prefix)
+    if prefix_tokens < MIN_CACHE_TOKENS:
+        # Too short to cache; the API silently processes it as regular input
+        usage["input_tokens"] += prefix_tokens
+        return usage
+
+    key = hashlib.sha256(f"{body.get('model')}\x00{prefix}".encode("utf-8")).hexdigest()
+    now = time.time()
+    with _prompt_cache_lock:
+        if _prompt_cache.get(key, 0) > now:
+            usage["cache_read_input_tokens"] = prefix_tokens
+        else:
+            usage["cache_creation_input_tokens"] = prefix_tokens
+        # Reads refresh the TTL, like the real cache
+        _prompt_cache[key] = now + CACHE_TTL_SECONDS
+    return usage
+
+def canned_reply(body: dict) -> str:
+    """Pick a plausible reply for the prompt so the bot's parsers keep working."""
+    text = json.dumps(body)
+    if "Respond with ONLY a JSON array" in text:
+        product = re.search(r"- Product: ([^\\]+?)\\n", text)
+        name = product.group(1) if product else "this product"
+        return json.dumps([
+            f"The {name} is a great pick for your custom order at Plato's Price of {{price}}.",
+            f"You'll love the {name}, and it's just Plato's Price of {{price}}."
+        ])
+    if "hex code" in text.lower():
+        return "#000000"
+    return "Here's a great option for you! Let me know if you'd like to see other colors."
+
+def canned_tool_input(body: dict) -> dict:
+    """Valid input for the tool the request forces, so call_tool never needs a repair."""
+    name = body["tool_choice"]["name"]
+    analysis = {"category": "T-Shirt", "color": "Black", "material": None, "brand": None,
+                "price_point": None, "fit": None, "size": None}
+    if name == "record_stage":
+        return {"goal": "product_selection"}
+    if name == "record_product_analysis":
+        return analysis
+    if name == "record_intent_analysis":
+        return {"goal": "product_selection", **analysis}
+    if name == "record_intent_analyses":
+        count = len(re.findall(r"Item \d+\\n", json.dumps(body.get("messages"))))
+        return {"results": [{"item": i, "goal": "product_selection", **analysis} for i in range(1, count + 1)]}
+    if name == "record_customer_info":
+        return {"name": None, "address": None, "email": None}
+    if name == "select_product":
+        return {"reasoning": "The first option is the closest color match.", "option": 1}
+    return {}
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, data, content_type: str = "application/json") -> None:
+        payload = (data if isinstance(data, str) else json.dumps(data)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("content-type", content_type)
+        self.send_header("content-length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _message(self, body: dict) -> dict:
+        if body.get("tool_choice"):
+            tool_input = canned_tool_input(body)
+            content = [{"type": "tool_use", "id": f"toolu_stub_{int(time.time() * 1000)}",
+                        "name": body["tool_choice"]["name"], "input": tool_input}]
+            output_text = json.dumps(tool_input)
+        else:
+            output_text = canned_reply(body)
+            content = [{"type": "text", "text": output_text}]
+        return {
+            "id": f"msg_stub_{int(time.time() * 1000)}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model"),
+            "content": content,
+            "stop_reason": "tool_use" if body.get("tool_choice") else "end_turn",
+            "usage": compute_usage(body, output_text)
+        }
+
+    def _create_batch(self, body: dict) -> None:
+        batch_id = f"msgbatch_stub_{len(_batches) + 1}"
+        results = [
+            {"custom_id": request["custom_id"], "result": {"type": "succeeded", "message": self._message(request["params"])}}
+            for request in body.get("requests", [])
+        ]
+        _batches[batch_id] = results
+        self._send_json(self._batch_status(batch_id))
+
+    def _batch_status(self, batch_id: str) -> dict:
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended",
+            "request_counts": {"processing": 0, "succeeded": len(_batches[batch_id]), "errored": 0},
+            "results_url": f"http://{self.headers.get('host')}/v1/messages/batches/{batch_id}/results"
+        }
+
+    def do_GET(self):
+        match = re.match(r"^/v1/messages/batches/([\w-]+)(/results)?$", self.path)
+        if not match or match.group(1) not in _batches:
+            self.send_error(404)
+            return
+        batch_id = match.group(1)
+        if match.group(2):
+            self._send_json("\n".join(json.dumps(r) for r in _batches[batch_id]), "application/x-jsonl")
+        else:
+            self._send_json(self._batch_status(batch_id))
+
+    def do_POST(self):
+        length = int(self.headers.get("content-length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.rstrip("/").endswith("/batches"):
+            self._create_batch(body)
+            return
+        message = self._message(body)
+        usage = message["usage"]
+        logger.info(
+            f"Stub request: input={usage['input_tokens']}, cache_read={usage['cache_read_input_tokens']}, "
+            f"cache_write={usage['cache_creation_input_tokens']}"
+        )
+        if DELAY_SECONDS:
+            time.sleep(DELAY_SECONDS)
+
+        if body.get("stream"):
+            self._stream(message, message["content"][0]["text"])
+            return
+        self._send_json(message)
+
+    def _stream(self, message: dict, output_text: str) -> None:
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+
+        def send(event_type: str, data: dict) -> None:
+            chunk = f"event: {event_type}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+            self.wfile.flush()
+
+        start_usage = dict(message["usage"], output_tokens=1)
+        send("message_start", {"type": "message_start", "message": dict(message, content=[], usage=start_usage)})
+        send("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        for i in range(0, len(output_text), 8):
+            send("content_block_delta", {
+                "type": "content_block_delta",
+                "index": 0,
+                "delta": {"type": "text_delta", "text": output_text[i:i + 8]}
+            })
+        send("content_block_stop", {"type": "content_block_stop", "index": 0})
+        send("message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn"},
+            "usage": {"output_tokens": message["usage"]["output_tokens"]}
+        })
+        send("message_stop", {"type": "message_stop"})
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    logger.info(f"Claude stub server listening on http://127.0.0.1:{port}/v1/messages")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
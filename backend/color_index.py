@@ -0,0 +1,378 @@
+"""
+Precomputed color features for the catalog, so color ranking runs as NumPy array operations.
+
+Every distinct catalog color gets its hex, RGB, HSL, CIE Lab, color family and modifiers
+computed once when the catalog loads. Each category keeps an array of color rows aligned
+with its product list, and get_closest_products_by_color masks and ranks those rows
+instead of converting every candidate's color per query.
+
+Two color distances are available (COLOR_MATCH_METRIC): the hand-tuned HSL distance and
+CIEDE2000 on the Lab features, scaled by 1/100 so both are roughly 0-1. For CIEDE2000,
+nearest() answers top-k queries over a category's colors through a KD-tree once the
+category has TREE_MIN_COLORS distinct colors; below that a vectorized scan is faster.
+"""
+import heapq
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("hsl", "ciede2000")
+
+# Categories with fewer distinct colors are scanned; benchmark_color_metric.py measures the crossover
+TREE_MIN_COLORS = 1024
+
+# The KD-tree ranks by Euclidean Lab distance (CIE76); this many times k candidates are re-scored with CIEDE2000
+TREE_OVERSAMPLE = 8
+
+def hex_to_rgb(hex_colors: Sequence[str]) -> np.ndarray:
+    """(n, 3) array of RGB components in [0, 1]."""
+    values = [[int(h.lstrip('#')[i:i + 2], 16) for i in (0, 2, 4)] for h in hex_colors]
+    return np.array(values, dtype=float).reshape(-1, 3) / 255.0
+
+def rgb_to_hsl(rgb: np.ndarray) -> np.ndarray:
+    """(n, 3) array of hue in whole degrees, saturation and lightness in percent (same as hex_to_hsl)."""
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    cmax = rgb.max(axis=1)
+    cmin = rgb.min(axis=1)
+    delta = cmax - cmin
+    safe_delta = np.where(delta == 0, 1.0, delta)
+    h = np.where(cmax == r, ((g - b) / safe_delta) % 6,
+                 np.where(cmax == g, (b - r) / safe_delta + 2, (r - g) / safe_delta + 4))
+    h = np.round(np.where(delta == 0, 0.0, h) * 60)
+    h = np.where(h < 0, h + 360, h)
+    l = (cmax + cmin) / 2
+    denominator = 1 - np.abs(2 * l - 1)
+    s = np.where(delta == 0, 0.0, delta / np.where(denominator == 0, 1.0, denominator))
+    return np.stack([h, s * 100, l * 100], axis=1)
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """(n, 3) array of CIE L*a*b* (D65 white point) for sRGB colors."""
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ np.array([
+        [0.4124564, 0.2126729, 0.0193339],
+        [0.3575761, 0.7151522, 0.1191920],
+        [0.1804375, 0.0721750, 0.9503041]
+    ])
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[:, 1] - 16, 500 * (f[:, 0] - f[:, 1]), 200 * (f[:, 1] - f[:, 2])], axis=1)
+
+def hsl_distances(target: Tuple[float, float, float], hsl: np.ndarray) -> np.ndarray:
+    """Vectorized hsl_distance from one target color to each row of hsl."""
+    h1, s1, l1 = target
+    h2, s2, l2 = hsl[:, 0], hsl[:, 1], hsl[:, 2]
+    hue_gap = np.abs(h1 - h2)
+    h_diff = np.minimum(hue_gap, 360 - hue_gap) / 180.0
+    s_diff = np.abs(s1 - s2) / 100.0
+    l_diff = np.abs(l1 - l2) / 100.0
+    h_weight = 1.0 * ((s1 + s2) / 2.0 / 100.0) + 0.3
+    return np.sqrt((h_weight * h_diff) ** 2 + (0.8 * s_diff) ** 2 + (1.5 * l_diff) ** 2)
+
+def delta_e_2000(target: np.ndarray, lab: np.ndarray) -> np.ndarray:
+    """Vectorized CIEDE2000 color difference from one Lab color to each row of lab."""
+    L1, a1, b1 = target
+    L2, a2, b2 = lab[:, 0], lab[:, 1], lab[:, 2]
+    c_bar7 = ((np.hypot(a1, b1) + np.hypot(a2, b2)) / 2) ** 7
+    g = 0.5 * (1 - np.sqrt(c_bar7 / (c_bar7 + 25.0 ** 7)))
+    a1p, a2p = (1 + g) * a1, (1 + g) * a2
+    c1p, c2p = np.hypot(a1p, b1), np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+    chroma_product = c1p * c2p
+    h_gap = h2p - h1p
+    dhp = np.where(chroma_product == 0, 0.0,
+                   np.where(h_gap > 180, h_gap - 360, np.where(h_gap < -180, h_gap + 360, h_gap)))
+    dLp = L2 - L1
+    dCp = c2p - c1p
+    dHp = 2 * np.sqrt(chroma_product) * np.sin(np.radians(dhp) / 2)
+    l_bar = (L1 + L2) / 2
+    c_bar_p = (c1p + c2p) / 2
+    h_sum = h1p + h2p
+    h_bar = np.where(chroma_product == 0, h_sum,
+                     np.where(np.abs(h_gap) <= 180, h_sum / 2,
+                              np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2)))
+    t = (1 - 0.17 * np.cos(np.radians(h_bar - 30)) + 0.24 * np.cos(np.radians(2 * h_bar))
+         + 0.32 * np.cos(np.radians(3 * h_bar + 6)) - 0.20 * np.cos(np.radians(4 * h_bar - 63)))
+    d_theta = 30 * np.exp(-((h_bar - 275) / 25) ** 2)
+    c_bar_p7 = c_bar_p ** 7
+    r_c = 2 * np.sqrt(c_bar_p7 / (c_bar_p7 + 25.0 ** 7))
+    s_l = 1 + 0.015 * (l_bar - 50) ** 2 / np.sqrt(20 + (l_bar - 50) ** 2)
+    s_c = 1 + 0.045 * c_bar_p
+    s_h = 1 + 0.015 * c_bar_p * t
+    r_t = -np.sin(np.radians(2 * d_theta)) * r_c
+    return np.sqrt((dLp / s_l) ** 2 + (dCp / s_c) ** 2 + (dHp / s_h) ** 2 + r_t * (dCp / s_c) * (dHp / s_h))
+
+class LabTree:
+    """
+    KD-tree over Lab points for k-nearest-neighbor queries by Euclidean distance.
+
+    Nodes are kept in flat lists; each leaf holds up to leaf_size points, which a query
+    scans in one vectorized step.
+    """
+
+    def __init__(self, points: np.ndarray, ids: np.ndarray, leaf_size: int = 16):
+        self.points = points
+        self.ids = ids
+        self.leaf_size = leaf_size
+        # Per node: split dimension (-1 for a leaf), split value, left child, right child, leaf point indices
+        self.dims: List[int] = []
+        self.splits: List[float] = []
+        self.children: List[Tuple[int, int]] = []
+        self.leaves: List[Optional[np.ndarray]] = []
+        self._build(np.arange(len(points)))
+
+    def _build(self, indices: np.ndarray) -> int:
+        node = len(self.dims)
+        self.dims.append(-1)
+        self.splits.append(0.0)
+        self.children.append((-1, -1))
+        self.leaves.append(None)
+        if len(indices) <= self.leaf_size:
+            self.leaves[node] = indices
+            return node
+        subset = self.points[indices]
+        dim = int(np.argmax(subset.max(axis=0) - subset.min(axis=0)))
+        indices = indices[np.argsort(subset[:, dim], kind="stable")]
+        middle = len(indices) // 2
+        self.dims[node] = dim
+        self.splits[node] = float(self.points[indices[middle], dim])
+        left = self._build(indices[:middle])
+        right = self._build(indices[middle:])
+        self.children[node] = (left, right)
+        return node
+
+    def query(self, point: np.ndarray, k: int) -> np.ndarray:
+        """ids of the k points nearest to point, nearest first."""
+        k = min(k, len(self.points))
+        best: List[Tuple[float, int]] = []  # max-heap of (-distance, point index)
+        # (node, distance from the point to the node's side of its parent split)
+        stack = [(0, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if len(best) == k and bound >= -best[0][0]:
+                continue
+            leaf = self.leaves[node]
+            if leaf is not None:
+                distances = np.sqrt(((self.points[leaf] - point) ** 2).sum(axis=1))
+                for distance, index in zip(distances.tolist(), leaf.tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, index))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, index))
+                continue
+            gap = point[self.dims[node]] - self.splits[node]
+            left, right = self.children[node]
+            near, far = (left, right) if gap < 0 else (right, left)
+            # Near side is popped first; the far side is skipped if the k best are all closer than the split
+            stack.append((far, max(bound, abs(gap))))
+            stack.append((near, bound))
+        return self.ids[[index for _, index in sorted(best, key=lambda x: -x[0])]]
+
+# Used for a color name hex_of can't resolve (ProductDecisionTree.get_color_hex's default, red)
+FALLBACK_HEX = "#FF0000"
+
+class ColorIndex:
+    """
+    Color features for every distinct catalog color, one row per color.
+
+    hex_of resolves a color name to a hex code (ProductDecisionTree.get_color_hex), or
+    None when it can't right now (e.g. Claude is down); FALLBACK_HEX stands in then.
+    family_of and modifiers_of classify a hex code. Resolved query colors are memoized,
+    since the same few colors are asked for repeatedly; fallbacks aren't, so the name is
+    resolved again next time.
+    """
+
+    def __init__(self, colors: Sequence[str], hex_of: Callable[[str], Optional[str]],
+                 family_of: Callable[[str], str], modifiers_of: Callable[[str, str], List[str]],
+                 features: Optional[Dict] = None):
+        """features: precomputed hex, rgb, hsl, lab, family and modifiers of colors (see CatalogStore)."""
+        self.hex_of = hex_of
+        self.family_of = family_of
+        self.modifiers_of = modifiers_of
+        self.names: List[str] = list(colors)
+        self.rows: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+        self.lower: List[str] = [name.lower() for name in self.names]
+        self.terms: List[List[str]] = [name.split() for name in self.lower]
+        if features is not None:
+            self.hex: List[str] = list(features["hex"])
+            self.rgb, self.hsl, self.lab = features["rgb"], features["hsl"], features["lab"]
+            self.family = np.asarray(features["family"])
+            self.modifiers: List[List[str]] = list(features["modifiers"])
+        else:
+            self.hex = [hex_of(name) or FALLBACK_HEX for name in self.names]
+            self.rgb = hex_to_rgb(self.hex)
+            self.hsl = rgb_to_hsl(self.rgb)
+            self.lab = rgb_to_lab(self.rgb)
+            self.family = np.array([family_of(h) for h in self.hex])
+            self.modifiers = [modifiers_of(h, f) for h, f in zip(self.hex, self.family)]
+        self.category_rows: Dict[str, np.ndarray] = {}
+        # Distinct color rows of each category and, for large ones, a KD-tree over their Lab features
+        self.category_colors: Dict[str, np.ndarray] = {}
+        # Positions in the category's product list of each color row
+        self.category_products: Dict[str, Dict[int, List[int]]] = {}
+        self.category_trees: Dict[str, LabTree] = {}
+        self._targets: Dict[str, Tuple[Tuple[float, float, float], np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, products_by_category: Dict[str, List[Dict]], hex_of: Callable[[str], Optional[str]],
+              family_of: Callable[[str], str], modifiers_of: Callable[[str, str], List[str]]) -> "ColorIndex":
+        colors = sorted({p['color'] for products in products_by_category.values() for p in products})
+        index = cls(colors, hex_of, family_of, modifiers_of)
+        index.set_category_rows({
+            category: np.array([index.rows[p['color']] for p in products], dtype=np.intp)
+            for category, products in products_by_category.items()
+        })
+        logger.info(f"Built color index: {len(colors)} colors across {len(products_by_category)} categories")
+        return index
+
+    def set_category_rows(self, category_rows: Dict[str, np.ndarray]) -> None:
+        """Index each category's color rows, aligned with its product list."""
+        for category, rows in category_rows.items():
+            self.category_rows[category] = rows
+            self.category_colors[category] = np.unique(rows)
+            by_color = self.category_products.setdefault(category, {})
+            for position, row in enumerate(rows.tolist()):
+                by_color.setdefault(row, []).append(position)
+            if len(self.category_colors[category]) >= TREE_MIN_COLORS:
+                self.category_trees[category] = LabTree(self.lab[self.category_colors[category]], self.category_colors[category])
+
+    def rows_for(self, products: Sequence[Dict]) -> np.ndarray:
+        """Color rows of the products; colors outside the catalog are added on first sight."""
+        missing = {p['color'] for p in products if p['color'] not in self.rows}
+        if missing:
+            self._add_colors(sorted(missing))
+        return np.array([self.rows[p['color']] for p in products], dtype=np.intp)
+
+    def _add_colors(self, colors: List[str]) -> None:
+        with self._lock:
+            colors = [c for c in colors if c not in self.rows]
+            if not colors:
+                return
+            hexes = [self.hex_of(c) or FALLBACK_HEX for c in colors]
+            rgb = hex_to_rgb(hexes)
+            families = [self.family_of(h) for h in hexes]
+            self.hex.extend(hexes)
+            self.lower.extend(c.lower() for c in colors)
+            self.terms.extend(c.lower().split() for c in colors)
+            self.modifiers.extend(self.modifiers_of(h, f) for h, f in zip(hexes, families))
+            self.rgb = np.vstack([self.rgb, rgb])
+            self.hsl = np.vstack([self.hsl, rgb_to_hsl(rgb)])
+            self.lab = np.vstack([self.lab, rgb_to_lab(rgb)])
+            self.family = np.concatenate([self.family, np.array(families)])
+            # Rows are published last, so readers never see a row without its features
+            for color in colors:
+                self.names.append(color)
+                self.rows[color] = len(self.names) - 1
+
+    def _target(self, color_query: str) -> Tuple[Tuple[float, float, float], np.ndarray]:
+        """HSL and Lab of a requested color name, resolved once per distinct name."""
+        key = color_query.lower().strip()
+        target = self._targets.get(key)
+        if target is None:
+            hex_code = self.hex_of(color_query)
+            rgb = hex_to_rgb([hex_code or FALLBACK_HEX])
+            target = (tuple(rgb_to_hsl(rgb)[0]), rgb_to_lab(rgb)[0])
+            if hex_code:
+                # Bounded, since query colors are free text
+                if len(self._targets) >= 512:
+                    self._targets.clear()
+                self._targets[key] = target
+        return target
+
+    def target_hsl(self, color_query: str) -> Tuple[float, float, float]:
+        return self._target(color_query)[0]
+
+    def target_lab(self, color_query: str) -> np.ndarray:
+        return self._target(color_query)[1]
+
+    def distances(self, color_query: str, rows: np.ndarray, metric: str = "hsl") -> np.ndarray:
+        """Distance from the requested color to each color row: hsl_distance, or CIEDE2000 / 100."""
+        if metric == "ciede2000":
+            return delta_e_2000(self.target_lab(color_query), self.lab[rows]) / 100.0
+        return hsl_distances(self.target_hsl(color_query), self.hsl[rows])
+
+    def nearest(self, category: str, color_query: str, k: int, exclude: Sequence[int] = (),
+                family: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The k color rows of the category nearest to the requested color by CIEDE2000, nearest
+        first, with their distances (/ 100). Rows in exclude and, given a family, rows of other
+        color families are skipped. Large categories are searched through their KD-tree, which
+        pre-selects candidates by CIE76 distance; the scan covers any the tree's pick runs short of.
+        """
+        target = self.target_lab(color_query)
+
+        def eligible(rows: np.ndarray) -> np.ndarray:
+            if len(exclude):
+                rows = rows[~np.isin(rows, exclude)]
+            if family is not None:
+                rows = rows[self.family[rows] == family]
+            return rows
+
+        candidates = eligible(self.category_colors[category])
+        tree = self.category_trees.get(category)
+        if tree is not None:
+            picked = eligible(tree.query(target, (k + len(exclude)) * TREE_OVERSAMPLE))
+            if len(picked) >= min(k, len(candidates)):
+                candidates = picked
+        distances = delta_e_2000(target, self.lab[candidates]) / 100.0
+        order = np.argsort(distances, kind="stable")[:k]
+        return candidates[order], distances[order]
+
+class SemanticColorIndex:
+    """
+    SEMANTIC_COLOR_MAP inverted for step 2 of get_closest_products_by_color.
+
+    Terms and their colors are lowercased once. A query's direct match is a dictionary lookup
+    of its term; partial matches come from set lookups on whole-word tokens instead of scanning
+    every term, product and color per query.
+    """
+
+    def __init__(self, semantic_map: Dict[str, List[str]]):
+        # term -> lowercased color names, and the words in those names
+        self.colors: Dict[str, frozenset] = {}
+        self.color_words: Dict[str, frozenset] = {}
+        # word -> terms that have it as a word, for queries that are one word of a longer term
+        self.terms_by_word: Dict[str, set] = {}
+        for term, color_list in semantic_map.items():
+            term = term.lower()
+            colors = {color.lower() for color in color_list}
+            self.colors[term] = frozenset(colors)
+            self.color_words[term] = frozenset(word for color in colors for word in color.split())
+            for word in term.split():
+                self.terms_by_word.setdefault(word, set()).add(term)
+
+    def direct_colors(self, query: str) -> frozenset:
+        """Colors listed under the term that is exactly the query."""
+        return self.colors.get(query, frozenset())
+
+    def partial_terms(self, query: str) -> set:
+        """Terms that are the query, a word of the query, or that have the query as one of their words."""
+        terms = {word for word in query.split() if word in self.colors}
+        if query in self.colors:
+            terms.add(query)
+        terms.update(self.terms_by_word.get(query, ()))
+        return terms
+
+    def partial_matches(self, query: str, products: Sequence[Dict]) -> List[Dict]:
+        """
+        Products whose color is, contains as a word, or is a word of a color listed under any
+        partial_terms of the query; each (product name, color) once.
+        """
+        terms = self.partial_terms(query)
+        if not terms:
+            return []
+        colors = frozenset().union(*(self.colors[term] for term in terms))
+        color_words = frozenset().union(*(self.color_words[term] for term in terms))
+        matches, seen = [], set()
+        for product in products:
+            color = product['color'].lower()
+            if color in colors or color in color_words or not colors.isdisjoint(color.split()):
+                key = (product.get('product_name'), product.get('color'))
+                if key not in seen:
+                    seen.add(key)
+                    matches.append(product)
+        return matches
@@ -14,6 +14,104 @@ CLAUDE_API_KEY = os.environ.get("CLAUDE_API_KEY", "")
 CLAUDE_BASE_URL = os.environ.get("CLAUDE_BASE_URL", "https://api.anthropic.com/v1/messages")
 CLAUDE_MODEL = os.environ.get("CLAUDE_MODEL", "claude-3-7-sonnet-20250219")
 
+# Per-call-site model overrides, e.g. CLAUDE_MODEL_INTENT; unset sites use CLAUDE_MODEL
+CLAUDE_SITE_MODELS = {
+    site: os.environ.get(f"CLAUDE_MODEL_{site.upper()}")
+    for site in ("intent", "intent_analysis", "intent_analysis_batch", "analysis", "extraction", "product_pitch", "pitch_copy", "rerank", "hex", "completion", "reply")
+}
+
+# Model cascade: these sites try the small model first and escalate to their regular model
+# only when its answer fails validation or is marked low confidence. Empty CLAUDE_FAST_MODEL disables it.
+CLAUDE_FAST_MODEL = os.environ.get("CLAUDE_FAST_MODEL", "claude-3-5-haiku-20241022")
+CLAUDE_CASCADE_SITES = {
+    site.strip() for site in os.environ.get("CLAUDE_CASCADE_SITES", "intent,intent_analysis,analysis,extraction,hex").split(",") if site.strip()
+}
+
+# Async Claude client settings
+CLAUDE_MAX_CONNECTIONS = int(os.environ.get("CLAUDE_MAX_CONNECTIONS", 100))
+CLAUDE_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("CLAUDE_MAX_KEEPALIVE_CONNECTIONS", 20))
+CLAUDE_MAX_CONCURRENCY = int(os.environ.get("CLAUDE_MAX_CONCURRENCY", 50))
+CLAUDE_HTTP2 = os.environ.get("CLAUDE_HTTP2", "true").lower() == "true"
+ASYNC_BLOCKING_WORKERS = int(os.environ.get("ASYNC_BLOCKING_WORKERS", 32))
+
+# LLM response cache (opt-in per call site); set LLM_CACHE_PATH to share entries across workers
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 2048))
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", 3600))
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "")
+
+# Time budget for one chat turn across every outbound call (Claude, Sonar, S&S)
+CHAT_TURN_BUDGET_SECONDS = float(os.environ.get("CHAT_TURN_BUDGET_SECONDS", 25))
+
+# Share one upstream call between concurrent identical LLM requests
+SINGLE_FLIGHT_ENABLED = os.environ.get("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# Claude circuit breaker: while open, the bot runs in degraded (rules-based) mode
+CLAUDE_BREAKER_WINDOW = int(os.environ.get("CLAUDE_BREAKER_WINDOW", 20))
+CLAUDE_BREAKER_MIN_CALLS = int(os.environ.get("CLAUDE_BREAKER_MIN_CALLS", 5))
+CLAUDE_BREAKER_ERROR_RATE = float(os.environ.get("CLAUDE_BREAKER_ERROR_RATE", 0.5))
+CLAUDE_BREAKER_LATENCY_SECONDS = float(os.environ.get("CLAUDE_BREAKER_LATENCY_SECONDS", 20))
+CLAUDE_BREAKER_LATENCY_PERCENTILE = float(os.environ.get("CLAUDE_BREAKER_LATENCY_PERCENTILE", 0.95))
+CLAUDE_BREAKER_OPEN_SECONDS = float(os.environ.get("CLAUDE_BREAKER_OPEN_SECONDS", 30))
+
+# Client-side Anthropic rate limits (set to the account's tier; 0 = unlimited). Requests that
+# would queue longer than the max wait are shed. Set CLAUDE_RATE_LIMIT_PATH to share limits across workers.
+CLAUDE_RATE_LIMIT_ENABLED = os.environ.get("CLAUDE_RATE_LIMIT_ENABLED", "true").lower() == "true"
+CLAUDE_RPM_LIMIT = int(os.environ.get("CLAUDE_RPM_LIMIT", 50))
+CLAUDE_INPUT_TPM_LIMIT = int(os.environ.get("CLAUDE_INPUT_TPM_LIMIT", 20000))
+CLAUDE_OUTPUT_TPM_LIMIT = int(os.environ.get("CLAUDE_OUTPUT_TPM_LIMIT", 8000))
+CLAUDE_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.environ.get("CLAUDE_RATE_LIMIT_MAX_WAIT_SECONDS", 10))
+CLAUDE_RATE_LIMIT_PATH = os.environ.get("CLAUDE_RATE_LIMIT_PATH", "")
+
+# Local intent classifier; Claude is only asked when its confidence is below the threshold,
+# which benchmark_intent.py suggests from the held-out messages in data/intent_heldout.jsonl
+INTENT_CLASSIFIER_ENABLED = os.environ.get("INTENT_CLASSIFIER_ENABLED", "true").lower() == "true"
+INTENT_CLASSIFIER_THRESHOLD = float(os.environ.get("INTENT_CLASSIFIER_THRESHOLD", 0.95))
+INTENT_MODEL_PATH = os.environ.get("INTENT_MODEL_PATH", "data/intent_model.json")
+INTENT_EXAMPLES_PATH = os.environ.get("INTENT_EXAMPLES_PATH", "data/intent_examples.jsonl")
+
+# Follow-ups to a product card (colors, cheaper, pricier) are precomputed while the user reads it
+SPECULATION_ENABLED = os.environ.get("SPECULATION_ENABLED", "true").lower() == "true"
+SPECULATION_TTL_SECONDS = float(os.environ.get("SPECULATION_TTL_SECONDS", 300))
+
+# At peak load, concurrent turns' intent + analysis calls are sent as one multi-item call. A turn
+# waits at most INTENT_BATCH_MAX_WAIT_MS for others, and batching starts only once
+# INTENT_BATCH_MIN_CONCURRENT turns are classifying at the same time.
+INTENT_BATCH_ENABLED = os.environ.get("INTENT_BATCH_ENABLED", "false").lower() == "true"
+INTENT_BATCH_MAX_ITEMS = int(os.environ.get("INTENT_BATCH_MAX_ITEMS", 8))
+INTENT_BATCH_MAX_WAIT_MS = float(os.environ.get("INTENT_BATCH_MAX_WAIT_MS", 25))
+INTENT_BATCH_MIN_CONCURRENT = int(os.environ.get("INTENT_BATCH_MIN_CONCURRENT", 3))
+
+# Claude reranks product candidates only when the local ranking's confidence (the match-score
+# margin to the runner-up, 0-1) is below the threshold; benchmark_rerank.py reports the trade-off
+RERANK_GATE_ENABLED = os.environ.get("RERANK_GATE_ENABLED", "true").lower() == "true"
+RERANK_CONFIDENCE_THRESHOLD = float(os.environ.get("RERANK_CONFIDENCE_THRESHOLD", 0.1))
+
+# Color distance for ranking products by color: "hsl" (hand-tuned HSL distance) or "ciede2000"
+# (CIE Lab, with nearest-neighbor search); benchmark_color_metric.py compares the two
+COLOR_MATCH_METRIC = os.environ.get("COLOR_MATCH_METRIC", "hsl").lower()
+
+# Call sites answered from response_templates instead of Claude (product_pitch, completion, incomplete_info)
+TEMPLATED_REPLY_SITES = {
+    site.strip() for site in os.environ.get("TEMPLATED_REPLY_SITES", "completion,incomplete_info").split(",") if site.strip()
+}
+
+# Pitch copy pre-generated for every catalog product by generate_pitch_copy.py; Claude writes it live only when missing
+PITCH_COPY_ENABLED = os.environ.get("PITCH_COPY_ENABLED", "true").lower() == "true"
+PITCH_COPY_PATH = os.environ.get("PITCH_COPY_PATH", "data/pitch_copy.json")
+
+# Product catalog file; image paths in it are checked against CATALOG_IMAGES_DIR on load. Each
+# worker reloads the file when it changes (checked every CATALOG_WATCH_SECONDS, 0 disables), and
+# POST /admin/catalog/reload with an X-Admin-Token header reloads it right away (disabled without ADMIN_TOKEN)
+CATALOG_PATH = os.environ.get("CATALOG_PATH", "data/catalog.json")
+CATALOG_IMAGES_DIR = os.environ.get("CATALOG_IMAGES_DIR", "productimages")
+CATALOG_WATCH_SECONDS = float(os.environ.get("CATALOG_WATCH_SECONDS", 30))
+# Columnar build of the catalog that every worker memory-maps (see catalog_store.py); compiled
+# on startup when missing or stale. Empty skips the store: each worker validates the file and
+# builds its color index in memory
+CATALOG_STORE_PATH = os.environ.get("CATALOG_STORE_PATH", "data/catalog.store")
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
 # PayPal Configuration
 PAYPAL_CLIENT_ID = "Aa2-mzkmjWQCgXq3zONHNu1eFWPABooevh0Hjp_z7PMBjZOJ0xdCIAIgE4eK8MJ4TcowsMROEefprlvm"
 PAYPAL_CLIENT_SECRET = os.getenv('PAYPAL_CLIENT_SECRET')
@@ -1,3 +1,4 @@
+import copy
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 import logging
@@ -14,8 +15,12 @@ class ConversationManager:
         self.max_history = max_history
         self.timeout_minutes = timeout_minutes
 
-    def add_message(self, user_id: str, role: str, content: str, goal: Optional[str] = None) -> None:
-        """Add a message to the user's conversation history with Firestore persistence."""
+    def add_message(self, user_id: str, role: str, content: str, goal: Optional[str] = None,
+                    order_dict: Optional[Dict] = None) -> None:
+        """
+        Add a message to the user's conversation history with Firestore persistence.
+        order_dict is the order state to save with it, serialized by the caller (see update_order_state).
+        """
         if user_id not in self.conversations:
             self._initialize_conversation(user_id)
         
@@ -34,7 +39,7 @@ class ConversationManager:
             self.conversations[user_id]['messages'] = self.conversations[user_id]['messages'][-self.max_history:]
         
         # Persist to Firestore using centralized method
-        self._save_to_firestore(user_id)
+        self._save_to_firestore(user_id, order_dict)
 
     def get_messages_for_goal_context(self, user_id: str, current_goal: str) -> List[Dict]:
         """Get relevant conversation history based on the current goal."""
@@ -101,8 +106,11 @@ class ConversationManager:
         self._initialize_conversation(user_id)
         return self.conversations[user_id]['order_state']
 
-    def update_order_state(self, user_id: str, order_state: OrderState) -> None:
-        """Update the entire OrderState object with Firestore persistence."""
+    def update_order_state(self, user_id: str, order_state: OrderState, order_dict: Optional[Dict] = None) -> None:
+        """
+        Update the entire OrderState object with Firestore persistence. order_dict is order_state
+        serialized by the caller, for callers that keep changing order_state while this runs in a thread.
+        """
         # Track critical state changes for logging
         if user_id in self.conversations:
             old_state = self.conversations[user_id]['order_state']
@@ -132,7 +140,7 @@ class ConversationManager:
         self.conversations[user_id]['last_active'] = datetime.now()
         
         # Save to Firestore using centralized method
-        self._save_to_firestore(user_id)
+        self._save_to_firestore(user_id, order_dict)
         
         logger.info(f"Updated order state for user {user_id}")
 
@@ -209,8 +217,20 @@ class ConversationManager:
             logger.info(f"Resetting conversation for user {user_id} due to timeout")
             self._initialize_conversation(user_id)
 
-    def _save_to_firestore(self, user_id: str) -> None:
-        """Centralized method to save conversation state to Firestore."""
+    def order_state_snapshot(self, user_id: str, order_state: Optional[OrderState] = None) -> Optional[Dict]:
+        """
+        order_state (by default the conversation's, None if it isn't loaded) as a dict sharing
+        no lists or dicts with it, so it can be saved from another thread while it keeps changing.
+        """
+        if order_state is None:
+            conversation = self.conversations.get(user_id)
+            if conversation is None:
+                return None
+            order_state = conversation['order_state']
+        return copy.deepcopy(order_state.to_dict())
+
+    def _save_to_firestore(self, user_id: str, order_dict: Optional[Dict] = None) -> None:
+        """Centralized method to save conversation state to Firestore (order_dict: the order state, already serialized)."""
         if not self.firebase_service:
             return
             
@@ -224,7 +244,8 @@ class ConversationManager:
             trimmed_messages = messages[-self.max_history:] if len(messages) > self.max_history else messages
             
             # Convert OrderState to dict using the single standardized method
-            order_dict = order_state.to_dict()
+            if order_dict is None:
+                order_dict = order_state.to_dict()
             
             # Log key data points for debugging
             logger.debug(f"Saving order state to Firestore with quantities_collected={order_state.quantities_collected}")
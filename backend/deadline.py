@@ -0,0 +1,51 @@
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+class DeadlineExceeded(Exception):
+    """Raised when an outbound call is attempted after the turn's budget is spent."""
+
+class Deadline:
+    """Time budget for one chat turn, shared by every outbound call made while handling it."""
+
+    def __init__(self, seconds: float):
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """Timeout for the next attempt: the remaining budget, capped at the caller's own limit."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Deadline of {self.budget:.1f}s exceeded")
+        return remaining if cap is None else min(cap, remaining)
+
+    def __repr__(self) -> str:
+        return f"Deadline(budget={self.budget:.1f}s, remaining={self.remaining():.2f}s)"
+
+# Propagates through awaits and into asyncio.to_thread workers, which copy the context
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("deadline", default=None)
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Make deadline the current one for the enclosed code (a None deadline leaves the current one in place)."""
+    if deadline is None:
+        yield current_deadline()
+        return
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
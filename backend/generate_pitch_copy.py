@@ -0,0 +1,141 @@
+"""
+Offline job that pre-generates product pitch copy for every catalog product.
+
+Builds one request per (style, color, category) in ProductDecisionTree's catalog and sends
+them through the Message Batches API (half the price of live calls, no rate-limit pressure
+on the chat traffic). With --local the requests go through the regular Messages API instead,
+via ClaudeClient. The pitches are written, with a price placeholder, to a versioned JSON file
+that PlatoBot loads at startup.
+
+    python generate_pitch_copy.py [--variants 3] [--local] [--only-missing] [--output data/pitch_copy.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+from config import CLAUDE_BASE_URL, PITCH_COPY_PATH
+from claude_client import ClaudeClient, ERROR_RESPONSE
+from llm_profiles import get_profile
+from pitch_copy import FORMAT_VERSION, parse_variants, product_key
+from product_decision_tree import ProductDecisionTree
+import prompts
+
+logger = logging.getLogger(__name__)
+
+def catalog_products() -> List[Tuple[str, Dict, str]]:
+    """(key, product, category label) for every product in the catalog."""
+    tree = ProductDecisionTree()
+    products = []
+    for internal, category in tree.categories.items():
+        for product in category.products:
+            key = product_key(product["style_number"], product["color"], internal)
+            products.append((key, product, category.name))
+    return products
+
+def run_batch(client: ClaudeClient, requests_by_id: Dict[str, List[Dict]], poll_seconds: float) -> Dict[str, str]:
+    """Submit the requests as one message batch, wait for it to end and return the text per custom_id."""
+    profile = get_profile("pitch_copy")
+    batches_url = f"{CLAUDE_BASE_URL.rstrip('/')}/batches"
+    body = {"requests": [
+        {"custom_id": custom_id, "params": client._build_request(messages, profile)}
+        for custom_id, messages in requests_by_id.items()
+    ]}
+    response = client.session.post(batches_url, headers=client._headers(), json=body, timeout=60)
+    response.raise_for_status()
+    batch = response.json()
+    logger.info(f"Submitted batch {batch['id']} with {len(requests_by_id)} requests")
+
+    while batch.get("processing_status") != "ended":
+        time.sleep(poll_seconds)
+        response = client.session.get(f"{batches_url}/{batch['id']}", headers=client._headers(), timeout=30)
+        response.raise_for_status()
+        batch = response.json()
+        logger.info(f"Batch {batch['id']}: {batch.get('processing_status')} {batch.get('request_counts')}")
+
+    response = client.session.get(batch["results_url"], headers=client._headers(), timeout=120)
+    response.raise_for_status()
+    texts = {}
+    for line in response.text.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        if result["result"]["type"] == "succeeded":
+            texts[result["custom_id"]] = client._extract_text(result["result"]["message"])
+        else:
+            logger.warning(f"Batch request {result['custom_id']} {result['result']['type']}")
+    return texts
+
+def run_local(client: ClaudeClient, requests_by_id: Dict[str, List[Dict]]) -> Dict[str, str]:
+    """Send the requests through the regular Messages API, as many at once as the client allows."""
+    if client.rate_limiter is not None:
+        # Offline, so queue for as long as the rate limits need instead of shedding requests
+        client.rate_limiter.max_wait_seconds = float("inf")
+
+    async def generate():
+        ids = list(requests_by_id)
+        responses = await asyncio.gather(*(client.acall_api(requests_by_id[i], profile="pitch_copy") for i in ids))
+        await client.aclose()
+        return {i: r for i, r in zip(ids, responses) if r != ERROR_RESPONSE}
+
+    return asyncio.run(generate())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=PITCH_COPY_PATH)
+    parser.add_argument("--variants", type=int, default=3)
+    parser.add_argument("--local", action="store_true", help="use the Messages API instead of the Batches API")
+    parser.add_argument("--only-missing", action="store_true", help="keep existing pitches and generate the rest")
+    parser.add_argument("--limit", type=int, default=0, help="generate at most this many products")
+    parser.add_argument("--poll-seconds", type=float, default=30.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    previous = {}
+    if os.path.exists(args.output):
+        with open(args.output, encoding="utf-8") as f:
+            previous = json.load(f)
+    entries = dict(previous.get("entries", {})) if args.only_missing else {}
+
+    products = [(key, product, label) for key, product, label in catalog_products() if key not in entries]
+    if args.limit:
+        products = products[:args.limit]
+    if not products:
+        print(f"Nothing to generate, {args.output} covers the catalog")
+        return
+
+    # custom_id must be short and alphanumeric, so requests are numbered and mapped back
+    requests_by_id = {f"p{i}": prompts.get_pitch_copy_messages(product, label, args.variants)
+                      for i, (_, product, label) in enumerate(products)}
+    client = ClaudeClient()
+    start = time.monotonic()
+    texts = run_local(client, requests_by_id) if args.local else run_batch(client, requests_by_id, args.poll_seconds)
+
+    failed = 0
+    for i, (key, product, _) in enumerate(products):
+        variants = parse_variants(texts.get(f"p{i}", ""), product)
+        if variants:
+            entries[key] = variants
+        else:
+            failed += 1
+            logger.warning(f"No usable pitches for {key}")
+
+    data = {
+        "format": FORMAT_VERSION,
+        "version": previous.get("version", 0) + 1,
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "model": get_profile("pitch_copy").model,
+        "entries": dict(sorted(entries.items()))
+    }
+    tmp_path = f"{args.output}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, args.output)
+    print(f"Wrote pitch copy v{data['version']} for {len(entries)} products to {args.output} "
+          f"({len(products) - failed} generated, {failed} failed) in {time.monotonic() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 from typing import Dict, List
 import logging
+from deadline import current_deadline
+from structured_output import INTENT_TOOL
 
 logger = logging.getLogger(__name__)
 
@@ -14,28 +16,36 @@ class GoalIdentifier:
         Identifies the conversation goal using Sonar's intelligence,
         while respecting order state constraints.
         """
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired():
+            logger.warning("Turn deadline exhausted, using keyword goal matching")
+            return self._keyword_fallback(message, order_state)
+        if getattr(self.ai_client, "degraded", False):
+            logger.warning("AI client degraded, using keyword goal matching")
+            return self._keyword_fallback(message, order_state)
+
         try:
             # Create intent analysis prompt
             intent_prompt = [
                 {"role": "system", "content": """
-                Analyze this print shop customer message and determine which ordering stage it relates to.
-                Output EXACTLY ONE of these stages (nothing else):
+                Analyze this print shop customer message and determine which ordering stage it relates to:
                 - product_selection: Customer is exploring products, asking about options, or mentioning specific items
                 - design_placement: Customer is discussing logo placement, design details, or artwork location
                 - quantity_collection: Customer is discussing quantities, sizes, or numbers needed
                 - customer_information: Customer is providing or asking about order details, shipping, or payment
                 
                 Consider the full context and meaning of the message, not just specific words.
-                Output only the stage name, nothing else.
+                Record the stage with the record_stage tool.
                 """},
                 {"role": "user", "content": message}
             ]
 
-            # Get intent from Sonar
-            identified_goal = self.ai_client.call_api(
-                intent_prompt, 
-                temperature=0.3  # Lower temperature for more consistent results
-            ).strip().lower()
+            # Get intent from Sonar; the tool schema limits it to the four stage names
+            result = self.ai_client.call_tool(intent_prompt, INTENT_TOOL, profile="intent")
+            if result is None:
+                logger.warning("No stage from AI client, using keyword goal matching")
+                return self._keyword_fallback(message, order_state)
+            identified_goal = result["goal"]
 
             # Validate against order state constraints
             validated_goal = self._validate_goal_with_order_state(
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Collection, Optional
+import httpx
+import requests
+from deadline import Deadline, current_deadline
+
+logger = logging.getLogger(__name__)
+
+# Same policy the urllib3 Retry sessions used: 3 retries, backoff factor 1, no sleep before the first retry
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 1
+
+@dataclass
+class RetryStats:
+    """How many attempts a request took and how long was spent after the first one failed."""
+    attempts: int = 0
+    retry_seconds: float = 0.0
+
+def _backoff(attempt: int, backoff_factor: float) -> float:
+    return backoff_factor * (2 ** attempt) if attempt > 0 else 0.0
+
+def _attempt_timeout(timeout: Optional[float], deadline: Optional[Deadline]) -> Optional[float]:
+    """Per-attempt timeout, shrunk to the remaining deadline (raises DeadlineExceeded when none is left)."""
+    if deadline is None:
+        return timeout
+    return deadline.timeout(timeout)
+
+def _retry_after(response) -> Optional[float]:
+    """Seconds from a 429's retry-after header, if it sent one."""
+    if response.status_code != 429:
+        return None
+    try:
+        return float(response.headers.get("retry-after", ""))
+    except ValueError:
+        return None
+
+def _can_retry(attempt: int, max_retries: int, backoff: float, deadline: Optional[Deadline], label: str) -> bool:
+    if attempt >= max_retries:
+        return False
+    if deadline is not None and deadline.remaining() <= backoff:
+        logger.warning(f"{label}: not retrying, only {deadline.remaining():.2f}s left of the deadline")
+        return False
+    return True
+
+def request_with_retries(session: requests.Session, method: str, url: str, stats: Optional[RetryStats] = None,
+                         max_retries: int = MAX_RETRIES, backoff_factor: float = BACKOFF_FACTOR,
+                         retry_statuses: Collection[int] = RETRY_STATUSES, label: str = "HTTP",
+                         deadline: Optional[Deadline] = None, timeout: Optional[float] = None,
+                         on_throttle: Optional[Callable[[float], None]] = None,
+                         **kwargs) -> requests.Response:
+    """
+    Send a request, retrying connection errors and retryable statuses.
+
+    Each attempt's timeout and every backoff are bounded by the deadline (the current
+    chat turn's deadline by default), and retry time is recorded in stats. A 429's
+    retry-after is honoured as the backoff and passed to on_throttle.
+    """
+    stats = stats if stats is not None else RetryStats()
+    deadline = deadline if deadline is not None else current_deadline()
+    first_failure = None
+    attempt = 0
+    while True:
+        stats.attempts = attempt + 1
+        try:
+            response = session.request(method, url, timeout=_attempt_timeout(timeout, deadline), **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            backoff = _backoff(attempt, backoff_factor)
+            if not _can_retry(attempt, max_retries, backoff, deadline, label):
+                raise
+            logger.warning(f"{label} transport error, retrying (attempt {attempt + 1})")
+        else:
+            backoff = _backoff(attempt, backoff_factor)
+            retry_after = _retry_after(response)
+            if retry_after is not None:
+                backoff = max(backoff, retry_after)
+                if on_throttle is not None:
+                    on_throttle(retry_after)
+            if response.status_code not in retry_statuses or not _can_retry(attempt, max_retries, backoff, deadline, label):
+                return response
+            logger.warning(f"{label} returned {response.status_code}, retrying (attempt {attempt + 1})")
+        finally:
+            if first_failure is not None:
+                stats.retry_seconds = time.perf_counter() - first_failure
+        if first_failure is None:
+            first_failure = time.perf_counter()
+        time.sleep(backoff)
+        attempt += 1
+
+def post_with_retries(session: requests.Session, url: str, **kwargs) -> requests.Response:
+    return request_with_retries(session, "POST", url, **kwargs)
+
+async def apost_with_retries(client: httpx.AsyncClient, url: str, stats: Optional[RetryStats] = None,
+                             max_retries: int = MAX_RETRIES, backoff_factor: float = BACKOFF_FACTOR,
+                             retry_statuses: Collection[int] = RETRY_STATUSES, label: str = "HTTP",
+                             deadline: Optional[Deadline] = None, timeout: Optional[float] = None,
+                             on_throttle: Optional[Callable[[float], None]] = None,
+                             **kwargs) -> httpx.Response:
+    """Async version of request_with_retries for POSTs through an httpx client."""
+    stats = stats if stats is not None else RetryStats()
+    deadline = deadline if deadline is not None else current_deadline()
+    first_failure = None
+    attempt = 0
+    while True:
+        stats.attempts = attempt + 1
+        try:
+            response = await client.post(url, timeout=_attempt_timeout(timeout, deadline), **kwargs)
+        except httpx.TransportError:
+            backoff = _backoff(attempt, backoff_factor)
+            if not _can_retry(attempt, max_retries, backoff, deadline, label):
+                raise
+            logger.warning(f"{label} transport error, retrying (attempt {attempt + 1})")
+        else:
+            backoff = _backoff(attempt, backoff_factor)
+            retry_after = _retry_after(response)
+            if retry_after is not None:
+                backoff = max(backoff, retry_after)
+                if on_throttle is not None:
+                    on_throttle(retry_after)
+            if response.status_code not in retry_statuses or not _can_retry(attempt, max_retries, backoff, deadline, label):
+                return response
+            logger.warning(f"{label} returned {response.status_code}, retrying (attempt {attempt + 1})")
+        finally:
+            if first_failure is not None:
+                stats.retry_seconds = time.perf_counter() - first_failure
+        if first_failure is None:
+            first_failure = time.perf_counter()
+        await asyncio.sleep(backoff)
+        attempt += 1
@@ -0,0 +1,233 @@
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import numpy as np
+from llm_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# The frontend sends this exact sentence after a design upload
+DESIGN_MARKER = re.compile(r"\bi(?:'|’)?d like to share this design with you\b|\bi would like to share this design with you\b", re.I)
+
+# Fixed messages sent by the product card buttons (ProductButtons.tsx)
+PRODUCT_BUTTONS = re.compile(r"^\s*(?:show me color options for this\b|i'd like to see a different product option\b)", re.I)
+
+_SIZE = r"(?:youth\s+|y)?(?:xxs|xs|s|m|l|xl|xxl|xxxl|[2-6]xl|small|med|medium|large|lg|x-large|xx-large)"
+_SIZE_ENTRY = rf"(?:\d+\s*(?:x\s*)?{_SIZE}|{_SIZE}\s*[:=x-]?\s*\d+)"
+# Size inputs in the "10 M, 10 L, 10 XL" format the intent prompt maps to quantity_collection
+SIZE_LIST = re.compile(
+    rf"^\s*(?:(?:i|we)\s+(?:need|want)\s+|let's do\s+|please do\s+)?{_SIZE_ENTRY}(?:\s*(?:,|;|/|&|and)?\s*{_SIZE_ENTRY})*\s*[.!]?\s*$",
+    re.I
+)
+
+_SIZE_WORDS = {"xxs", "xs", "s", "m", "l", "xl", "xxl", "xxxl", "2xl", "3xl", "4xl", "5xl", "6xl",
+               "small", "med", "medium", "large", "lg", "ys", "ym", "yl", "yxl"}
+
+@dataclass
+class IntentPrediction:
+    label: str
+    confidence: float
+    source: str
+
+def load_examples(path: str) -> List[Dict]:
+    """Read labelled {"text", "label"} examples from a JSON lines file; "group" ties a template's variants together."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class IntentModel:
+    """
+    TF-IDF over word unigrams and bigrams with a multinomial logistic regression on top.
+
+    Small enough to train in well under a second from the seed examples and to score a
+    message in microseconds. Persisted as plain JSON.
+    """
+
+    def __init__(self, labels: List[str], features: List[str], idf: List[float],
+                 weights: List[List[float]], bias: List[float]):
+        self.labels = labels
+        self.features = features
+        self.index = {feature: i for i, feature in enumerate(features)}
+        self.idf = np.asarray(idf, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.bias = np.asarray(bias, dtype=float)
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        text = text.lower().replace("’", "'")
+        tokens = []
+        for token in re.findall(r"[a-z0-9']+", text):
+            if token.isdigit():
+                tokens.append("<num>")
+            elif token in _SIZE_WORDS:
+                tokens.extend([token, "<size>"])
+            else:
+                tokens.append(token)
+        return tokens
+
+    @classmethod
+    def extract(cls, text: str) -> Counter:
+        tokens = cls.tokenize(text)
+        return Counter(tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])])
+
+    def _vectorize(self, counts: Counter) -> tuple:
+        """Sparse TF-IDF vector (indices, values), sublinear tf and L2 normalised."""
+        indices = [self.index[f] for f in counts if f in self.index]
+        if not indices:
+            return np.zeros(0, dtype=int), np.zeros(0)
+        tf = np.array([1 + math.log(counts[self.features[i]]) for i in indices])
+        values = tf * self.idf[indices]
+        return np.asarray(indices), values / np.linalg.norm(values)
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        indices, values = self._vectorize(self.extract(text))
+        scores = self.bias + values @ self.weights[indices]
+        probs = np.exp(scores - scores.max())
+        probs /= probs.sum()
+        return dict(zip(self.labels, probs.tolist()))
+
+    def predict(self, text: str) -> IntentPrediction:
+        """
+        Most likely label. Confidence is the probability scaled by the share of the message's
+        words the model has seen, so unfamiliar messages don't ride on the class prior.
+        """
+        probs = self.predict_proba(text)
+        label = max(probs, key=probs.get)
+        tokens = self.tokenize(text)
+        coverage = sum(1 for t in tokens if t in self.index) / len(tokens) if tokens else 0.0
+        return IntentPrediction(label, probs[label] * coverage, "model")
+
+    @classmethod
+    def train(cls, examples: List[Dict], epochs: int = 400, learning_rate: float = 2.0, l2: float = 1e-3,
+              min_df: int = 1) -> "IntentModel":
+        """Fit on labelled examples with full-batch gradient descent, weighting classes by inverse frequency."""
+        labels = sorted({e["label"] for e in examples})
+        docs = [cls.extract(e["text"]) for e in examples]
+        df = Counter(f for doc in docs for f in doc)
+        features = sorted(f for f, n in df.items() if n >= min_df)
+        idf = [math.log((1 + len(docs)) / (1 + df[f])) + 1 for f in features]
+        model = cls(labels, features, idf, np.zeros((len(features), len(labels))), np.zeros(len(labels)))
+
+        X = np.zeros((len(docs), len(features)))
+        for row, doc in enumerate(docs):
+            indices, values = model._vectorize(doc)
+            X[row, indices] = values
+        y = np.array([labels.index(e["label"]) for e in examples])
+        Y = np.eye(len(labels))[y]
+        class_counts = Y.sum(axis=0)
+        sample_weight = (len(y) / (len(labels) * class_counts))[y][:, None]
+
+        W = np.zeros((len(features), len(labels)))
+        b = np.zeros(len(labels))
+        for _ in range(epochs):
+            scores = X @ W + b
+            scores -= scores.max(axis=1, keepdims=True)
+            P = np.exp(scores)
+            P /= P.sum(axis=1, keepdims=True)
+            grad = (P - Y) * sample_weight / len(y)
+            W -= learning_rate * (X.T @ grad + l2 * W)
+            b -= learning_rate * grad.sum(axis=0)
+        model.weights, model.bias = W, b
+        return model
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "labels": self.labels,
+                "features": self.features,
+                "idf": [round(v, 6) for v in self.idf.tolist()],
+                "weights": [[round(v, 6) for v in row] for row in self.weights.tolist()],
+                "bias": [round(v, 6) for v in self.bias.tolist()]
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentModel":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["labels"], data["features"], data["idf"], data["weights"], data["bias"])
+
+    @classmethod
+    def load_or_train(cls, model_path: str, examples_path: str) -> Optional["IntentModel"]:
+        """Load the persisted model, or train one from the seed examples if it hasn't been built."""
+        try:
+            if os.path.exists(model_path):
+                return cls.load(model_path)
+            logger.warning(f"No intent model at {model_path}, training from {examples_path}")
+            return cls.train(load_examples(examples_path))
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Could not load intent model, using rules only: {e}")
+            return None
+
+class IntentClassifier:
+    """
+    Local fast path in front of the Claude intent call.
+
+    Stages, cheapest first: fixed frontend messages and size lists (rules), then the TF-IDF
+    model. A prediction is returned only when its confidence reaches the threshold; otherwise
+    classify() returns None and the caller asks Claude. Routing that depends on the order
+    state (quantities before a product is picked) stays with the caller.
+    """
+
+    def __init__(self, model: Optional[IntentModel] = None, threshold: float = 0.95):
+        self.model = model
+        self.threshold = threshold
+        self.counts = Counter()
+
+    def _rules(self, message: str) -> Optional[IntentPrediction]:
+        if DESIGN_MARKER.search(message):
+            return IntentPrediction("design_placement", 1.0, "rule")
+        if SIZE_LIST.match(message):
+            return IntentPrediction("quantity_collection", 0.99, "rule")
+        if PRODUCT_BUTTONS.match(message):
+            return IntentPrediction("product_selection", 0.99, "rule")
+        return None
+
+    def predict(self, message: str) -> Optional[IntentPrediction]:
+        """Best local prediction regardless of the threshold (None if no stage has an opinion)."""
+        prediction = self._rules(message)
+        if prediction is None and self.model is not None:
+            prediction = self.model.predict(message)
+        return prediction
+
+    def classify(self, message: str) -> Optional[IntentPrediction]:
+        """Confident local prediction, or None when the message should go to Claude."""
+        prediction = self.predict(message)
+        if prediction is None or prediction.confidence < self.threshold:
+            self.counts["llm"] += 1
+            metrics.increment("intent_classifier", "llm")
+            if prediction is not None:
+                logger.info(f"Intent model unsure ({prediction.label} {prediction.confidence:.2f}), asking Claude")
+            return None
+        self.counts[prediction.source] += 1
+        metrics.increment("intent_classifier", prediction.source)
+        logger.info(f"Intent classified locally: {prediction.label} ({prediction.source}, {prediction.confidence:.2f})")
+        return prediction
+
+    def stats(self) -> Dict:
+        total = sum(self.counts.values())
+        local = total - self.counts["llm"]
+        return {
+            "counts": dict(self.counts),
+            "hit_rate": round(local / total, 4) if total else 0.0,
+            "threshold": self.threshold
+        }
+
+def main():
+    import argparse
+    from config import INTENT_EXAMPLES_PATH, INTENT_MODEL_PATH
+
+    parser = argparse.ArgumentParser(description="Train the local intent model from labelled examples")
+    parser.add_argument("--examples", default=INTENT_EXAMPLES_PATH)
+    parser.add_argument("--output", default=INTENT_MODEL_PATH)
+    args = parser.parse_args()
+
+    examples = load_examples(args.examples)
+    IntentModel.train(examples).save(args.output)
+    print(f"Trained on {len(examples)} examples, saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
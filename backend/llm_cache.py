@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class LLMCache:
+    """
+    Response cache for deterministic (low-temperature) LLM call sites.
+
+    Entries live in an in-process LRU with a TTL. When a disk path is configured,
+    entries are also written to a SQLite file so every gunicorn worker on the host
+    shares the same cache and it survives restarts.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: int = 3600, disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path or None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.disk_path)), exist_ok=True)
+                with self._connect() as conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                    )
+                logger.info(f"LLM cache disk store enabled at {self.disk_path}")
+            except sqlite3.Error as e:
+                logger.error(f"Could not open LLM cache disk store, using memory only: {e}")
+                self.disk_path = None
+
+    @staticmethod
+    def make_key(messages: List[Dict], model: str, temperature: float, **params) -> str:
+        """Hash the normalized messages together with the model, temperature and any other generation params."""
+        normalized = [
+            {"role": msg["role"], "content": " ".join(str(msg["content"]).split())}
+            for msg in messages
+        ]
+        payload = json.dumps(
+            {"model": model, "temperature": temperature, "messages": normalized, "params": params},
+            sort_keys=True, ensure_ascii=False, default=list
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; SQLite connections can't be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=1.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set_memory(self, key: str, value: str, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_disk(self, key: str) -> Optional[tuple]:
+        try:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+            return row
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache disk read failed: {e}")
+            return None
+
+    def _set_disk(self, key: str, value: str, expires_at: float) -> None:
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at)
+                )
+                # Opportunistic cleanup so the file doesn't grow without bound
+                conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache disk write failed: {e}")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for key, or None on a miss."""
+        value = self._get_memory(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        if self.disk_path:
+            row = self._get_disk(key)
+            if row is not None:
+                value, expires_at = row
+                self._set_memory(key, value, expires_at)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        """Store a response under key."""
+        expires_at = time.time() + self.ttl_seconds
+        self._set_memory(key, value, expires_at)
+        if self.disk_path:
+            self._set_disk(key, value, expires_at)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """Like get(), but keeps SQLite reads off the event loop."""
+        if not self.disk_path:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: str) -> None:
+        """Like set(), but keeps SQLite writes off the event loop."""
+        if not self.disk_path:
+            self.set(key, value)
+            return
+        await asyncio.to_thread(self.set, key, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self.disk_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM llm_cache")
+            except sqlite3.Error as e:
+                logger.warning(f"LLM cache disk clear failed: {e}")
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries)
+        }
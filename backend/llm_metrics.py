@@ -0,0 +1,149 @@
+import logging
+import math
+import threading
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+WINDOW_SIZE = 1000
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+class _Series:
+    """Rolling window of recent observations plus all-time sum and count."""
+
+    def __init__(self, window: int):
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.values.append(value)
+        self.total += value
+        self.count += 1
+
+    def quantiles(self) -> Dict[float, float]:
+        ordered = sorted(self.values)
+        return {q: percentile(ordered, q) for q in QUANTILES}
+
+class LLMMetrics:
+    """
+    Per-call-site LLM instrumentation.
+
+    Each call records wall time, time spent retrying, HTTP status and token usage under
+    its profile name. Quantiles are computed over the last WINDOW_SIZE calls per site;
+    sums and counts are cumulative. Metrics are per worker process.
+    """
+
+    SERIES = {
+        "call_seconds": "Wall time of LLM calls, including queueing and retries",
+        "retry_seconds": "Time spent retrying LLM calls after the first attempt failed",
+        "queue_seconds": "Time LLM calls waited in the client-side rate limiter before being sent",
+        "input_tokens": "Uncached input tokens per LLM call",
+        "output_tokens": "Output tokens per LLM call",
+        "cache_read_tokens": "Input tokens served from the provider prompt cache per LLM call",
+    }
+
+    def __init__(self, window: int = WINDOW_SIZE):
+        self.window = window
+        self._lock = threading.Lock()
+        self._series: Dict[str, Dict[str, _Series]] = defaultdict(dict)
+        self._calls: Dict[tuple, int] = defaultdict(int)
+        self._counters: Dict[tuple, int] = defaultdict(int)
+
+    def _observe(self, name: str, site: str, value: float) -> None:
+        series = self._series[name].get(site)
+        if series is None:
+            series = self._series[name][site] = _Series(self.window)
+        series.observe(value)
+
+    def record_call(self, site: str, wall_seconds: float, retry_seconds: float, status: str,
+                    usage: Optional[Dict] = None, queue_seconds: float = 0.0) -> None:
+        """Record one upstream LLM call."""
+        usage = usage or {}
+        with self._lock:
+            self._calls[(site, status)] += 1
+            self._observe("call_seconds", site, wall_seconds)
+            self._observe("retry_seconds", site, retry_seconds)
+            self._observe("queue_seconds", site, queue_seconds)
+            if usage:
+                self._observe("input_tokens", site, usage.get("input_tokens") or 0)
+                self._observe("output_tokens", site, usage.get("output_tokens") or 0)
+                self._observe("cache_read_tokens", site, usage.get("cache_read_input_tokens") or 0)
+        logger.info(
+            f"LLM call site={site} status={status} wall={wall_seconds:.3f}s retry={retry_seconds:.3f}s queue={queue_seconds:.3f}s "
+            f"in={usage.get('input_tokens', 0)} out={usage.get('output_tokens', 0)}"
+        )
+
+    def increment(self, name: str, site: str, amount: int = 1) -> None:
+        """Bump a per-site counter (e.g. cache hits or coalesced calls)."""
+        with self._lock:
+            self._counters[(name, site)] += amount
+
+    def snapshot(self) -> Dict:
+        """Per-site quantiles and counts, plus model cascade escalation rates, for JSON debugging endpoints."""
+        with self._lock:
+            result = {}
+            for name, sites in self._series.items():
+                for site, series in sites.items():
+                    entry = result.setdefault(site, {})
+                    entry[name] = {f"p{int(q * 100)}": round(v, 4) for q, v in series.quantiles().items()}
+                    entry[name]["count"] = series.count
+            for site, stats in self._cascade_stats().items():
+                result.setdefault(site, {})["cascade"] = stats
+            return result
+
+    def _cascade_stats(self) -> Dict:
+        stats = {}
+        for site in sorted({site for name, site in self._counters if name.startswith("cascade_")}):
+            fast = self._counters.get(("cascade_fast", site), 0)
+            escalated = self._counters.get(("cascade_escalated", site), 0)
+            stats[site] = {
+                "fast": fast,
+                "escalated": escalated,
+                "escalation_rate": round(escalated / (fast + escalated), 4) if fast + escalated else 0.0
+            }
+        return stats
+
+    def cascade_stats(self) -> Dict:
+        """Per-site model cascade counts and escalation rates."""
+        with self._lock:
+            return self._cascade_stats()
+
+    def render_prometheus(self, prefix: str = "plato_llm") -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            lines.append(f"# HELP {prefix}_calls_total LLM calls by call site and HTTP status")
+            lines.append(f"# TYPE {prefix}_calls_total counter")
+            for (site, status), count in sorted(self._calls.items()):
+                lines.append(f'{prefix}_calls_total{{site="{site}",status="{status}"}} {count}')
+
+            for name, help_text in self.SERIES.items():
+                sites = self._series.get(name, {})
+                metric = f"{prefix}_{name}"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} summary")
+                for site in sorted(sites):
+                    series = sites[site]
+                    for q, value in series.quantiles().items():
+                        lines.append(f'{metric}{{site="{site}",quantile="{q}"}} {value:.6g}')
+                    lines.append(f'{metric}_sum{{site="{site}"}} {series.total:.6g}')
+                    lines.append(f'{metric}_count{{site="{site}"}} {series.count}')
+
+            for name in sorted({name for name, _ in self._counters}):
+                metric = f"{prefix}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                for (counter_name, site), count in sorted(self._counters.items()):
+                    if counter_name == name:
+                        lines.append(f'{metric}{{site="{site}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+metrics = LLMMetrics()
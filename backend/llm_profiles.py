@@ -0,0 +1,76 @@
+import logging
+from dataclasses import dataclass, replace
+from typing import Dict, Optional, Tuple
+from config import CLAUDE_MODEL, CLAUDE_SITE_MODELS, CLAUDE_FAST_MODEL, CLAUDE_CASCADE_SITES
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class LLMProfile:
+    """Request settings for one LLM call site."""
+    name: str
+    model: str
+    max_tokens: int
+    timeout: float
+    temperature: float
+    stop_sequences: Tuple[str, ...] = ()
+    cache: bool = False
+    # Small model tried first when the site is in the cascade
+    fast_model: Optional[str] = None
+    # True for the cascade's small-model attempt (see as_fast)
+    fast: bool = False
+
+    def as_fast(self) -> "LLMProfile":
+        """The same settings on the cascade's small model; its calls are recorded as <site>_fast."""
+        return replace(self, name=f"{self.name}_fast", model=self.fast_model, fast_model=None, fast=True)
+
+def _profile(name: str, max_tokens: int, timeout: float, temperature: float,
+             stop_sequences: Tuple[str, ...] = (), cache: bool = False) -> LLMProfile:
+    model = CLAUDE_SITE_MODELS.get(name) or CLAUDE_MODEL
+    cascade = name in CLAUDE_CASCADE_SITES and CLAUDE_FAST_MODEL and CLAUDE_FAST_MODEL != model
+    return LLMProfile(
+        name=name,
+        model=model,
+        max_tokens=max_tokens,
+        timeout=timeout,
+        temperature=temperature,
+        stop_sequences=stop_sequences,
+        cache=cache,
+        fast_model=CLAUDE_FAST_MODEL if cascade else None
+    )
+
+PROFILES: Dict[str, LLMProfile] = {p.name: p for p in (
+    # Previous behaviour for any caller that doesn't name a site
+    _profile("default", max_tokens=4000, timeout=60, temperature=0.7),
+    # record_stage tool call with the stage name
+    _profile("intent", max_tokens=48, timeout=10, temperature=0.0, cache=True),
+    # record_product_analysis tool call with the seven product preference fields
+    _profile("analysis", max_tokens=150, timeout=15, temperature=0.3, cache=True),
+    # record_intent_analysis tool call: the same fields plus the stage name
+    _profile("intent_analysis", max_tokens=160, timeout=15, temperature=0.0, cache=True),
+    # record_intent_analyses tool call for up to INTENT_BATCH_MAX_ITEMS (8) conversations
+    _profile("intent_analysis_batch", max_tokens=1300, timeout=20, temperature=0.0),
+    # record_customer_info tool call with the customer's name, address and email
+    _profile("extraction", max_tokens=300, timeout=15, temperature=0.1, cache=True),
+    # Customer-facing product pitches and preference questions
+    _profile("product_pitch", max_tokens=400, timeout=30, temperature=0.7),
+    # JSON array of pitch variants for one catalog product (offline batch job)
+    _profile("pitch_copy", max_tokens=600, timeout=60, temperature=0.9),
+    # select_product tool call: short reasoning and the number of the chosen option
+    _profile("rerank", max_tokens=400, timeout=20, temperature=0.1),
+    # A single "#RRGGBB" code, found with HEX_CODE_RE; the API rejects a whitespace-only stop sequence
+    _profile("hex", max_tokens=12, timeout=10, temperature=0.1, cache=True),
+    # Order confirmation with the payment link
+    _profile("completion", max_tokens=600, timeout=30, temperature=0.7),
+    # Other conversational replies (placement, quantities, missing details)
+    _profile("reply", max_tokens=400, timeout=30, temperature=0.7),
+)}
+
+def get_profile(name: Optional[str] = None, **overrides) -> LLMProfile:
+    """Look up a call-site profile, applying any non-None overrides."""
+    profile = PROFILES.get(name or "default")
+    if profile is None:
+        logger.warning(f"Unknown LLM profile '{name}', using default")
+        profile = PROFILES["default"]
+    overrides = {k: v for k, v in overrides.items() if v is not None}
+    return replace(profile, **overrides) if overrides else profile
@@ -0,0 +1,139 @@
+import asyncio
+import contextvars
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from deadline import Deadline, current_deadline, deadline_scope
+from llm_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """
+    Groups concurrent requests from different conversations into one upstream call.
+
+    A request waits at most max_wait_seconds for others to join it, and a batch is sent as
+    soon as it holds max_items. Batching only starts once at least min_concurrent requests
+    are in flight, so off-peak turns go straight to run_one without the wait. run_batch
+    returns one result per item, None for items it couldn't answer; those fall back to
+    run_one individually. Bound to the event loop it is first used on.
+
+    The batch call belongs to no single turn: it runs in a fresh context whose deadline is
+    the latest of its items' turn deadlines, while each fallback runs in its own submitter's
+    context. A submitter whose deadline passes before the batch answers stops waiting and
+    gets run_one's answer under its spent budget instead.
+    """
+
+    def __init__(self, name: str, run_batch: Callable[[List[Any]], Awaitable[List[Optional[Any]]]],
+                 run_one: Callable[[Any], Awaitable[Any]], max_items: int = 8,
+                 max_wait_seconds: float = 0.025, min_concurrent: int = 2):
+        self.name = name
+        self.run_batch = run_batch
+        self.run_one = run_one
+        self.max_items = max_items
+        self.max_wait_seconds = max_wait_seconds
+        self.min_concurrent = min_concurrent
+        # Item, its future and the submitter's context
+        self._pending: List[Tuple[Any, asyncio.Future, contextvars.Context]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self._active = 0
+        self.direct = 0
+        self.batches = 0
+        self.batched_items = 0
+        self.fallbacks = 0
+
+    async def submit(self, item: Any) -> Any:
+        """Result for item, from a batch call when other requests arrive in time, else from run_one."""
+        self._active += 1
+        try:
+            if self._active < self.min_concurrent and not self._pending:
+                self.direct += 1
+                return await self.run_one(item)
+            future = asyncio.get_running_loop().create_future()
+            self._pending.append((item, future, contextvars.copy_context()))
+            if len(self._pending) >= self.max_items:
+                self._flush()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.max_wait_seconds, self._flush)
+            deadline = current_deadline()
+            if deadline is None:
+                return await future
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), deadline.remaining())
+            except asyncio.TimeoutError:
+                # The batch outlived this turn's budget; the batch's answer for it is dropped
+                future.cancel()
+                self._pending = [pending for pending in self._pending if pending[1] is not future]
+                return await self.run_one(item)
+        finally:
+            self._active -= 1
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            contextvars.Context().run(self._start, batch, self._batch_deadline(batch))
+
+    @staticmethod
+    def _batch_deadline(batch: List[Tuple[Any, asyncio.Future, contextvars.Context]]) -> Optional[Deadline]:
+        """The latest of the submitters' deadlines, None if any of them has none."""
+        deadlines = [context.run(current_deadline) for _, _, context in batch]
+        if any(d is None for d in deadlines):
+            return None
+        return max(deadlines, key=lambda d: d.expires_at)
+
+    def _start(self, batch: List[Tuple[Any, asyncio.Future, contextvars.Context]], deadline: Optional[Deadline]) -> None:
+        # The task copies this (fresh) context, with the batch's deadline set
+        with deadline_scope(deadline):
+            task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future, contextvars.Context]]) -> None:
+        items = [item for item, _, _ in batch]
+        results: List[Optional[Any]] = [None] * len(items)
+        if len(items) > 1:
+            start = time.perf_counter()
+            try:
+                results = list(await self.run_batch(items))
+            except Exception:
+                logger.exception(f"{self.name}: batch of {len(items)} failed, calling each item")
+            self.batches += 1
+            self.batched_items += len(items)
+            metrics.increment("micro_batch", self.name)
+            logger.info(f"{self.name}: batch of {len(items)} in {time.perf_counter() - start:.3f}s, "
+                        f"{sum(r is None for r in results)} unanswered")
+
+        async def resolve(i: int) -> None:
+            result = results[i]
+            future, context = batch[i][1], batch[i][2]
+            if future.done():
+                # The submitter stopped waiting (its deadline passed)
+                return
+            try:
+                if result is None:
+                    if len(items) > 1:
+                        self.fallbacks += 1
+                        metrics.increment("micro_batch_fallback", self.name)
+                    # Under the submitter's own context and deadline
+                    result = await context.run(asyncio.ensure_future, self.run_one(items[i]))
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                return
+            if not future.done():
+                future.set_result(result)
+
+        await asyncio.gather(*(resolve(i) for i in range(len(items))))
+
+    def stats(self) -> Dict:
+        return {
+            "direct": self.direct,
+            "batches": self.batches,
+            "batched_items": self.batched_items,
+            "avg_batch_size": round(self.batched_items / self.batches, 2) if self.batches else 0.0,
+            "fallbacks": self.fallbacks
+        }
@@ -100,7 +100,8 @@ class OrderState:
     
         # Update product details
         self.product_selected = True
-        self.product_details = details
+        # A copy, since catalog products are shared (a store's are read-only views)
+        self.product_details = dict(details)
     
         # Save the product category if provided
         if 'category' in details:
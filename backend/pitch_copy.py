@@ -0,0 +1,93 @@
+import json
+import logging
+import random
+import re
+from typing import Dict, List, Optional
+from llm_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the file layout changes; files with another format version are ignored
+FORMAT_VERSION = 1
+PRICE_PLACEHOLDER = "{price}"
+
+def product_key(style_number: str, color: str, category: str) -> str:
+    """Key of one catalog product; category is the product tree's internal key (e.g. "t-shirt")."""
+    return f"{style_number}|{color}|{category}"
+
+def parse_variants(response: str, product: Dict) -> List[str]:
+    """
+    Pitch variants from a JSON array response, keeping only usable ones: exactly one price
+    placeholder, the product name mentioned, and no other template braces.
+    """
+    match = re.search(r"\[.*\]", response or "", re.S)
+    if not match:
+        return []
+    try:
+        variants = json.loads(match.group(0))
+    except ValueError:
+        return []
+    usable = []
+    for text in variants:
+        if not isinstance(text, str):
+            continue
+        text = " ".join(text.split())
+        if text.count(PRICE_PLACEHOLDER) != 1 or text.replace(PRICE_PLACEHOLDER, "").count("{"):
+            continue
+        if product.get("product_name", "").lower() not in text.lower():
+            continue
+        usable.append(text)
+    return usable
+
+class PitchCopy:
+    """
+    Pre-generated product pitches, loaded from the file written by generate_pitch_copy.py.
+
+    Pitches are stored per (style, color, category) with a price placeholder, so a price
+    change doesn't need a regeneration.
+    """
+
+    def __init__(self, entries: Dict[str, List[str]], version: int = 0, generated_at: Optional[str] = None):
+        self.entries = entries
+        self.version = version
+        self.generated_at = generated_at
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path: str) -> Optional["PitchCopy"]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            logger.info(f"No pitch copy at {path}, product pitches will be generated live")
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load pitch copy from {path}: {e}")
+            return None
+        if data.get("format") != FORMAT_VERSION:
+            logger.warning(f"Ignoring pitch copy at {path}: format {data.get('format')}, expected {FORMAT_VERSION}")
+            return None
+        copy = cls(data.get("entries", {}), data.get("version", 0), data.get("generated_at"))
+        logger.info(f"Loaded pitch copy v{copy.version} for {len(copy.entries)} products from {path}")
+        return copy
+
+    def pick(self, style_number: str, color: str, category: str, price: str) -> Optional[str]:
+        """A random stored pitch for the product with the price filled in, or None if there is none."""
+        variants = self.entries.get(product_key(style_number, color, category))
+        if not variants:
+            self.misses += 1
+            metrics.increment("pitch_copy", "miss")
+            return None
+        self.hits += 1
+        metrics.increment("pitch_copy", "hit")
+        return random.choice(variants).replace(PRICE_PLACEHOLDER, price)
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.version,
+            "generated_at": self.generated_at,
+            "products": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
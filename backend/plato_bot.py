@@ -1,26 +1,49 @@
 import logging
-from typing import Dict, Optional, List
+from typing import AsyncIterator, Dict, Optional, List, Tuple
 from PIL import Image
 import utils
 from product_decision_tree import ProductDecisionTree
 from goal_identifier import GoalIdentifier
 from paypal_service import PayPalService
 from conversation_manager import ConversationManager
-from claude_client import ClaudeClient
+from claude_client import ClaudeClient, ERROR_RESPONSE
 from ss_client import SSClient
 from firebase_service import FirebaseService
 from order_state import OrderState
 from firebase_admin import firestore
 from config import (
    SS_USERNAME, SS_API_KEY, MAX_HISTORY, 
-   TIMEOUT_MINUTES, PRINTING_COST, PROFIT_MARGIN
+   TIMEOUT_MINUTES, PRINTING_COST, PROFIT_MARGIN,
+   INTENT_CLASSIFIER_ENABLED, INTENT_CLASSIFIER_THRESHOLD, INTENT_MODEL_PATH, INTENT_EXAMPLES_PATH,
+   SPECULATION_ENABLED, SPECULATION_TTL_SECONDS, PITCH_COPY_ENABLED, PITCH_COPY_PATH,
+   INTENT_BATCH_ENABLED, INTENT_BATCH_MAX_ITEMS, INTENT_BATCH_MAX_WAIT_MS, INTENT_BATCH_MIN_CONCURRENT
 )
 import prompts
+import rules_fallback
+import response_templates
+import structured_output
 import asyncio
+import contextvars
+from async_runtime import run_sync
+from deadline import Deadline, deadline_scope, current_deadline
+from intent_classifier import IntentClassifier, IntentModel
+from llm_metrics import metrics
+from task_graph import current_graph, run_in_graph
+from speculation import SpeculativeCache
+from pitch_copy import PitchCopy
+from micro_batcher import MicroBatcher
 
 
 logger = logging.getLogger(__name__)
 
+DEADLINE_FALLBACK_RESPONSE = "Sorry, that took longer than expected on my end. Could you send your last message again?"
+
+# Firestore writes from one turn go out in this order; each waits for the ones before it
+FIRESTORE_WRITES = ("persist_order_state", "add_message")
+
+# Set while a turn is being streamed; handlers push ("card" | "delta", payload) events onto it
+_reply_stream: contextvars.ContextVar[Optional[asyncio.Queue]] = contextvars.ContextVar("reply_stream", default=None)
+
 class PlatoBot:
     def __init__(self):
         logger.info("Initializing PlatoBot...")
@@ -33,6 +56,19 @@ class PlatoBot:
             timeout_minutes=TIMEOUT_MINUTES
         )
         self.goal_identifier = GoalIdentifier(self.claude)
+        self.intent_classifier = IntentClassifier(
+            IntentModel.load_or_train(INTENT_MODEL_PATH, INTENT_EXAMPLES_PATH),
+            threshold=INTENT_CLASSIFIER_THRESHOLD
+        ) if INTENT_CLASSIFIER_ENABLED else None
+        self.speculation = SpeculativeCache(ttl_seconds=SPECULATION_TTL_SECONDS) if SPECULATION_ENABLED else None
+        self._speculation_tasks = set()
+        self.pitch_copy = PitchCopy.load(PITCH_COPY_PATH) if PITCH_COPY_ENABLED else None
+        self.intent_batcher = MicroBatcher(
+            "intent_analysis", self._classify_intent_batch, self._classify_intent_one,
+            max_items=INTENT_BATCH_MAX_ITEMS,
+            max_wait_seconds=INTENT_BATCH_MAX_WAIT_MS / 1000,
+            min_concurrent=INTENT_BATCH_MIN_CONCURRENT
+        ) if INTENT_BATCH_ENABLED else None
         self.paypal = PayPalService()
 
         # Initialize SS Client
@@ -48,12 +84,178 @@ class PlatoBot:
             logger.exception("Error initializing S&S services:")
             raise
 
-    def process_message(self, user_id: str, message: str, design_url: str = None) -> dict:
+    def process_message(self, user_id: str, message: str, design_url: str = None, deadline: Optional[Deadline] = None) -> dict:
+        """Blocking entry point for sync callers; runs aprocess_message on the shared event loop."""
+        return run_sync(self.aprocess_message(user_id, message, design_url, deadline))
+
+    def _handle_product_selection(self, user_id: str, message: str, order_state, analysis: Optional[Dict] = None) -> dict:
+        return run_sync(run_in_graph(f"Product selection for {user_id}",
+                                     self._ahandle_product_selection(user_id, message, order_state, analysis)))
+
+    def _handle_design_placement(self, user_id: str, message: str, order_state) -> dict:
+        return run_sync(run_in_graph(f"Design placement for {user_id}",
+                                     self._ahandle_design_placement(user_id, message, order_state)))
+
+    def _handle_quantity_collection(self, user_id: str, message: str, order_state) -> dict:
+        return run_sync(run_in_graph(f"Quantity collection for {user_id}",
+                                     self._ahandle_quantity_collection(user_id, message, order_state)))
+
+    def _handle_customer_information(self, user_id: str, message: str, order_state, form_submission=False) -> dict:
+        return run_sync(run_in_graph(f"Customer information for {user_id}",
+                                     self._ahandle_customer_information(user_id, message, order_state, form_submission)))
+
+    async def aprocess_message_stream(self, user_id: str, message: str, design_url: str = None,
+                                      deadline: Optional[Deadline] = None) -> AsyncIterator[Tuple[str, dict]]:
+        """Process a message, yielding (event, payload) pairs: card and text deltas as they arrive, then the full response."""
+        yield "status", {"state": "processing"}
+
+        queue: asyncio.Queue = asyncio.Queue()
+        token = _reply_stream.set(queue)
+        try:
+            # The task copies the current context, so handlers running inside it see the queue
+            task = asyncio.ensure_future(self.aprocess_message(user_id, message, design_url, deadline))
+        finally:
+            _reply_stream.reset(token)
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            yield event
+
+        yield "done", task.result()
+
+    async def _generate_reply(self, messages: List[Dict], profile: str = "reply", fallback: Optional[str] = None,
+                              templated: Optional[str] = None) -> str:
+        """
+        Generate the user-facing reply, streaming cleaned text to the client when the turn is streamed.
+
+        A templated reply (the call site is configured for templates) is used as-is without
+        calling Claude. If Claude can't answer (error, circuit breaker open or the turn deadline
+        ran out), the fallback text is used instead.
+        """
+        stream = _reply_stream.get()
+        if templated is not None:
+            metrics.increment("templated_reply", profile)
+            if stream is not None:
+                await stream.put(("delta", {"text": templated}))
+            return templated
+
+        deadline = current_deadline()
+        expired = deadline is not None and deadline.expired()
+        if expired or (fallback and self.claude.degraded):
+            reason = "Turn deadline exhausted" if expired else "Degraded mode"
+            logger.warning(f"{reason} before {profile} reply, using fallback text")
+            response_text = fallback or DEADLINE_FALLBACK_RESPONSE
+            if stream is not None:
+                await stream.put(("delta", {"text": response_text}))
+            return response_text
+
+        if stream is None:
+            response = await self.claude.acall_api(messages, profile=profile)
+            if response == ERROR_RESPONSE and fallback:
+                return fallback
+            return utils.clean_response(response)
+
+        cleaner = utils.StreamCleaner()
+        parts = []
+        try:
+            async for chunk in self.claude.astream_api(messages, profile=profile):
+                text = cleaner.feed(chunk)
+                if text:
+                    parts.append(text)
+                    await stream.put(("delta", {"text": text}))
+            text = cleaner.flush()
+            if text:
+                parts.append(text)
+                await stream.put(("delta", {"text": text}))
+        except Exception:
+            logger.exception("Error streaming reply from Claude")
+            if not parts:
+                # Nothing reached the client yet, so fall back to a regular call
+                response = await self.claude.acall_api(messages, profile=profile)
+                response_text = fallback if response == ERROR_RESPONSE and fallback else utils.clean_response(response)
+                await stream.put(("delta", {"text": response_text}))
+                return response_text
+        return ''.join(parts)
+
+    async def _classify_intent(self, message: str, context: Dict) -> Optional[Dict]:
+        """record_intent_analysis input for the message, batched with other conversations' when the batcher is on."""
+        if self.intent_batcher is not None:
+            return await self.intent_batcher.submit((message, context))
+        return await self._classify_intent_one((message, context))
+
+    async def _classify_intent_one(self, item: Tuple[str, Dict]) -> Optional[Dict]:
+        return await self.claude.acall_tool(
+            prompts.get_intent_analysis_messages(*item), structured_output.INTENT_ANALYSIS_TOOL, profile="intent_analysis"
+        )
+
+    async def _classify_intent_batch(self, items: List[Tuple[str, Dict]]) -> List[Optional[Dict]]:
+        """One record_intent_analyses call for several conversations; unanswered items come back as None."""
+        response = await self.claude.acall_api(
+            prompts.get_intent_analysis_batch_messages(items),
+            profile="intent_analysis_batch", tool=structured_output.INTENT_ANALYSIS_BATCH_TOOL
+        )
+        return structured_output.split_batch(
+            response, structured_output.INTENT_ANALYSIS_BATCH_TOOL, structured_output.INTENT_ANALYSIS_TOOL, len(items)
+        )
+
+    async def _analyze_product_request(self, message: str) -> Dict:
+        """Structured product analysis from Claude, or from the local keyword parser when Claude is unavailable."""
+        if self.claude.degraded:
+            return rules_fallback.analyze_product_request(message)
+        analysis_prompt = [
+            {"role": "system", "content": prompts.PRODUCT_ANALYSIS_PROMPT, "cache": True},
+            {"role": "user", "content": message}
+        ]
+        result = await self.claude.acall_tool(analysis_prompt, structured_output.PRODUCT_ANALYSIS_TOOL, profile="analysis")
+        if result is None:
+            return rules_fallback.analyze_product_request(message)
+        return utils.normalize_product_analysis(result)
+
+    def _prepared_pitch(self, details: Dict, price: str, size_note: bool = False) -> Optional[str]:
+        """
+        Pitch that needs no live Claude call: from templates when the site is templated, else
+        the pre-generated copy for the product. None means Claude writes it live.
+        """
+        if response_templates.enabled("product_pitch"):
+            return response_templates.product_pitch(
+                details["product_name"], details["color"], price, details["category"],
+                details.get("material"), size_note=size_note
+            )
+        if self.pitch_copy is None:
+            return None
+        text = self.pitch_copy.pick(
+            details["style_number"], details["color"],
+            self.product_tree.map_category_to_internal(details["category"]), price
+        )
+        if text and size_note:
+            text += "\n\n" + response_templates.render("size_note")
+        return text
+
+    def _fallback_pitch(self, product_name: str, color: str, price: str) -> str:
+        """Templated pitch used when Claude can't write one in time."""
+        return response_templates.product_pitch(product_name, color, price, variant=0)
+
+    async def _emit_card(self, images: List[Dict], action: Dict) -> None:
+        """Send the product card ahead of the reply text when the turn is streamed."""
+        stream = _reply_stream.get()
+        if stream is not None:
+            await stream.put(("card", {"images": images, "action": action}))
+
+    async def aprocess_message(self, user_id: str, message: str, design_url: str = None,
+                               deadline: Optional[Deadline] = None) -> dict:
+        """Process one chat turn; every outbound call made for it is bounded by deadline."""
+        with deadline_scope(deadline):
+            return await run_in_graph(f"Turn for {user_id}", self._aprocess_message(user_id, message, design_url))
+
+    async def _aprocess_message(self, user_id: str, message: str, design_url: str = None) -> dict:
         logger.info(f"Processing message from user '{user_id}': {message}")
         
         try:
             # Get or initialize OrderState
-            order_state = self.conversation_manager.get_order_state(user_id)
+            order_state = await asyncio.to_thread(self.conversation_manager.get_order_state, user_id)
             
             # Store design URL if provided
             if design_url:
@@ -72,7 +274,7 @@ class PlatoBot:
                 )
                 # Placement is now automatically set in update_design method
                 
-                self.conversation_manager.update_order_state(user_id, order_state)
+                await self._persist_order_state(user_id, order_state)
                 
                 # Log updated order state
                 design_count = len(order_state.designs) if hasattr(order_state, 'designs') else 0
@@ -88,26 +290,32 @@ class PlatoBot:
                     order_state.design_uploaded = True
                     # Placement is automatically handled in our new OrderState implementation
                     
-                    self.conversation_manager.update_order_state(user_id, order_state)
+                    await self._persist_order_state(user_id, order_state)
                     design_count = len(order_state.designs) if hasattr(order_state, 'designs') else 0
                     logger.info(f"Updated order state after design confirmation - design_uploaded: {order_state.design_uploaded}, placement_selected: {order_state.placement_selected}, design_count: {design_count}")
 
-            # STEP 1: Intent Classification - Use a structured prompt to get ONLY the category
-            intent_messages = [
-                {"role": "system", "content": prompts.get_intent_prompt(message, self._prepare_context(order_state))},
-                {"role": "user", "content": message}
-            ]
-            
-            # Get a clean, single-category response
-            claude_response = self.claude.call_api(intent_messages)
-            identified_goal = utils.clean_response(claude_response).strip().lower()
+            # STEP 1: Intent Classification - local fast path first, Claude only when it's unsure
+            analysis = None
+            local_intent = self.intent_classifier.classify(message) if self.intent_classifier else None
+            if local_intent is not None:
+                identified_goal = local_intent.label
+            elif self.claude.degraded:
+                # Claude's breaker is open: the goal identifier goes straight to keyword matching
+                identified_goal = await asyncio.to_thread(self.goal_identifier.identify_goal, message, order_state)
+                logger.info(f"Degraded mode, goal from keyword matching: {identified_goal}")
+            else:
+                # One call returns the stage plus the product analysis, so product selection can skip its own call
+                result = await self._step("intent_analysis", self._classify_intent, message, self._prepare_context(order_state))
+                if result is not None:
+                    analysis = utils.normalize_product_analysis(result)
+                    identified_goal = analysis.pop("goal")
+                else:
+                    identified_goal = None
             
-            # Validate that identified_goal is one of the expected categories
-            valid_goals = ["product_selection", "design_placement", "quantity_collection", "customer_information"]
-            if identified_goal not in valid_goals:
-                # Fallback to goal identifier if Claude returns unexpected format
-                identified_goal = self.goal_identifier.identify_goal(message, order_state)
-                logger.info(f"Invalid goal format from Claude, reclassified as: {identified_goal}")
+            if identified_goal is None:
+                # The combined call failed even after a repair, so fall back to the goal identifier
+                identified_goal = await asyncio.to_thread(self.goal_identifier.identify_goal, message, order_state)
+                logger.info(f"No goal from Claude, reclassified as: {identified_goal}")
             
             logger.info(f"Identified goal: {identified_goal}")
             
@@ -118,25 +326,26 @@ class PlatoBot:
                 # Store original intent for later use
                 if not hasattr(order_state.original_intent, "had_quantity"):
                     order_state.original_intent["had_quantity"] = True
-                self.conversation_manager.update_order_state(user_id, order_state)
+                await self._persist_order_state(user_id, order_state)
 
             # Add message to conversation history
-            self.conversation_manager.add_message(user_id, "user", message, identified_goal)
+            await self._add_message(user_id, "user", message, identified_goal)
 
             # Handle each goal
             handlers = {
-                "product_selection": self._handle_product_selection,
-                "design_placement": self._handle_design_placement,
-                "quantity_collection": self._handle_quantity_collection,
-                "customer_information": self._handle_customer_information
+                "product_selection": self._ahandle_product_selection,
+                "design_placement": self._ahandle_design_placement,
+                "quantity_collection": self._ahandle_quantity_collection,
+                "customer_information": self._ahandle_customer_information
             }
 
             handler = handlers.get(identified_goal)
             if handler:
-                response = handler(user_id, message, order_state)
-                self.conversation_manager.add_message(
-                    user_id, "assistant", response["text"], identified_goal
-                )
+                if identified_goal == "product_selection":
+                    response = await handler(user_id, message, order_state, analysis=analysis)
+                else:
+                    response = await handler(user_id, message, order_state)
+                await self._add_message(user_id, "assistant", response["text"], identified_goal)
                 return response
             else:
                 return {
@@ -150,11 +359,15 @@ class PlatoBot:
                 "text": "I encountered an error processing your request. Please try again or contact our support team for assistance.",
                 "images": []
             }
-            self.conversation_manager.add_message(user_id, "assistant", error_response["text"])
+            await self._add_message(user_id, "assistant", error_response["text"])
             return error_response
 
-    def _handle_product_selection(self, user_id: str, message: str, order_state, enhanced_query: str = None) -> dict:
-        """Handle product selection with decision tree approach."""
+    async def _ahandle_product_selection(self, user_id: str, message: str, order_state, analysis: Optional[Dict] = None) -> dict:
+        """
+        Handle product selection with decision tree approach.
+
+        analysis is the product analysis of message when the intent call already produced it.
+        """
         logger.info(f"Handling product selection for: {message}")
         logger.info(
             f"Order state for user {user_id}: color_options_shown={getattr(order_state, 'color_options_shown', False)}, "
@@ -177,7 +390,7 @@ class PlatoBot:
 
                 if style_number:
                     # Get all colors available for this product style
-                    all_colors = self._get_product_colors(style_number)
+                    all_colors = self._speculated(user_id, "colors", self._get_product_colors, style_number)
 
                     # Generate a response with color options
                     response_text = f"Here are all the available colors for the {product_name}:\n\n"
@@ -189,7 +402,7 @@ class PlatoBot:
                     order_state.color_options_style = style_number
                     order_state.color_options_product_name = product_name
                     order_state.last_style_number = style_number
-                    self.conversation_manager.update_order_state(user_id, order_state)
+                    await self._persist_order_state(user_id, order_state)
 
                     return {
                         "text": response_text,
@@ -207,7 +420,7 @@ class PlatoBot:
                 logger.info(f"Processing color selection for style {order_state.last_style_number}: {message}")
 
                 # Get all colors for this style
-                all_colors = self._get_product_colors(order_state.last_style_number)
+                all_colors = self._speculated(user_id, "colors", self._get_product_colors, order_state.last_style_number)
                 logger.info(f"Available colors: {all_colors}")
 
                 # Check if message matches any color
@@ -221,50 +434,48 @@ class PlatoBot:
                     logger.info(f"Matched color: {selected_color}")
 
                     # Find the same product in the selected color
-                    for category in self.product_tree.categories.values():
-                        for product in category.products:
-                            if (product.get('style_number') == order_state.last_style_number and 
-                                product.get('color') == selected_color):
-
-                                # We found the exact same product in the requested color!
-                                logger.info(f"Found product: {product.get('product_name')} in {selected_color}")
-
-                                # Update order state with this product
-                                order_state.update_product(product)
-                                order_state.color_options_shown = False  # Reset flag
-                                order_state.last_style_number = None
-                                order_state.color_options_style = None
-                                order_state.color_options_product_name = None
-                                self.conversation_manager.update_order_state(user_id, order_state)
-
-                                # Return a response with this product
-                                return {
-                                    "text": f"Great choice! I've selected the {product.get('product_name')} in {selected_color} at {product.get('price')}. Would you like to upload your logo now?",
-                                    "images": [
-                                        {
-                                            "url": product.get('images', {}).get('front', ''),
-                                            "alt": f"{product.get('product_name')} in {selected_color} - Front View",
-                                            "type": "product_front" 
-                                        },
-                                        {
-                                            "url": product.get('images', {}).get('back', ''),
-                                            "alt": f"{product.get('product_name')} in {selected_color} - Back View",
-                                            "type": "product_back"
-                                        }
-                                    ],
-                                    "action": {
-                                        "type": "showProductOptions",
-                                        "productInfo": {
-                                            "name": product.get('product_name'),
-                                            "color": selected_color,
-                                            "price": product.get('price'),
-                                            "category": product.get('category'),
-                                            "style_number": product.get('style_number'),
-                                            "material": product.get('material', ''),
-                                            "colorSpecified": False
-                                        }
-                                    }
+                    product = self.product_tree.product_data.get(f"{order_state.last_style_number}_{selected_color}")
+                    if product:
+                        # We found the exact same product in the requested color!
+                        logger.info(f"Found product: {product.get('product_name')} in {selected_color}")
+
+                        # Update order state with this product
+                        order_state.update_product(product)
+                        order_state.color_options_shown = False  # Reset flag
+                        order_state.last_style_number = None
+                        order_state.color_options_style = None
+                        order_state.color_options_product_name = None
+                        await self._persist_order_state(user_id, order_state)
+                        self._speculate_after_product(user_id, product)
+
+                        # Return a response with this product
+                        return {
+                            "text": f"Great choice! I've selected the {product.get('product_name')} in {selected_color} at {product.get('price')}. Would you like to upload your logo now?",
+                            "images": [
+                                {
+                                    "url": product.get('images', {}).get('front', ''),
+                                    "alt": f"{product.get('product_name')} in {selected_color} - Front View",
+                                    "type": "product_front" 
+                                },
+                                {
+                                    "url": product.get('images', {}).get('back', ''),
+                                    "alt": f"{product.get('product_name')} in {selected_color} - Back View",
+                                    "type": "product_back"
+                                }
+                            ],
+                            "action": {
+                                "type": "showProductOptions",
+                                "productInfo": {
+                                    "name": product.get('product_name'),
+                                    "color": selected_color,
+                                    "price": product.get('price'),
+                                    "category": product.get('category'),
+                                    "style_number": product.get('style_number'),
+                                    "material": product.get('material', ''),
+                                    "colorSpecified": False
                                 }
+                            }
+                        }
 
             # Check if this is a product reselection request with the special marker
             is_special_reselection = "I'd like to see a different product option" in message
@@ -302,16 +513,15 @@ class PlatoBot:
 
                     # Track that we're in a product modification flow
                     order_state.in_product_modification_flow = True
-                    self.conversation_manager.update_order_state(user_id, order_state)
+                    await self._persist_order_state(user_id, order_state)
 
                     # Ask for specific preferences
                     preference_prompt = prompts.get_product_preference_inquiry_prompt(previous_product)
-                    response = self.claude.call_api([
+                    response_text = await self._generate_reply([
                         {"role": "system", "content": preference_prompt},
                         {"role": "user", "content": "What would make a better product recommendation?"}
-                    ], temperature=0.7)
+                    ], profile="product_pitch", fallback=rules_fallback.preference_inquiry_reply(previous_product))
 
-                    response_text = utils.clean_response(response)
                     logger.info(f"Generated preference inquiry: {response_text[:100]}...")
 
                     # Return the preference inquiry - THIS SHOULD DISPLAY IN THE CHAT
@@ -345,7 +555,8 @@ class PlatoBot:
                             logger.info(f"Processing cheaper option request for {previous_category} in {previous_color}")
 
                             # Check if there are any cheaper options in this category and color
-                            cheaper_product = self._find_cheaper_product(
+                            cheaper_product = self._speculated(
+                                user_id, "cheaper", self._find_cheaper_product,
                                 previous_category, 
                                 previous_color, 
                                 previous_price,
@@ -360,7 +571,8 @@ class PlatoBot:
 
                                 # Update OrderState with the cheaper product
                                 order_state.update_product(cheaper_product)
-                                self.conversation_manager.update_order_state(user_id, order_state)
+                                await self._persist_order_state(user_id, order_state)
+                                self._speculate_after_product(user_id, cheaper_product)
 
                                 # Generate response
                                 response_prompt = prompts.get_product_response_prompt(
@@ -374,14 +586,6 @@ class PlatoBot:
                                 # Add specific context about this being a cheaper option
                                 response_prompt += f"\n\nImportant: Mention that this is a less expensive option than the {previous_product.get('product_name')} at {previous_product.get('price')}."
 
-                                # Get response from Claude
-                                response = self.claude.call_api([
-                                    {"role": "system", "content": response_prompt},
-                                    {"role": "user", "content": "Generate the response."}
-                                ], temperature=0.7)
-
-                                response_text = utils.clean_response(response)
-
                                 # Create product info for the action
                                 product_info = {
                                     "name": cheaper_product.get('product_name'),
@@ -395,25 +599,39 @@ class PlatoBot:
                                 # Always show color button
                                 product_info["showColorButton"] = True
 
+                                product_images = [
+                                    {
+                                        "url": cheaper_product.get('images', {}).get('front', ''),
+                                        "alt": f"{cheaper_product.get('product_name')} in {cheaper_product.get('color')} - Front View",
+                                        "type": "product_front"
+                                    },
+                                    {
+                                        "url": cheaper_product.get('images', {}).get('back', ''),
+                                        "alt": f"{cheaper_product.get('product_name')} in {cheaper_product.get('color')} - Back View",
+                                        "type": "product_back"
+                                    }
+                                ]
+                                action = {
+                                    "type": "showProductOptions",
+                                    "productInfo": product_info
+                                }
+                                await self._emit_card(product_images, action)
+
+                                # Get response from Claude
+                                response_text = await self._generate_reply([
+                                    {"role": "system", "content": response_prompt},
+                                    {"role": "user", "content": "Generate the response."}
+                                ], profile="product_pitch", fallback=self._fallback_pitch(
+                                    cheaper_product.get('product_name'), cheaper_product.get('color'), formatted_price
+                                ), templated=response_templates.comparison_pitch(
+                                    "cheaper", cheaper_product, previous_product
+                                ) if response_templates.enabled("product_pitch") else None)
+
                                 # Return the cheaper product
                                 return {
                                     "text": response_text,
-                                    "images": [
-                                        {
-                                            "url": cheaper_product.get('images', {}).get('front', ''),
-                                            "alt": f"{cheaper_product.get('product_name')} in {cheaper_product.get('color')} - Front View",
-                                            "type": "product_front"
-                                        },
-                                        {
-                                            "url": cheaper_product.get('images', {}).get('back', ''),
-                                            "alt": f"{cheaper_product.get('product_name')} in {cheaper_product.get('color')} - Back View",
-                                            "type": "product_back"
-                                        }
-                                    ],
-                                    "action": {
-                                        "type": "showProductOptions",
-                                        "productInfo": product_info
-                                    }
+                                    "images": product_images,
+                                    "action": action
                                 }
                             else:
                                 # No cheaper options available
@@ -428,7 +646,8 @@ class PlatoBot:
                             logger.info(f"Processing more expensive option request for {previous_category} in {previous_color}")
 
                             # Check if there are any more expensive options in this category and color
-                            more_expensive_product = self._find_more_expensive_product(
+                            more_expensive_product = self._speculated(
+                                user_id, "more_expensive", self._find_more_expensive_product,
                                 previous_category, 
                                 previous_color, 
                                 previous_price,
@@ -443,7 +662,8 @@ class PlatoBot:
 
                                 # Update OrderState with the more expensive product
                                 order_state.update_product(more_expensive_product)
-                                self.conversation_manager.update_order_state(user_id, order_state)
+                                await self._persist_order_state(user_id, order_state)
+                                self._speculate_after_product(user_id, more_expensive_product)
 
                                 # Generate response
                                 response_prompt = prompts.get_product_response_prompt(
@@ -457,14 +677,6 @@ class PlatoBot:
                                 # Add specific context about this being a more expensive option
                                 response_prompt += f"\n\nImportant: Mention that this is a premium option compared to the {previous_product.get('product_name')} at {previous_product.get('price')}."
 
-                                # Get response from Claude
-                                response = self.claude.call_api([
-                                    {"role": "system", "content": response_prompt},
-                                    {"role": "user", "content": "Generate the response."}
-                                ], temperature=0.7)
-
-                                response_text = utils.clean_response(response)
-
                                 # Create product info for the action
                                 product_info = {
                                     "name": more_expensive_product.get('product_name'),
@@ -478,25 +690,39 @@ class PlatoBot:
                                 # Always show color button
                                 product_info["showColorButton"] = True
 
+                                product_images = [
+                                    {
+                                        "url": more_expensive_product.get('images', {}).get('front', ''),
+                                        "alt": f"{more_expensive_product.get('product_name')} in {more_expensive_product.get('color')} - Front View",
+                                        "type": "product_front"
+                                    },
+                                    {
+                                        "url": more_expensive_product.get('images', {}).get('back', ''),
+                                        "alt": f"{more_expensive_product.get('product_name')} in {more_expensive_product.get('color')} - Back View",
+                                        "type": "product_back"
+                                    }
+                                ]
+                                action = {
+                                    "type": "showProductOptions",
+                                    "productInfo": product_info
+                                }
+                                await self._emit_card(product_images, action)
+
+                                # Get response from Claude
+                                response_text = await self._generate_reply([
+                                    {"role": "system", "content": response_prompt},
+                                    {"role": "user", "content": "Generate the response."}
+                                ], profile="product_pitch", fallback=self._fallback_pitch(
+                                    more_expensive_product.get('product_name'), more_expensive_product.get('color'), formatted_price
+                                ), templated=response_templates.comparison_pitch(
+                                    "more_expensive", more_expensive_product, previous_product
+                                ) if response_templates.enabled("product_pitch") else None)
+
                                 # Return the more expensive product
                                 return {
                                     "text": response_text,
-                                    "images": [
-                                        {
-                                            "url": more_expensive_product.get('images', {}).get('front', ''),
-                                            "alt": f"{more_expensive_product.get('product_name')} in {more_expensive_product.get('color')} - Front View",
-                                            "type": "product_front"
-                                        },
-                                        {
-                                            "url": more_expensive_product.get('images', {}).get('back', ''),
-                                            "alt": f"{more_expensive_product.get('product_name')} in {more_expensive_product.get('color')} - Back View",
-                                            "type": "product_back"
-                                        }
-                                    ],
-                                    "action": {
-                                        "type": "showProductOptions",
-                                        "productInfo": product_info
-                                    }
+                                    "images": product_images,
+                                    "action": action
                                 }
                             else:
                                 # No more expensive options available
@@ -515,7 +741,7 @@ class PlatoBot:
                             order_state.product_selected = False
                             order_state.product_details = None
                             order_state.product_category = category
-                            self.conversation_manager.update_order_state(user_id, order_state)
+                            await self._persist_order_state(user_id, order_state)
 
                             # Enhance the context with preference information
                             context_message = message
@@ -539,274 +765,96 @@ class PlatoBot:
 
                 # Store original intent for future reference (first request only)
                 if order_state.product_details is None:
-                    # Get structured analysis from Claude
-                    analysis_prompt = [
-                        {"role": "system", "content": prompts.PRODUCT_ANALYSIS_PROMPT},
-                        {"role": "user", "content": context_message}
-                    ]
-
-                    enhanced_query = self.claude.call_api(analysis_prompt, temperature=0.3)
-                    logger.info(f"Enhanced query: {enhanced_query}")
-
-                    # Extract category from Claude's analysis
-                    category = None
-                    if "category:" in enhanced_query.lower():
-                        category_line = [line for line in enhanced_query.split('\n') if line.lower().startswith('category:')]
-                        if category_line:
-                            category = category_line[0].split(':', 1)[1].strip()
-
-                    # Extract general color term
-                    general_color = None
-                    if "color:" in enhanced_query.lower():
-                        color_line = [line for line in enhanced_query.split('\n') if line.lower().startswith('color:')]
-                        if color_line:
-                            general_color = color_line[0].split(':', 1)[1].strip()
-                            if general_color.lower() == 'none':
-                                general_color = None
+                    # Get structured analysis from Claude, unless the intent call already returned it
+                    if analysis is None:
+                        analysis = await self._step("product_analysis", self._analyze_product_request, context_message)
+                    logger.info(f"Product analysis: {analysis}")
+
+                    category = analysis.get('category')
+                    if category == utils.CATEGORY_NOT_CARRIED:
+                        category = None
+                    general_color = analysis.get('color')
 
                     # Update original intent
                     order_state.update_original_intent(category=category, general_color=general_color)
                     logger.info(f"Stored original intent: category='{category}', general_color='{general_color}'")
-                    self.conversation_manager.update_order_state(user_id, order_state)
-                else:
-                    # If enhanced_query wasn't passed as a parameter
-                    if not enhanced_query:
-                        # Get structured analysis from Claude
-                        analysis_prompt = [
-                            {"role": "system", "content": prompts.PRODUCT_ANALYSIS_PROMPT},
-                            {"role": "user", "content": context_message}
-                        ]
-
-                        enhanced_query = self.claude.call_api(analysis_prompt, temperature=0.3)
-                        logger.info(f"Enhanced query: {enhanced_query}")
-
-            # Post-process the enhanced query to fill in any missing fields using original intent
-            if enhanced_query and hasattr(order_state, 'original_intent'):
-                try:
-                    query_fields = {}
-                    for line in enhanced_query.split('\n'):
-                        if ':' in line:
-                            key, value = line.split(':', 1)
-                            key = key.strip().lower()
-                            value = value.strip()
-                            query_fields[key] = value
-
-                    modified = False
-                    query_lines = enhanced_query.split('\n')
-
-                    # Check category
-                    if ('category' not in query_fields or query_fields['category'] == 'None' or not query_fields['category']) and order_state.original_intent.get('category'):
-                        for i, line in enumerate(query_lines):
-                            if line.lower().startswith('category:'):
-                                query_lines[i] = f"Category: {order_state.original_intent['category']}"
-                                modified = True
-                                logger.info(f"Restored missing category to: {order_state.original_intent['category']}")
-                                break
-
-                    # Check color
-                    if ('color' not in query_fields or query_fields['color'] == 'None' or not query_fields['color']) and order_state.original_intent.get('general_color'):
-                        for i, line in enumerate(query_lines):
-                            if line.lower().startswith('color:'):
-                                query_lines[i] = f"Color: {order_state.original_intent['general_color']}"
-                                modified = True
-                                logger.info(f"Restored missing color to: {order_state.original_intent['general_color']}")
-                                break
-
-                    # Check material
-                    if ('material' not in query_fields or query_fields['material'] == 'None' or not query_fields['material']) and \
-                       hasattr(order_state, 'rejected_products') and order_state.rejected_products:
-                        last_material = order_state.rejected_products[-1].get('material')
-                        if last_material:
-                            for i, line in enumerate(query_lines):
-                                if line.lower().startswith('material:'):
-                                    query_lines[i] = f"Material: {last_material}"
-                                    modified = True
-                                    logger.info(f"Restored missing material to: {last_material}")
-                                    break
-
-                    if modified:
-                        enhanced_query = '\n'.join(query_lines)
-                        logger.info(f"Enhanced query after restoring missing fields: {enhanced_query}")
-                except Exception as e:
-                    logger.error(f"Error applying original intent: {str(e)}")
+                    await self._persist_order_state(user_id, order_state)
 
-                if enhanced_query and hasattr(order_state, 'original_intent'):
-                    try:
-                        query_fields = {}
-                        for line in enhanced_query.split('\n'):
-                            if ':' in line:
-                                key, value = line.split(':', 1)
-                                key = key.strip().lower()
-                                value = value.strip()
-                                query_fields[key] = value
-
-                        if 'category' in query_fields and (query_fields['category'].lower() == 'none' or not query_fields['category']):
-                            if order_state.original_intent.get('category'):
-                                logger.info(f"Using original category: {order_state.original_intent['category']}")
-                                query_lines = enhanced_query.split('\n')
-                                for i, line in enumerate(query_lines):
-                                    if line.lower().startswith('category:'):
-                                        query_lines[i] = f"Category: {order_state.original_intent['category']}"
-                                        enhanced_query = '\n'.join(query_lines)
-                                        break
-
-                        if 'color' in query_fields and (query_fields['color'].lower() == 'none' or not query_fields['color']):
-                            if order_state.original_intent.get('general_color'):
-                                logger.info(f"Using original color: {order_state.original_intent['general_color']}")
-                                query_lines = enhanced_query.split('\n')
-                                for i, line in enumerate(query_lines):
-                                    if line.lower().startswith('color:'):
-                                        query_lines[i] = f"Color: {order_state.original_intent['general_color']}"
-                                        enhanced_query = '\n'.join(query_lines)
-                                        break
-
-                        logger.info(f"Enhanced query after applying original intent: {enhanced_query}")
-                    except Exception as e:
-                        logger.error(f"Error applying original intent: {str(e)}")
-
-                # Override category in modification flow if needed
-                # Override category in modification flow ONLY IF the new category is None
-                if hasattr(order_state, 'in_product_modification_flow') and order_state.in_product_modification_flow:
-                    if hasattr(order_state, 'original_intent') and order_state.original_intent['category']:
-                        original_category = order_state.original_intent['category']
-                        query_lines = enhanced_query.split('\n')
-                        for i, line in enumerate(query_lines):
-                            if line.lower().startswith('category:'):
-                                category_value = line.split(':', 1)[1].strip()
-                                # Only restore original category if the new one is None or empty
-                                if category_value.lower() == 'none' or not category_value:
-                                    query_lines[i] = f"Category: {original_category}"
-                                    enhanced_query = '\n'.join(query_lines)
-                                    logger.info(f"Restored missing category to original: {original_category}")
-                                break
-
-                    if hasattr(order_state, 'original_intent') and order_state.original_intent['general_color']:
-                        original_color = order_state.original_intent['general_color']
-                        color_specified = "color:" in enhanced_query.lower() and "none" not in enhanced_query.lower().split("color:")[1].split("\n")[0].lower()
-                        if not color_specified:
-                            query_lines = enhanced_query.split('\n')
-                            for i, line in enumerate(query_lines):
-                                if line.lower().startswith('color:'):
-                                    query_lines[i] = f"Color: {original_color}"
-                                    break
-                            enhanced_query = '\n'.join(query_lines)
-                            logger.info(f"Modified query to maintain original color: {enhanced_query}")
-
-                color_specified = "color:" in enhanced_query.lower() and "none" not in enhanced_query.lower().split("color:")[1].split("\n")[0].lower()
-                if not color_specified and hasattr(order_state, 'original_preferences') and 'color' in order_state.original_preferences:
-                    original_color = order_state.original_preferences['color']
-                    logger.info(f"Adding original color preference: {original_color}")
-                    query_lines = enhanced_query.split('\n')
-                    for i, line in enumerate(query_lines):
-                        if line.lower().startswith('color:'):
-                            query_lines[i] = f"Color: {original_color}"
-                            break
-                    enhanced_query = '\n'.join(query_lines)
-                    logger.info(f"Modified query with original color: {enhanced_query}")
-
-                category_specified = "category:" in enhanced_query.lower() and "none" not in enhanced_query.lower().split("category:")[1].split("\n")[0].lower()
-                if not category_specified and order_state.product_category:
+            # The reselection paths above rewrite the message, so the intent call's analysis no longer applies
+            if analysis is None or context_message != message:
+                analysis = await self._step("product_analysis", self._analyze_product_request, context_message)
+                logger.info(f"Product analysis: {analysis}")
+            analysis = dict(analysis)
+
+            # Fill in any missing fields from what we already know about the order
+            try:
+                original_intent = getattr(order_state, 'original_intent', None) or {}
+                # An item we don't carry still falls back to the order's category, as it always has
+                if analysis.get('category') in (None, utils.CATEGORY_NOT_CARRIED) and original_intent.get('category'):
+                    analysis['category'] = original_intent['category']
+                    logger.info(f"Restored missing category to: {original_intent['category']}")
+
+                if not analysis.get('color') and original_intent.get('general_color'):
+                    analysis['color'] = original_intent['general_color']
+                    logger.info(f"Restored missing color to: {original_intent['general_color']}")
+
+                if not analysis.get('material') and getattr(order_state, 'rejected_products', None):
+                    last_material = order_state.rejected_products[-1].get('material')
+                    if last_material:
+                        analysis['material'] = last_material
+                        logger.info(f"Restored missing material to: {last_material}")
+
+                original_preferences = getattr(order_state, 'original_preferences', None) or {}
+                if not analysis.get('color') and original_preferences.get('color'):
+                    analysis['color'] = original_preferences['color']
+                    logger.info(f"Adding original color preference: {original_preferences['color']}")
+
+                if analysis.get('category') in (None, utils.CATEGORY_NOT_CARRIED) and order_state.product_category:
+                    analysis['category'] = order_state.product_category
                     logger.info(f"Adding original category: {order_state.product_category}")
-                    query_lines = enhanced_query.split('\n')
-                    for i, line in enumerate(query_lines):
-                        if line.lower().startswith('category:'):
-                            query_lines[i] = f"Category: {order_state.product_category}"
-                            break
-                    enhanced_query = '\n'.join(query_lines)
-                    logger.info(f"Modified query with original category: {enhanced_query}")
-
-                if any(term in message.lower() for term in ["100% cotton", "cotton", "polyester", "blend", "material"]):
-                    # Improved version for color preservation on material change
-                    # Check if a color is already extracted from the enhanced query
-                    color_specified = False
-                    extracted_color = None
-                    
-                    # Parse the enhanced query to extract the color (if any)
-                    query_lines = enhanced_query.split('\n')
-                    for line in query_lines:
-                        if line.lower().startswith('color:'):
-                            color_value = line.split(':', 1)[1].strip()
-                            if color_value.lower() != 'none' and color_value:
-                                color_specified = True
-                                extracted_color = color_value
-                                logger.info(f"New color extracted from analysis: {extracted_color}")
-                                break
-                    
-                    # Only preserve original color if no new color was specified
-                    if not color_specified and hasattr(order_state, 'original_intent') and order_state.original_intent['general_color']:
-                        preserved_color = order_state.original_intent['general_color']
-                        logger.info(f"Material change detected, no new color specified, preserving original color: {preserved_color}")
-                        
-                        # Update the color in the query
-                        for i, line in enumerate(query_lines):
-                            if line.lower().startswith('color:'):
-                                query_lines[i] = f"Color: {preserved_color}"
-                                break
-                        
-                        enhanced_query = '\n'.join(query_lines)
-                        logger.info(f"Modified query with forced color preservation: {enhanced_query}")
-                    elif color_specified:
-                        # Color is already specified in the query, no need to modify
-                        logger.info(f"Using new color from enhanced query: {extracted_color}")
-                        logger.info(f"No color override needed, query already contains: {extracted_color}")
-                    else:
-                        logger.info(f"No color specified in query and no original color to preserve")
-
-            # Inserted code block for "None" category check in enhanced query
-            if enhanced_query:
-                category_found = None
-                for line in enhanced_query.split('\n'):
-                    if line.lower().startswith('category:'):
-                        category_value = line.split(':', 1)[1].strip()
-                        if category_value.lower() == 'none':
-                            logger.info(f"Detected 'None' category in product selection for user {user_id}")
-                            return {
-                                "text": "Sorry we don't have that item right now. Would you like a different product? We carry T-Shirt, Sweatshirts, Long Sleeve Shirts, Crewnecks, Sweatpants, Polos, Tank Tops, and Shorts.",
-                                "images": []
-                            }
-                        category_found = category_value
-                        break
 
-                logger.info(f"Category extracted from enhanced query for user {user_id}: {category_found}")
+                logger.info(f"Product analysis after applying order context: {analysis}")
+            except Exception as e:
+                logger.error(f"Error applying original intent: {str(e)}")
+
+            # An explicit "None" category even after the order context means we don't carry what they
+            # asked for; with no category at all, select_product defaults to t-shirts
+            if analysis.get('category') == utils.CATEGORY_NOT_CARRIED:
+                logger.info(f"Detected 'None' category in product selection for user {user_id}")
+                return {
+                    "text": "Sorry we don't have that item right now. Would you like a different product? We carry T-Shirt, Sweatshirts, Long Sleeve Shirts, Crewnecks, Sweatpants, Polos, Tank Tops, and Shorts.",
+                    "images": []
+                }
+            logger.info(f"Category from product analysis for user {user_id}: {analysis['category']}")
 
             rejected_products = getattr(order_state, 'rejected_products', None)
-            if hasattr(order_state, 'original_intent'):
-                self.product_tree.set_original_intent_context(order_state.original_intent)
-                logger.info(f"Passing original intent to product tree: {order_state.original_intent}")
-            product_match = self.product_tree.select_product(context_message, enhanced_query, rejected_products)
+            original_intent = getattr(order_state, 'original_intent', None)
+            if original_intent is not None:
+                logger.info(f"Passing original intent to product tree: {original_intent}")
+            # Selection runs off the event loop, alongside any pending Firestore write; the intent is
+            # passed per call since the tree is shared
+            product_match = await self._step(
+                "select_product", self.product_tree.select_product,
+                context_message, analysis, rejected_products, original_intent
+            )
 
             # Check if this was redirected from quantity_collection
             had_quantity = order_state.original_intent.get("had_quantity", False)
 
             # Check if this is a quantity-only message without a specific category
             if had_quantity:
-                has_specific_details = False
-        
-                if enhanced_query:
-                    for line in enhanced_query.split('\n'):
-                        if line.lower().startswith('color:'):
-                            color_value = line.split(':', 1)[1].strip()
-                            if color_value.lower() != 'none' and color_value:
-                                logger.info(f"Found specific color: {color_value}")
-                                has_specific_details = True
-                                break
-                        
-                        if line.lower().startswith('material:'):
-                            material_value = line.split(':', 1)[1].strip()
-                            if material_value.lower() != 'none' and material_value:
-                                logger.info(f"Found specific material: {material_value}")
-                                has_specific_details = True
-                                break
+                has_specific_details = bool(analysis.get('color') or analysis.get('material'))
+                if has_specific_details:
+                    logger.info(f"Found specific color or material: {analysis.get('color')}, {analysis.get('material')}")
         
                 if not has_specific_details:
                     logger.info(f"Quantity-first request without specific details, using special prompt")
                     no_match_prompt = prompts.get_size_first_product_prompt()
-                    response = self.claude.call_api([
+                    response_text = await self._generate_reply([
                         {"role": "system", "content": no_match_prompt},
                         {"role": "user", "content": "Generate a response for a user who mentioned quantities but no specific product type."}
-                    ], temperature=0.7)
+                    ], profile="product_pitch", fallback=rules_fallback.size_first_reply())
             
-                    response_text = utils.clean_response(response)
                     logger.info(f"Generated special no-category response: {response_text[:100]}...")
             
                     return {
@@ -820,12 +868,11 @@ class PlatoBot:
                 if had_quantity:
                     logger.info(f"Generating special no-match response for quantity-first request")
                     no_match_prompt = prompts.get_size_first_product_prompt()
-                    response = self.claude.call_api([
+                    response_text = await self._generate_reply([
                         {"role": "system", "content": no_match_prompt},
                         {"role": "user", "content": "Generate a response for a user who mentioned quantities but no product type."}
-                    ], temperature=0.7)
+                    ], profile="product_pitch", fallback=rules_fallback.size_first_reply())
                     
-                    response_text = utils.clean_response(response)
                     logger.info(f"Generated special no-match response: {response_text[:100]}...")
                     
                     return {
@@ -867,7 +914,8 @@ class PlatoBot:
 
             order_state.in_product_modification_flow = False
 
-            self.conversation_manager.update_order_state(user_id, order_state)
+            await self._persist_order_state(user_id, order_state)
+            self._speculate_after_product(user_id, product_data)
 
             had_quantity = order_state.original_intent.get("had_quantity", False)
             logger.info(f"Checking had_quantity flag before generating response: {had_quantity}")
@@ -892,13 +940,6 @@ class PlatoBot:
                     material=details.get("material", "")
                 )
 
-            response = self.claude.call_api([
-                {"role": "system", "content": response_prompt},
-                {"role": "user", "content": "Generate the response."}
-            ], temperature=0.7)
-
-            response = utils.clean_response(response)
-
             show_color_button = True
 
             product_info = {
@@ -912,24 +953,37 @@ class PlatoBot:
                 "showColorButton": show_color_button
             }
 
-            return {
-                "text": response,
-                "images": [
-                    {
-                        "url": images["front"],
-                        "alt": f"{details['product_name']} in {details['color']} - Front View",
-                        "type": "product_front"
-                    },
-                    {
-                        "url": images["back"],
-                        "alt": f"{details['product_name']} in {details['color']} - Back View",
-                        "type": "product_back"
-                    }
-                ],
-                "action": {
-                    "type": "showProductOptions",
-                    "productInfo": product_info
+            product_images = [
+                {
+                    "url": images["front"],
+                    "alt": f"{details['product_name']} in {details['color']} - Front View",
+                    "type": "product_front"
+                },
+                {
+                    "url": images["back"],
+                    "alt": f"{details['product_name']} in {details['color']} - Back View",
+                    "type": "product_back"
                 }
+            ]
+            action = {
+                "type": "showProductOptions",
+                "productInfo": product_info
+            }
+
+            # Show the product card while the pitch is still being written
+            await self._emit_card(product_images, action)
+
+            # The order state write queued above overlaps the pitch
+            response_text = await self._step("product_pitch", self._generate_reply, [
+                {"role": "system", "content": response_prompt},
+                {"role": "user", "content": "Generate the response."}
+            ], profile="product_pitch", fallback=self._fallback_pitch(details["product_name"], details["color"], formatted_price),
+               templated=self._prepared_pitch(details, formatted_price, size_note=had_quantity))
+
+            return {
+                "text": response_text,
+                "images": product_images,
+                "action": action
             }
 
         except Exception as e:
@@ -939,107 +993,154 @@ class PlatoBot:
                 "images": []
             }
     
+    async def _step(self, name: str, fn, *args, **kwargs):
+        """Run one step of the turn in its task graph and wait for the result."""
+        graph = current_graph()
+        if graph is None:
+            if asyncio.iscoroutinefunction(fn):
+                return await fn(*args, **kwargs)
+            return await asyncio.to_thread(fn, *args, **kwargs)
+        return await graph.add(name, fn, *args, **kwargs)
+
+    async def _write(self, name: str, fn, *args) -> None:
+        """
+        Queue a Firestore write behind the turn's earlier writes without waiting for it.
+
+        The turn's graph is joined before the response is returned, so every write has
+        landed by then; outside a turn the write happens inline.
+        """
+        graph = current_graph()
+        if graph is None:
+            await asyncio.to_thread(fn, *args)
+            return
+        graph.add(name, fn, *args, after=FIRESTORE_WRITES)
+
+    async def _persist_order_state(self, user_id: str, order_state: OrderState) -> None:
+        """Save order state (and its Firestore write) without blocking the event loop."""
+        # Serialized here on the loop: the handler keeps changing order_state while the write waits its turn
+        await self._write("persist_order_state", self.conversation_manager.update_order_state,
+                          user_id, order_state, self.conversation_manager.order_state_snapshot(user_id, order_state))
+
+    async def _add_message(self, user_id: str, role: str, content: str, goal: Optional[str] = None) -> None:
+        """Append to the conversation history (and its Firestore write) without blocking the event loop."""
+        await self._write("add_message", self.conversation_manager.add_message, user_id, role, content, goal,
+                          self.conversation_manager.order_state_snapshot(user_id))
+
+    def _speculated(self, user_id: str, kind: str, fn, *args):
+        """fn(*args), served from the speculative cache when it was precomputed for this conversation."""
+        if self.speculation is None:
+            return fn(*args)
+        return self.speculation.get_or_compute(user_id, (kind,) + args, fn, *args)
+
+    def _speculate_after_product(self, user_id: str, product: Dict) -> None:
+        """Precompute the usual follow-ups to a product card in the background while the user reads it."""
+        if self.speculation is None:
+            return
+        task = asyncio.ensure_future(asyncio.to_thread(self._precompute_follow_ups, user_id, dict(product)))
+        # Keep a reference so the task isn't garbage collected before it runs
+        self._speculation_tasks.add(task)
+        task.add_done_callback(self._speculation_tasks.discard)
+
+    def _precompute_follow_ups(self, user_id: str, product: Dict) -> None:
+        """Store colors, cheaper and pricier alternatives under the same arguments the follow-up turn will use."""
+        try:
+            style_number = product.get('style_number')
+            if style_number:
+                self.speculation.put(user_id, ("colors", style_number), self._get_product_colors(style_number))
+
+            # Mirrors how the reselection path reads the rejected product
+            category = product.get('category')
+            color = product.get('color')
+            try:
+                price = float(product.get('price', '').replace('$', ''))
+            except (AttributeError, ValueError):
+                price = None
+            if category and color and price:
+                args = (category, color, price, product.get('product_name'))
+                self.speculation.put(user_id, ("cheaper",) + args, self._find_cheaper_product(*args))
+                self.speculation.put(user_id, ("more_expensive",) + args, self._find_more_expensive_product(*args))
+        except Exception as e:
+            logger.warning(f"Speculative precompute failed for user {user_id}: {e}")
+
     def _get_product_colors(self, style_number):
         """Get all available colors for a given product style number"""
-        colors = []
-        
-        for category in self.product_tree.categories.values():
-            for product in category.products:
-                if product.get('style_number') == style_number and product.get('color'):
-                    colors.append(product.get('color'))
-        
-        return sorted(colors)
-       
+        return self.product_tree.catalog.colors_of(style_number)
+
     def _get_product_by_style_and_color(self, style_number, color_name):
         """Find a specific product by style number and color name"""
         logger.info(f"Looking for product with style {style_number} in color {color_name}")
-        
-        for category in self.product_tree.categories.values():
-            for product in category.products:
-                if product.get('style_number') == style_number:
-                    product_color = product.get('color', '').lower()
-                    if color_name.lower() in product_color or product_color in color_name.lower():
-                        logger.info(f"Found match: {product.get('product_name')} in {product.get('color')}")
-                        return product
-        
+
+        for product in self.product_tree.catalog.by_style.get(style_number, []):
+            product_color = product.get('color', '').lower()
+            if color_name.lower() in product_color or product_color in color_name.lower():
+                logger.info(f"Found match: {product.get('product_name')} in {product.get('color')}")
+                return product
+
         logger.warning(f"No product found with style {style_number} in color {color_name}")
         return None
 
     def _find_cheaper_product(self, category, color, current_price, current_product_name):
-        """Find a cheaper product in the same category and color."""
-        
+        """Find the cheapest other product in the same category and color that costs less."""
+
         logger.info(f"Looking for a cheaper product than ${current_price} in category {category} and color {color}")
-        
+
         internal_category = self.product_tree.map_category_to_internal(category)
-        
-        if internal_category not in self.product_tree.categories:
+        by_price = self.product_tree.catalog.by_price.get(internal_category)
+        if by_price is None:
             logger.warning(f"Category {internal_category} not found in product tree")
             return None
-        
-        category_products = self.product_tree.categories[internal_category].products
-        
-        cheaper_options = []
-        for product in category_products:
-            if product.get('product_name') == current_product_name:
-                continue
-                
-            product_color = product.get('color', '').lower()
-            if color.lower() not in product_color and product_color not in color.lower():
-                continue
-                
-            product_price_str = product.get('price', '').replace('$', '')
-            try:
-                product_price = float(product_price_str)
-                if product_price < current_price:
-                    logger.info(f"Found cheaper option: {product.get('product_name')} at ${product_price} (vs ${current_price})")
-                    cheaper_options.append((product_price, product))
-            except ValueError:
-                logger.warning(f"Could not parse price for {product.get('product_name')}: {product.get('price')}")
-        
-        if cheaper_options:
-            cheaper_options.sort(key=lambda x: x[0])
-            return cheaper_options[0][1]
-        
+
+        for product_price, product in by_price:
+            if product_price >= current_price:
+                break
+            if self._is_alternative(product, color, current_product_name):
+                logger.info(f"Found cheaper option: {product.get('product_name')} at ${product_price} (vs ${current_price})")
+                return product
+
         return None
-       
+
     def _find_more_expensive_product(self, category, color, current_price, current_product_name):
-        """Find a more expensive product in the same category and color."""
-        
+        """Find the cheapest other product in the same category and color that costs more."""
+
         logger.info(f"Looking for a more expensive product than ${current_price} in category {category} and color {color}")
-        
+
         internal_category = self.product_tree.map_category_to_internal(category)
-        
-        if internal_category not in self.product_tree.categories:
+        by_price = self.product_tree.catalog.by_price.get(internal_category)
+        if by_price is None:
             logger.warning(f"Category {internal_category} not found in product tree")
             return None
-        
-        category_products = self.product_tree.categories[internal_category].products
-        
-        more_expensive_options = []
-        for product in category_products:
-            if product.get('product_name') == current_product_name:
-                continue
-                
-            product_color = product.get('color', '').lower()
-            if color.lower() not in product_color and product_color not in color.lower():
-                continue
-                
-            product_price_str = product.get('price', '').replace('$', '')
-            try:
-                product_price = float(product_price_str)
-                if product_price > current_price:
-                    logger.info(f"Found more expensive option: {product.get('product_name')} at ${product_price} (vs ${current_price})")
-                    more_expensive_options.append((product_price, product))
-            except ValueError:
-                logger.warning(f"Could not parse price for {product.get('product_name')}: {product.get('price')}")
-        
-        if more_expensive_options:
-            more_expensive_options.sort(key=lambda x: x[0])
-            return more_expensive_options[0][1]
-        
+
+        for product_price, product in by_price:
+            if product_price > current_price and self._is_alternative(product, color, current_product_name):
+                logger.info(f"Found more expensive option: {product.get('product_name')} at ${product_price} (vs ${current_price})")
+                return product
+
         return None
-       
-    def _handle_design_placement(self, user_id: str, message: str, order_state) -> dict:
+
+    @staticmethod
+    def _is_alternative(product, color, current_product_name):
+        """A different product than the current one, in a color matching the requested one."""
+        if product.get('product_name') == current_product_name:
+            return False
+        product_color = product.get('color', '').lower()
+        return color.lower() in product_color or product_color in color.lower()
+
+    def reload_catalog(self):
+        """Swap in the catalog file's current version; speculated follow-ups may refer to old products, so they're dropped."""
+        catalog = self.product_tree.reload_catalog()
+        if self.speculation is not None:
+            self.speculation.invalidate()
+        return catalog
+
+    def reload_catalog_if_changed(self) -> bool:
+        """Scheduler job: reload the catalog when its file changed."""
+        if not self.product_tree.reload_catalog_if_changed():
+            return False
+        if self.speculation is not None:
+            self.speculation.invalidate()
+        return True
+
+    async def _ahandle_design_placement(self, user_id: str, message: str, order_state) -> dict:
         """Handle design placement conversation flow."""
         logger.info(f"Handling design placement for user {user_id}: {message}")
     
@@ -1057,24 +1158,23 @@ class PlatoBot:
             design_count = len(order_state.designs) if hasattr(order_state, 'designs') else 0
         
         # Save the updated state
-            self.conversation_manager.update_order_state(user_id, order_state)
+            await self._persist_order_state(user_id, order_state)
         
             logger.info(f"Updated order state after design confirmation - design_uploaded: {order_state.design_uploaded}, placement_selected: {order_state.placement_selected}")
     
         context = self._prepare_context(order_state)
     
-        response = self.claude.call_api([
-        {"role": "system", "content": prompts.DESIGN_PLACEMENT_PROMPT.format(**context)},
-        {"role": "user", "content": message}
-        ], temperature=0.7)
-        response_text = utils.clean_response(response)
+        response_text = await self._generate_reply(
+            prompts.get_design_placement_messages(message, context), profile="reply",
+            fallback=rules_fallback.placement_reply(context)
+        )
     
         return {
             "text": response_text,
             "images": []
         }
        
-    def _handle_quantity_collection(self, user_id: str, message: str, order_state) -> dict:
+    async def _ahandle_quantity_collection(self, user_id: str, message: str, order_state) -> dict:
         """Handle quantity collection."""
         logger.info(f"Order state product details for user {user_id}: {order_state.product_details}")
     
@@ -1089,7 +1189,7 @@ class PlatoBot:
     
         if sizes:
             order_state.update_quantities(sizes)
-            self.conversation_manager.update_order_state(user_id, order_state)
+            await self._persist_order_state(user_id, order_state)
         
             product_type = None
             if order_state.product_category:
@@ -1141,15 +1241,14 @@ class PlatoBot:
             }
         else:
             context = self._prepare_context(order_state)
-            response = self.claude.call_api([
+            response_text = await self._generate_reply([
             {"role": "system", "content": prompts.QUANTITY_PROMPT.format(**context)},
             {"role": "user", "content": message}
-            ], temperature=0.7)
-            response_text = utils.clean_response(response)
+            ], profile="reply", fallback=rules_fallback.quantity_reply())
         
             return {"text": response_text, "images": []}
         
-    def _handle_customer_information(self, user_id: str, message: str, order_state, form_submission=False) -> dict:
+    async def _ahandle_customer_information(self, user_id: str, message: str, order_state, form_submission=False) -> dict:
         """Handle customer information collection and save complete order to Firestore."""
         logger.info(f"Handling customer information for user {user_id}")
 
@@ -1162,19 +1261,19 @@ class PlatoBot:
                 logger.info("Form submission: Order state is complete, proceeding to PayPal invoice creation")
                 try:
                     logger.info("Form submission: Attempting to create PayPal invoice...")
-                    invoice_data = self.paypal.create_invoice(order_state)
+                    invoice_data = await asyncio.to_thread(self.paypal.create_invoice, order_state)
                     logger.info(f"Form submission: PayPal invoice created successfully: {invoice_data}")
 
                     logger.info("Form submission: Updating order state with payment info")
                     order_state.update_payment_info(invoice_data)
                     order_state.update_status('pending_review')
-                    self.conversation_manager.update_order_state(user_id, order_state)
+                    await self._persist_order_state(user_id, order_state)
                     
                     logger.info(f"Form submission: Payment info updated: URL={order_state.payment_url}, ID={order_state.invoice_id}")
 
                     # Save complete order to Firestore using the FirebaseService
                     logger.info(f"Form submission: Saving order to Firestore for user {user_id}")
-                    self.firebase_service.save_completed_order(user_id, order_state.to_dict())
+                    await asyncio.to_thread(self.firebase_service.save_completed_order, user_id, order_state.to_dict())
                     logger.info(f"Form submission: Saved complete order to Firestore for user {user_id}")
 
                     express_info = ""
@@ -1201,12 +1300,12 @@ class PlatoBot:
                     logger.info(f"Form submission: Prompt received by date value: {order_state.received_by_date or 'Not specified'}")
                     logger.info(f"Form submission: Express shipping charge: {getattr(order_state, 'express_shipping_charge', 0)}")
                     
-                    response = self.claude.call_api([
+                    response_text = await self._generate_reply([
                         {"role": "system", "content": formatted_prompt},
                         {"role": "user", "content": "Generate response for form submission"}
-                    ], temperature=0.7)
+                    ], profile="completion", fallback=rules_fallback.completion_reply(order_state),
+                       templated=response_templates.completion(order_state) if response_templates.enabled("completion") else None)
                     
-                    response_text = utils.clean_response(response)
                     
                     if (hasattr(order_state, 'express_shipping_percentage') and 
                         order_state.express_shipping_percentage > 0 and 
@@ -1234,36 +1333,36 @@ class PlatoBot:
                     customer_name=order_state.customer_name or "None",
                     shipping_address=order_state.shipping_address or "None",
                     email=order_state.email or "None",
-                    received_by_date=order_state.received_by_date or "None"
+                    received_by_date=order_state.received_by_date or "None",
+                    missing_step=response_templates.missing_step(order_state) or "None"
                 )
                 
-                response = self.claude.call_api([
+                response_text = await self._generate_reply([
                     {"role": "system", "content": formatted_prompt},
                     {"role": "user", "content": "Generate response for form submission"}
-                ], temperature=0.7)
+                ], profile="reply", fallback=rules_fallback.incomplete_info_reply(order_state),
+                   templated=response_templates.incomplete_info(order_state) if response_templates.enabled("incomplete_info") else None)
                 
-                response_text = utils.clean_response(response)
                 return {"text": response_text, "images": []}
         else:
             extraction_messages = [
-                {"role": "system", "content": prompts.CUSTOMER_INFO_EXTRACTION_PROMPT},
+                {"role": "system", "content": prompts.CUSTOMER_INFO_EXTRACTION_PROMPT, "cache": True},
                 {"role": "user", "content": message}
             ]
-            extraction_response = self.claude.call_api(extraction_messages, temperature=0.1)
-            extracted_info = utils.parse_customer_info(extraction_response)
+            extracted_info = await self.claude.acall_tool(extraction_messages, structured_output.CUSTOMER_INFO_TOOL, profile="extraction") or {}
             
             logger.info(f"Extracted customer info: {extracted_info}")
 
-            if any(value != 'none' for value in extracted_info.values()):
-                name = extracted_info.get('name') if extracted_info.get('name') != 'none' else order_state.customer_name
-                address = extracted_info.get('address') if extracted_info.get('address') != 'none' else order_state.shipping_address
-                email = extracted_info.get('email') if extracted_info.get('email') != 'none' else order_state.email
-                received_by_date = extracted_info.get('received_by_date') if extracted_info.get('received_by_date') != 'none' else order_state.received_by_date
+            if any(extracted_info.values()):
+                name = extracted_info.get('name') or order_state.customer_name
+                address = extracted_info.get('address') or order_state.shipping_address
+                email = extracted_info.get('email') or order_state.email
+                received_by_date = order_state.received_by_date
                 
                 if any([name, address, email, received_by_date]):
                     logger.info(f"Updating order state with: name={name}, address={address}, email={email}, received_by_date={received_by_date}")
                     order_state.update_customer_info(name, address, email, received_by_date)
-                    self.conversation_manager.update_order_state(user_id, order_state)
+                    await self._persist_order_state(user_id, order_state)
 
                 express_info = ""
                 if hasattr(order_state, 'express_shipping_percentage') and order_state.express_shipping_percentage > 0:
@@ -1278,19 +1377,19 @@ class PlatoBot:
                     logger.info("Order state is complete, proceeding to PayPal invoice creation")
                     try:
                         logger.info("Attempting to create PayPal invoice...")
-                        invoice_data = self.paypal.create_invoice(order_state)
+                        invoice_data = await asyncio.to_thread(self.paypal.create_invoice, order_state)
                         logger.info(f"PayPal invoice created successfully: {invoice_data}")
 
                         logger.info("Updating order state with payment info")
                         order_state.update_payment_info(invoice_data)
                         order_state.update_status('pending_review')
-                        self.conversation_manager.update_order_state(user_id, order_state)
+                        await self._persist_order_state(user_id, order_state)
                         
                         logger.info(f"Payment info updated: URL={order_state.payment_url}, ID={order_state.invoice_id}")
 
                         # Save complete order to Firestore using the FirebaseService
                         logger.info(f"Saving order to Firestore for user {user_id}")
-                        self.firebase_service.save_completed_order(user_id, order_state.to_dict())
+                        await asyncio.to_thread(self.firebase_service.save_completed_order, user_id, order_state.to_dict())
                         logger.info(f"Saved complete order to Firestore for user {user_id}")
 
                         logger.info("Formatting order completion prompt")
@@ -1312,10 +1411,11 @@ class PlatoBot:
                         logger.info(f"Prompt payment URL value: {order_state.payment_url or 'Unknown Payment URL'}")
                         logger.info(f"Prompt received by date value: {order_state.received_by_date or 'Not specified'}")
                         
-                        response = self.claude.call_api([
+                        response_text = await self._generate_reply([
                             {"role": "system", "content": formatted_prompt},
                             {"role": "user", "content": "Generate response"}
-                        ], temperature=0.7)
+                        ], profile="completion", fallback=rules_fallback.completion_reply(order_state),
+                           templated=response_templates.completion(order_state) if response_templates.enabled("completion") else None)
                         
                     except Exception as e:
                         logger.error(f"Failed to process completed order: {str(e)}", exc_info=True)
@@ -1337,15 +1437,16 @@ class PlatoBot:
                         customer_name=order_state.customer_name or "None",
                         shipping_address=order_state.shipping_address or "None",
                         email=order_state.email or "None",
-                        received_by_date=order_state.received_by_date or "None"
+                        received_by_date=order_state.received_by_date or "None",
+                        missing_step=response_templates.missing_step(order_state) or "None"
                     )
                     
-                    response = self.claude.call_api([
+                    response_text = await self._generate_reply([
                         {"role": "system", "content": formatted_prompt},
                         {"role": "user", "content": "Generate response"}
-                    ], temperature=0.7)
+                    ], profile="reply", fallback=rules_fallback.incomplete_info_reply(order_state),
+                       templated=response_templates.incomplete_info(order_state) if response_templates.enabled("incomplete_info") else None)
 
-                response_text = utils.clean_response(response)
                 
                 if (hasattr(order_state, 'express_shipping_percentage') and 
                     order_state.express_shipping_percentage > 0 and 
@@ -4,9 +4,22 @@ import os
 import re
 from collections import defaultdict
 import math
+import threading
+from structured_output import product_selection_tool
+from config import (RERANK_GATE_ENABLED, RERANK_CONFIDENCE_THRESHOLD, COLOR_MATCH_METRIC, CATALOG_PATH,
+                    CATALOG_IMAGES_DIR, CATALOG_STORE_PATH)
+from llm_metrics import metrics
+from color_index import ColorIndex, SemanticColorIndex, METRICS
+from catalog import Catalog, CatalogError, file_signature, image_dirs, read_source
+from catalog_store import CatalogStore, compile_store, write_store
+import hashlib
+import json
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+HEX_CODE_RE = re.compile(r'#[0-9A-Fa-f]{6}')
+
 # =============================================================================
 # 1. Comprehensive Semantic Color Map
 # =============================================================================
@@ -303,6 +316,10 @@ def check_sl_constraints(properties: Dict, s: float, l: float) -> bool:
             return False
     return True
 
+# Part of the catalog store's hash: bump it whenever determine_color_family or
+# determine_color_modifiers changes, so stores with the old color features are rebuilt
+COLOR_FEATURES_VERSION = 1
+
 def determine_color_family(hex_color: str) -> str:
     """Determine which color family a hex color belongs to based on HSL values."""
     h, s, l = hex_to_hsl(hex_color)
@@ -376,6 +393,17 @@ class ProductCategory:
         self.products.append(product)
 
 
+class CatalogState:
+    """Everything built from one catalog version; a reload replaces it as a whole."""
+
+    def __init__(self, catalog: Catalog, categories: Dict[str, ProductCategory], color_index: ColorIndex):
+        self.catalog = catalog
+        self.categories = categories
+        self.color_index = color_index
+        # Term-match groups of every indexed color, per color query
+        self.color_match_groups = {}
+
+
 class ProductDecisionTree:
     """Decision tree for product selection with color-based optimization"""
     
@@ -726,38 +754,45 @@ class ProductDecisionTree:
 
     }
     
-    def __init__(self, claude_client=None):
-        self.categories = {}
-        self.product_data = {}
+    def __init__(self, claude_client=None, catalog_path: str = CATALOG_PATH):
         self.claude_client = claude_client
+        self.catalog_path = catalog_path
+        self._reload_lock = threading.Lock()
+        self._rejected_signature = None
+        self._state: Optional[CatalogState] = None
         
         # Cache for product selection to avoid repeated API calls
         self.selection_cache = {}
+
+        # SEMANTIC_COLOR_MAP inverted by term and word, for semantic color matching
+        self.semantic_index = SemanticColorIndex(SEMANTIC_COLOR_MAP)
+
+        # Color distance used to rank products: "hsl" or "ciede2000"
+        self.color_metric = COLOR_MATCH_METRIC if COLOR_MATCH_METRIC in METRICS else "hsl"
+
+        # select_product_with_claude only asks Claude when the local ranking's confidence is below this
+        self.rerank_threshold = RERANK_CONFIDENCE_THRESHOLD if RERANK_GATE_ENABLED else None
         
         # Initialize product data
         self.init_product_data()
-        
-    def parse_sonar_analysis(self, analysis_text: str) -> Dict:
-        """Parse the structured output from Claude's analysis"""
-        preferences = {}
-        patterns = {
-            'category': r'Category:\s*([^\n]+)',
-            'color': r'Color:\s*([^\n]+)',
-            'material': r'Material:\s*([^\n]+)',
-            'brand': r'Brand:\s*([^\n]+)',
-            'price': r'Price Point:\s*([^\n]+)',
-            'fit': r'Fit:\s*([^\n]+)',
-            'size': r'Size:\s*([^\n]+)'
-        }
-        for key, pattern in patterns.items():
-            match = re.search(pattern, analysis_text)
-            if match:
-                value = match.group(1).strip()
-                if value.lower() != "none":
-                    preferences[key] = value
-        logger.info(f"Parsed preferences (excluding None values): {preferences}")
-        return preferences
-    
+
+    @property
+    def catalog(self) -> Catalog:
+        return self._state.catalog
+
+    @property
+    def categories(self) -> Dict[str, "ProductCategory"]:
+        return self._state.categories
+
+    @property
+    def product_data(self) -> Dict[str, Dict]:
+        """Products by "<style number>_<color>"."""
+        return self._state.catalog.by_key
+
+    @property
+    def color_index(self) -> ColorIndex:
+        return self._state.color_index
+
     def map_category_to_internal(self, category: str) -> str:
         """Map Claude's category to our internal category names"""
         category = category.lower()
@@ -777,10 +812,14 @@ class ProductDecisionTree:
         logger.warning(f"Could not map category '{category}' to internal category, defaulting to t-shirt")
         return 't-shirt'
     
-    def get_color_hex(self, color_name: str) -> str:
-        """Get hex code for a color name."""
+    def get_color_hex(self, color_name: str, fallback: bool = True) -> Optional[str]:
+        """Get hex code for a color name; None instead of the default when fallback is False."""
         logger.info(f"get_color_hex called for '{color_name}'")
     
+    # Step 0: Hex codes given in the catalog file
+        if self._state is not None and color_name in self._state.catalog.color_hex:
+            return self._state.catalog.color_hex[color_name]
+
     # Step 1: Check if color_name is directly in the map
         if color_name in self.COLOR_HEX_MAP:
             logger.info(f"Exact match found for '{color_name}': {self.COLOR_HEX_MAP[color_name]}")
@@ -813,9 +852,9 @@ class ProductDecisionTree:
     
     # If not found in the dictionary, ask Claude
         logger.info(f"No matching color found in dictionary for '{color_name}', using Claude")
-        return self.get_color_hex_with_claude(color_name)
+        return self.get_color_hex_with_claude(color_name, fallback)
     
-    def get_color_hex_with_claude(self, color_name: str) -> str:
+    def get_color_hex_with_claude(self, color_name: str, fallback: bool = True) -> Optional[str]:
         """Get hex code for a color name using Claude for complex colors not in the dictionary."""
     # Create a cache key for this color if not already present
         cache_key = color_name.lower().strip()
@@ -835,7 +874,7 @@ class ProductDecisionTree:
     # Make sure we have a Claude client
         if not self.claude_client:
             logger.warning("No Claude client available for color conversion")
-            return self.COLOR_HEX_MAP.get("red", "#FF0000")  # Default to red if no Claude
+            return self.COLOR_HEX_MAP.get("red", "#FF0000") if fallback else None  # Default to red if no Claude
     
         try:
         # Prepare the prompt for Claude
@@ -852,7 +891,7 @@ class ProductDecisionTree:
         
         # Call Claude API
             logger.info(f"Asking Claude for hex code for complex color: '{color_name}'")
-            response = self.claude_client.call_api(prompt, temperature=0.1)
+            response = self.claude_client.call_cascade(prompt, lambda r: HEX_CODE_RE.search(r) is not None, profile="hex")
             logger.info(f"Raw Claude response for '{color_name}': '{response}'")
         
         # Clean up and validate the response
@@ -878,6 +917,8 @@ class ProductDecisionTree:
             logger.error(f"Error getting hex code from Claude: {str(e)}", exc_info=True)
     
     # Fallback to the default color if Claude fails
+        if not fallback:
+            return None
         logger.warning(f"Falling back to default color for '{color_name}'")
         return self.COLOR_HEX_MAP.get("red", "#FF0000")
     
@@ -891,7 +932,9 @@ class ProductDecisionTree:
         logger.info(f"Finding products for color query: '{color_query}' in category '{category}'")
         logger.info(f"Candidate pool size: {len(candidate_pool) if candidate_pool is not None else 'None'}")
 
-        products = candidate_pool if candidate_pool is not None else self.categories[category].products
+        # One catalog version for the whole call, even if a reload swaps in another meanwhile
+        state = self._state
+        products = candidate_pool if candidate_pool is not None else state.categories[category].products
         if not products:
             logger.warning(f"No products found in category '{category}' or candidate pool")
             return []
@@ -919,62 +962,21 @@ class ProductDecisionTree:
 
     # STEP 2: Check for semantic color matching
         logger.info(f"STEP 2: Checking for semantic color matching")
-        semantic_matches = []
-        direct_matches = []  # For when color query directly matches a semantic term
 
     # First, check if color query directly matches any semantic term
-        logger.info(f"  Checking for direct matches with semantic terms")
-        for semantic_term, color_list in SEMANTIC_COLOR_MAP.items():
-            if semantic_term == color_query_lower:
-                logger.info(f"  Direct semantic term match found: '{semantic_term}'")
-                for product in products:
-                    product_color = product['color'].lower()
-                    for color in color_list:
-                        if color.lower() == product_color:
-                            logger.info(f"    Adding product: {product['product_name']} in {product['color']}")
-                            direct_matches.append(product)
-
-        if direct_matches:
-            logger.info(f"Found {len(direct_matches)} direct semantic term matches for '{color_query}'")
-            logger.info(f"======== COLOR MATCHING COMPLETE: DIRECT SEMANTIC MATCHES ========")
-            return direct_matches[:max_products]
-        else:
-            logger.info(f"No direct semantic term matches found for '{color_query}'")
+        direct_colors = self.semantic_index.direct_colors(color_query_lower)
+        if direct_colors:
+            logger.info(f"  Direct semantic term match found: '{color_query_lower}'")
+            direct_matches = [product for product in products if product['color'].lower() in direct_colors]
+            if direct_matches:
+                logger.info(f"Found {len(direct_matches)} direct semantic term matches for '{color_query}'")
+                logger.info(f"======== COLOR MATCHING COMPLETE: DIRECT SEMANTIC MATCHES ========")
+                return direct_matches[:max_products]
+        logger.info(f"No direct semantic term matches found for '{color_query}'")
 
     # Next, look for semantic matches with proper containment checks
-        logger.info(f"  Checking for partial semantic term matches")
-        for semantic_term, color_list in SEMANTIC_COLOR_MAP.items():
-        # Check if the query is in this semantic category
-            semantic_match = False
-            match_reason = ""
-    
-            if semantic_term == color_query_lower:
-                semantic_match = True
-                match_reason = "exact term match"
-            elif semantic_term in color_query_lower.split():
-                semantic_match = True
-                match_reason = f"'{semantic_term}' is a word in the query"
-            elif color_query_lower in semantic_term.split():
-                semantic_match = True
-                match_reason = f"query is a word in '{semantic_term}'"
-    
-            if semantic_match:
-                logger.info(f"  Semantic category match: '{semantic_term}' - {match_reason}")
-                for product in products:
-                    product_color = product['color'].lower()
-                    for color in color_list:
-                        color_lower = color.lower()
-                        if (color_lower == product_color or 
-                            color_lower in product_color.split() or 
-                            product_color in color_lower.split()):
-                            # Check if this product is already in semantic_matches
-                            is_duplicate = any(p.get('product_name') == product.get('product_name') and 
-                                    p.get('color') == product.get('color') for p in semantic_matches)
-                            if not is_duplicate:
-                                logger.info(f"    Adding product: {product['product_name']} in {product['color']}")
-                                semantic_matches.append(product)
-                            else:
-                                logger.info(f"    Skipping duplicate: {product['product_name']} in {product['color']}")
+        semantic_matches = self.semantic_index.partial_matches(color_query_lower, products)
+        logger.info(f"  {len(semantic_matches)} partial semantic term matches")
 
     # STEP 3: Color Family Filtering
         logger.info(f"STEP 3: Checking for color family matches")
@@ -1001,173 +1003,204 @@ class ProductDecisionTree:
                     family_match_reason = f"partial match between '{family}' and '{base_color}'"
                     logger.info(f"  Potential color family match: {family} - {family_match_reason}")
 
+        rows = state.color_index.rows_for(products)
+        family_filter = None
         if target_family:
             logger.info(f"  Target color family selected: '{target_family}' - {family_match_reason}")
-            family_filtered = []
-    
-            for product in products:
-                product_color_hex = self.get_color_hex(product['color'])
-                product_family = determine_color_family(product_color_hex)
-                logger.info(f"  Product: {product['product_name']} in {product['color']} - Family: {product_family}, Hex: {product_color_hex}")
-        
-                if product_family == target_family:
-                    logger.info(f"    Color family match - adding to filtered list")
-                    family_filtered.append(product) 
-    
-            if family_filtered:
-                logger.info(f"Filtered to {len(family_filtered)} products in the '{target_family}' color family")
-                products = family_filtered
+            in_family = state.color_index.family[rows] == target_family
+            if in_family.any():
+                logger.info(f"Filtered to {int(in_family.sum())} products in the '{target_family}' color family")
+                products = [product for product, keep in zip(products, in_family) if keep]
+                rows = rows[in_family]
+                family_filter = target_family
             else:
                 logger.info(f"No products found in the '{target_family}' color family")
         else:
             logger.info(f"No matching color family found for '{base_color}'")
 
-    # STEP 4: HSL Perceptual Distance Matching with Enhanced Prioritization
-        logger.info(f"STEP 4: Performing HSL perceptual distance matching with enhanced prioritization")
-
-    # Use get_color_hex for the target color rather than using the base color
-        target_hex = self.get_color_hex(color_query)
-        logger.info(f"  CRITICAL: Target hex code for full color query '{color_query}': {target_hex}")
-
-        target_hsl = hex_to_hsl(target_hex)
-        logger.info(f"  Target HSL for '{color_query}': H={target_hsl[0]} (hue), S={target_hsl[1]:.2f}% (saturation), L={target_hsl[2]:.2f}% (lightness)")
-
-    # Log color wheel position for context
-        hue_position = ""
-        if 0 <= target_hsl[0] < 30:
-            hue_position = "red/red-orange range"
-        elif 30 <= target_hsl[0] < 60:
-            hue_position = "orange/yellow-orange range"
-        elif 60 <= target_hsl[0] < 90:
-            hue_position = "yellow range"
-        elif 90 <= target_hsl[0] < 150:
-            hue_position = "green range"
-        elif 150 <= target_hsl[0] < 210:
-            hue_position = "cyan/teal range"
-        elif 210 <= target_hsl[0] < 270:
-            hue_position = "blue range"
-        elif 270 <= target_hsl[0] < 330:
-            hue_position = "purple/magenta range"
-        else:
-            hue_position = "pink/red range"
+    # STEP 4: Perceptual Distance Matching with Enhanced Prioritization
+        logger.info(f"STEP 4: Performing {self.color_metric} perceptual distance matching with enhanced prioritization")
 
-        logger.info(f"  Target color hue {target_hsl[0]} is in the {hue_position}")
+    # Use the full color query for the target color rather than the base color
+        target_hsl = state.color_index.target_hsl(color_query)
+        logger.info(f"  Target HSL for '{color_query}': H={target_hsl[0]:.0f} (hue), S={target_hsl[1]:.2f}% (saturation), L={target_hsl[2]:.2f}% (lightness)")
 
-    # NEW: Enhanced prioritization logic based on term matching
-    # Create priority groups for products
-        exact_compound_matches = []  # 1. Exact compound term matches
-        multiple_word_matches = []   # 2. Multiple word matches
-        single_word_matches = []     # 3. Single word matches
-        no_word_matches = []         # 4. No word matches (perceptual only)
+    # Priority groups by term matching: 0 exact compound, 1 multiple word, 2 single word, 3 none
+        groups = self._color_match_groups(state, color_query_lower)[rows]
 
-        logger.info(f"  Categorizing products by new prioritization logic:")
+    # Without modifier penalties, the no-word-match products are simply the nearest colors,
+    # so with CIEDE2000 they come from a nearest-neighbor query instead of scoring them all
+        penalized = "vintage" in color_query_lower or any(m in ("light", "dark", "bright") for m in modifiers)
+        if self.color_metric == "ciede2000" and candidate_pool is None and not penalized:
+            results = self._nearest_color_products(state, category, color_query, products, rows, groups, family_filter, max_products)
+            logger.info(f"Found {len(results)} products for color '{color_query}' by nearest-neighbor search")
+            logger.info(f"======== COLOR MATCHING PROCESS COMPLETE ========")
+            return results
 
-        for product in products:
-            product_color = product['color']
-            product_color_lower = product_color.lower()
-            product_color_terms = product_color_lower.split()
-            product_hex = self.get_color_hex(product_color)
-            product_hsl = hex_to_hsl(product_hex)
-        
-        # Calculate HSL distance for each product
-            distance = hsl_distance(target_hsl, product_hsl)
-        
-            logger.info(f"  Product: '{product_color}' - Hex: {product_hex}, HSL: H={product_hsl[0]}, S={product_hsl[1]:.2f}, L={product_hsl[2]:.2f}")
-            logger.info(f"    Base HSL distance: {distance:.4f}")
-        
-        # Apply modifier adjustments
-            original_distance = distance
-            modifier_applied = False
+        hsl = state.color_index.hsl[rows]
+        distances = state.color_index.distances(color_query, rows, self.color_metric)
 
+    # Modifier penalties, one per modifier in the query
         for modifier in modifiers:
-            if modifier == "light" and product_hsl[2] < 50:
-                distance *= 1.8  # Increased penalty
-                logger.info(f"    Applied 'light' modifier penalty: {original_distance:.4f} → {distance:.4f}")
-                modifier_applied = True
-            elif modifier == "dark" and product_hsl[2] > 50:
-                distance *= 1.8  # Increased penalty
-                logger.info(f"    Applied 'dark' modifier penalty: {original_distance:.4f} → {distance:.4f}")
-                modifier_applied = True
-            elif modifier == "bright" and product_hsl[1] < 60:
-                distance *= 1.8  # Increased penalty
-                logger.info(f"    Applied 'bright' modifier penalty: {original_distance:.4f} → {distance:.4f}")
-                modifier_applied = True
-
-# Add special handling for "vintage" modifier
-                if "vintage" in color_query_lower and "vintage" in product_color_lower:
-    # Apply a 30% bonus (multiply distance by 0.7) for products with "vintage" in their name
-                    distance *= 0.7
-                    logger.info(f"    Applied 'vintage' bonus: {original_distance:.4f} → {distance:.4f}")
-                    modifier_applied = True
-
-            if not modifier_applied and modifiers:
-                logger.info(f"    No modifier penalties applied for {modifiers}")
-        
-        # NEW: Determine which priority group this product belongs to
-            if color_query_lower == product_color_lower:
-            # This should have been caught earlier, but just in case
-                logger.info(f"    Priority: Exact compound match (highest)")
-                exact_compound_matches.append((distance, product))
-            elif len(color_query_terms) > 1 and all(term in product_color_lower for term in color_query_terms):
-            # All query terms exist in the product color (in any order)
-                logger.info(f"    Priority: Multiple word match - all terms present")
-                exact_compound_matches.append((distance, product))
-            elif len(color_query_terms) > 1:
-            # Check how many query terms match
-                matching_terms = [term for term in color_query_terms if term in product_color_terms]
-                if len(matching_terms) > 1:
-                    logger.info(f"    Priority: Multiple word match - {len(matching_terms)} terms match: {matching_terms}")
-                    multiple_word_matches.append((distance, product, len(matching_terms)))
-                elif len(matching_terms) == 1:
-                    logger.info(f"    Priority: Single word match - term: {matching_terms[0]}")
-                    single_word_matches.append((distance, product, matching_terms[0]))
-                else:
-                # No direct term matches, check for substring matches
-                    if any(term in product_color_lower for term in color_query_terms) or any(term in color_query_lower for term in product_color_terms):
-                        logger.info(f"    Priority: Substring match")
-                        single_word_matches.append((distance * 1.2, product, "substring"))  # Slight penalty for substring vs. word
-                    else:
-                        logger.info(f"    Priority: No word match - using perceptual distance only")
-                        no_word_matches.append((distance, product))
-            else:
-            # Single term query, check if it matches any terms in product color
-                if color_query_lower in product_color_terms:
-                    logger.info(f"    Priority: Single word exact match")
-                    single_word_matches.append((distance, product, "exact"))
-                elif color_query_lower in product_color_lower:
-                    logger.info(f"    Priority: Single word substring match")
-                    single_word_matches.append((distance * 1.2, product, "substring"))  # Slight penalty
-                else:
-                    logger.info(f"    Priority: No word match - using perceptual distance only")
-                    no_word_matches.append((distance, product))
-    
-    # Sort each priority group internally
-        exact_compound_matches.sort(key=lambda x: x[0])
-        multiple_word_matches.sort(key=lambda x: (x[2] * -1, x[0]))  # More matching words first, then by distance
-        single_word_matches.sort(key=lambda x: x[0])  # By distance
-        no_word_matches.sort(key=lambda x: x[0])  # By distance
-    
-    # Combine results in priority order
-        results = []
-    
-    # Add products from each group in order of priority
-        results.extend([product for _, product in exact_compound_matches])
-        results.extend([product for _, product, _ in multiple_word_matches])
-        results.extend([product for _, product, _ in single_word_matches])
-        results.extend([product for _, product in no_word_matches])
-    
+            if modifier == "light":
+                distances = np.where(hsl[:, 2] < 50, distances * 1.8, distances)
+            elif modifier == "dark":
+                distances = np.where(hsl[:, 2] > 50, distances * 1.8, distances)
+            elif modifier == "bright":
+                distances = np.where(hsl[:, 1] < 60, distances * 1.8, distances)
+
+    # 30% bonus for vintage colors when a vintage color was asked for
+        if "vintage" in color_query_lower:
+            is_vintage = np.array(["vintage" in state.color_index.lower[row] for row in rows], dtype=bool)
+            distances = np.where(is_vintage, distances * 0.7, distances)
+
+        group = groups[:, 0]
+        matching_terms = groups[:, 1]
+        distances = distances * groups[:, 2]
+
+    # Sort by group, then more matching words first (multiple word group only), then distance
+        order = np.lexsort((distances, np.where(group == 1, -matching_terms, 0), group))
+        results = [products[i] for i in order]
+
     # Log the final prioritized results
         logger.info(f"Final prioritized color matches for '{color_query}':")
         for i, product in enumerate(results[:5]):
             logger.info(f"  {i+1}. {product['product_name']} in {product['color']}")
-    
+
         logger.info(f"Found {len(results)} products for color '{color_query}', returning top {max_products}")
         logger.info(f"======== COLOR MATCHING PROCESS COMPLETE ========")
-    
+
         return results[:max_products]
-    
-    def select_product_with_claude(self, category: str, user_query: str, preferences: Dict) -> Tuple[Optional[Dict], str]:
-        """Use Claude to select the best product from a category based on preferences."""
+
+    def _nearest_color_products(self, state: "CatalogState", category: str, color_query: str, products: List[Dict], rows: np.ndarray,
+                                groups: np.ndarray, family: Optional[str], max_products: int) -> List[Dict]:
+        """
+        get_closest_products_by_color's ranking for the products of a category (optionally one
+        color family) when no modifier penalties apply: products whose color shares words with
+        the query are ranked as usual, and the rest are filled in from the nearest colors.
+        """
+        matched = groups[:, 0] < 3
+        matched_index = np.flatnonzero(matched)
+        group = groups[matched, 0]
+        distances = state.color_index.distances(color_query, rows[matched], "ciede2000") * groups[matched, 2]
+        order = np.lexsort((distances, np.where(group == 1, -groups[matched, 1], 0), group))
+        results = [products[matched_index[i]] for i in order[:max_products]]
+        if len(results) < max_products:
+            category_products = state.categories[category].products
+            by_color = state.color_index.category_products[category]
+            nearest_rows, _ = state.color_index.nearest(
+                category, color_query, max_products - len(results), exclude=np.unique(rows[matched]), family=family
+            )
+            for row in nearest_rows:
+                results.extend(category_products[i] for i in by_color[row])
+        return results[:max_products]
+
+    def _color_match_groups(self, state: "CatalogState", color_query_lower: str) -> np.ndarray:
+        """
+        (group, matching terms, distance factor) of every indexed color for a color query.
+        Grouping only depends on the two color names, so it's worked out once per query.
+        """
+        groups = state.color_match_groups.get(color_query_lower)
+        if groups is None or len(groups) < len(state.color_index.names):
+            if len(state.color_match_groups) >= 512:
+                state.color_match_groups.clear()
+            terms = color_query_lower.split()
+            groups = np.array([
+                self._color_match_group(color_query_lower, terms, color, color_terms)
+                for color, color_terms in zip(state.color_index.lower, state.color_index.terms)
+            ], dtype=float).reshape(-1, 3)
+            state.color_match_groups[color_query_lower] = groups
+        return groups
+
+    @staticmethod
+    def _color_match_group(query: str, query_terms: List[str], color: str, color_terms: List[str]) -> Tuple[int, int, float]:
+        """Priority group of a product color for a color query, its matching term count, and its distance factor."""
+        if query == color:
+            return 0, 0, 1.0
+        if len(query_terms) > 1:
+            if all(term in color for term in query_terms):
+                return 0, 0, 1.0
+            matching_terms = [term for term in query_terms if term in color_terms]
+            if len(matching_terms) > 1:
+                return 1, len(matching_terms), 1.0
+            if len(matching_terms) == 1:
+                return 2, 1, 1.0
+            # Slight penalty for a substring match vs. a word match
+            if any(term in color for term in query_terms) or any(term in query for term in color_terms):
+                return 2, 0, 1.2
+            return 3, 0, 1.0
+        if query in color_terms:
+            return 2, 1, 1.0
+        if query in color:
+            return 2, 0, 1.2
+        return 3, 0, 1.0
+
+    @staticmethod
+    def _material_penalty(requested: str, material: str) -> float:
+        """0 for the exact material, 0.1 for the same kind (the select_product filter rules), else 0.5."""
+        requested, material = requested.lower(), material.lower()
+        if requested == material:
+            return 0.0
+        if "100% cotton" in requested:
+            same_kind = "100% cotton" in material
+        elif "polyester" in requested:
+            same_kind = "polyester" in material
+        elif "blend" in requested or "cotton/poly" in requested:
+            same_kind = "blend" in material or "/50" in material or ("cotton" in material and "poly" in material)
+        else:
+            same_kind = requested in material
+        return 0.1 if same_kind else 0.5
+
+    @staticmethod
+    def _brand_penalty(requested: str, product_name: str) -> float:
+        """0 for the exact brand, 0.1 when one name contains the other, else 0.3."""
+        requested, brand = requested.lower().strip(), product_name.split(' ')[0].lower()
+        if requested == brand:
+            return 0.0
+        return 0.1 if requested in brand or brand in requested else 0.3
+
+    def rank_with_confidence(self, products: List[Dict], preferences: Dict) -> Tuple[Optional[Dict], float]:
+        """
+        The locally best product and how clear-cut that choice is, from 0 (a toss-up) to 1.
+
+        Each product is scored by its HSL distance to the requested color (0 for the exact
+        color name) plus penalties for an inexact material or brand match. Confidence is the
+        score margin to the best product that differs from the winner in a requested
+        attribute; when every product is the same on those attributes, nothing is left to
+        decide and confidence is 1. Ties keep the order of products.
+        """
+        if not products:
+            return None, 0.0
+        color = preferences.get('color')
+        if color:
+            color_index = self.color_index
+            color_distances = color_index.distances(color, color_index.rows_for(products), self.color_metric)
+        scored = []
+        for i, product in enumerate(products):
+            score = 0.0
+            if color and product['color'].lower() != color.lower():
+                score += float(color_distances[i])
+            if preferences.get('material'):
+                score += self._material_penalty(preferences['material'], product['material'])
+            if preferences.get('brand'):
+                score += self._brand_penalty(preferences['brand'], product['product_name'])
+            scored.append((score, product))
+        scored.sort(key=lambda x: x[0])
+        best_score, best = scored[0]
+
+        def attributes(product: Dict) -> tuple:
+            return (
+                product['color'].lower() if color else None,
+                product['material'].lower() if preferences.get('material') else None,
+                product['product_name'].split(' ')[0].lower() if preferences.get('brand') else None
+            )
+
+        runner_up = next((score for score, product in scored[1:] if attributes(product) != attributes(best)), None)
+        confidence = 1.0 if runner_up is None else min(1.0, runner_up - best_score)
+        return best, confidence
+
+    def rerank_candidates(self, category: str, preferences: Dict) -> List[Dict]:
+        """Up to 10 products of the category for select_product_with_claude, pre-filtered by color proximity."""
         if category not in self.categories:
             logger.warning(f"Category {category} not found, defaulting to t-shirt")
             category = 't-shirt'
@@ -1182,12 +1215,30 @@ class ProductDecisionTree:
         if len(products) > 10:
             logger.info(f"Limiting from {len(products)} to 10 products for API efficiency")
             products = products[:10]
+        return products
+
+    def select_product_with_claude(self, category: str, user_query: str, preferences: Dict) -> Tuple[Optional[Dict], str]:
+        """
+        Use Claude to select the best product from a category based on preferences, unless the
+        local ranking is confident enough on its own (see rank_with_confidence).
+        """
+        products = self.rerank_candidates(category, preferences)
+        if self.rerank_threshold is not None:
+            best, confidence = self.rank_with_confidence(products, preferences)
+            if best is not None and confidence >= self.rerank_threshold:
+                logger.info(f"Local ranking is clear (confidence {confidence:.2f}), skipping Claude rerank: "
+                            f"{best['product_name']} in {best['color']}")
+                metrics.increment("rerank_gate", "local")
+                return best, f"Local ranking (confidence {confidence:.2f})"
+            logger.info(f"Local ranking is ambiguous (confidence {confidence:.2f}), asking Claude to rerank")
+            metrics.increment("rerank_gate", "claude")
         product_options = []
-        for product in products:
+        for number, product in enumerate(products, 1):
             material_type = "100% Cotton" if "100% Cotton" in product['material'].lower() else \
                            "Athletic/Polyester" if "polyester" in product['material'].lower() else \
                            "Cotton/Poly Blend"
             product_options.append(
+                f"Option {number}\n"
                 f"Product: {product['product_name']}\n"
                 f"Color: {product['color']}\n"
                 f"Material: {product['material']} (Type: {material_type})\n"
@@ -1227,46 +1278,19 @@ class ProductDecisionTree:
             - If multiple products are equal on higher priorities, use lower priorities as tiebreakers
             - Never sacrifice a better color match for other attributes
             
-            Explain your decision focusing on how it matches the customer's requirements.
-            Then provide the exact product name and color as your final answer in this format:
-            SELECTED: [Product Name] in [Color]
+            Record your choice with the select_product tool: a brief explanation focusing on how
+            it matches the customer's requirements, and the number of the option.
             """},
             {"role": "user", "content": "Select the best product match."}
         ]
+        response = "Error: No product selected"
         try:
-            response = self.claude_client.call_api(prompt, temperature=0.1)
-            match = re.search(r"SELECTED: (.+) in (.+)$", response, re.MULTILINE)
-            if match:
-                product_name = match.group(1).strip()
-                color = match.group(2).strip()
-                logger.info(f"Claude's raw selection: SELECTED: {product_name} in {color}")
-                logger.info(f"Claude's response excerpt: {response[-200:]}")
-                for idx, product in enumerate(products[:5]):
-                    logger.info(f"Product {idx}: '{product['product_name']}' in '{product['color']}'")
-                for product in products:
-                    product_name_norm = re.sub(r'[^\w\s]', '', product['product_name']).lower().strip()
-                    product_color_norm = re.sub(r'[^\w\s]', '', product['color']).lower().strip()
-                    match_name_norm = re.sub(r'[^\w\s]', '', product_name).lower().strip()
-                    match_color_norm = re.sub(r'[^\w\s]', '', color).lower().strip()
-                    if product_name_norm == match_name_norm and product_color_norm == match_color_norm:
-                        return product, response
-                    elif match_name_norm in product_name_norm and match_color_norm in product_color_norm:
-                        return product, response
-                logger.warning(f"Could not find exact product match for '{product_name}' in '{color}'")
-                if 'color' in preferences:
-                    requested_color = preferences['color'].lower()
-                    color_matches = []
-                    logger.info(f"Trying to find color match for: {requested_color}")
-                    for product in products:
-                        product_color = product['color'].lower()
-                        if requested_color in product_color or any(word in product_color for word in requested_color.split()):
-                            logger.info(f"Found color match: {product['product_name']} in {product['color']}")
-                            color_matches.append(product)
-                    if color_matches:
-                        logger.info(f"Fallback to color match: {color_matches[0]['product_name']} in {color_matches[0]['color']}")
-                        return color_matches[0], "Fallback to color match: No exact product match found, but matched requested color."
-            else:
-                logger.warning(f"Could not parse product selection from Claude's response")
+            selection = self.claude_client.call_tool(prompt, product_selection_tool(len(products)), profile="rerank")
+            if selection is not None:
+                product = products[selection["option"] - 1]
+                logger.info(f"Claude selected option {selection['option']}: {product['product_name']} in {product['color']}")
+                return product, selection["reasoning"]
+            logger.warning("No product selection from Claude")
         except Exception as e:
             logger.error(f"Error in Claude product selection: {str(e)}")
             response = f"Error: {str(e)}"
@@ -1287,26 +1311,31 @@ class ProductDecisionTree:
             return products[0], "Fallback to first product in category"
         return None, response
     
-    def select_product(self, query: str, sonar_analysis: str, rejected_products=None) -> Optional[Dict]:
+    def select_product(self, query: str, analysis: Dict, rejected_products=None, original_intent: Optional[Dict] = None) -> Optional[Dict]:
         """
         Select a product based on user query and Claude's analysis using a deduction system.
         Filter products by hard constraints rather than using scores.
+        analysis is the preferences dict from utils.normalize_product_analysis.
+        original_intent overrides the context stored by set_original_intent_context, which
+        is shared state and unsafe when several conversations select concurrently.
         """
         try:
         # Start with comprehensive logging of input
             logger.info(f"=== PRODUCT SELECTION STARTED ===")
             logger.info(f"Query: '{query}'")
-            logger.info(f"Sonar Analysis: '{sonar_analysis}'")
+            logger.info(f"Analysis: '{analysis}'")
         
         # Parse preferences
-            preferences = self.parse_sonar_analysis(sonar_analysis)
+            preferences = {k: v for k, v in (analysis or {}).items() if v and k != 'goal'}
             logger.info(f"Preferences extracted: {preferences}")
             logger.info(f"Color preference: {preferences.get('color', 'None')}")
             logger.info(f"Material preference: {preferences.get('material', 'None')}")
 
-            if 'color' not in preferences and hasattr(self, 'original_intent_context'):
-                if self.original_intent_context.get('general_color'):
-                    original_color = self.original_intent_context.get('general_color')
+            if original_intent is None:
+                original_intent = getattr(self, 'original_intent_context', None)
+            if 'color' not in preferences and original_intent:
+                if original_intent.get('general_color'):
+                    original_color = original_intent.get('general_color')
                     logger.info(f"Missing color in query - adding original color '{original_color}' from intent")
                     preferences['color'] = original_color
         
@@ -1320,13 +1349,16 @@ class ProductDecisionTree:
                 original_category = "T-Shirt"
             logger.info(f"Category identified: {category} (original: {original_category})")
         
+        # One catalog version for the whole selection, even if a reload swaps it meanwhile
+            state = self._state
+
         # Validate category
-            if category not in self.categories:
+            if category not in state.categories:
                 logger.warning(f"Category '{category}' not found in available categories. Defaulting to 't-shirt'")
                 category = 't-shirt'
         
         # Get all products in the category
-            all_category_products = self.categories[category].products
+            all_category_products = state.categories[category].products
             logger.info(f"Starting with {len(all_category_products)} products in category: {category}")
         
         # Step 1: Initialize candidate pool
@@ -1355,15 +1387,15 @@ class ProductDecisionTree:
             # Material filter logic with case-insensitive comparison - fixed the case sensitivity issue!
                 if "100% cotton" in requested_material.lower():
                     logger.info("Looking for 100% cotton products with case-insensitive match")
-                    candidate_products = [p for p in candidate_products if "100% cotton".lower() in p['material'].lower()]
+                    matches_material = lambda material: "100% cotton".lower() in material.lower()
                 elif "polyester" in requested_material:
-                    candidate_products = [p for p in candidate_products if "polyester" in p['material'].lower()]
+                    matches_material = lambda material: "polyester" in material.lower()
                 elif "blend" in requested_material or "cotton/poly" in requested_material:
-                    candidate_products = [p for p in candidate_products if 
-                                    ("blend" in p['material'].lower() or "/50" in p['material'].lower() or 
-                                     ("cotton" in p['material'].lower() and "poly" in p['material'].lower()))]
+                    matches_material = lambda material: ("blend" in material.lower() or "/50" in material.lower() or
+                                                         ("cotton" in material.lower() and "poly" in material.lower()))
                 else:
-                    candidate_products = [p for p in candidate_products if requested_material in p['material'].lower()]
+                    matches_material = lambda material: requested_material in material.lower()
+                candidate_products = self._filter_products(state.catalog, candidate_products, 'material', matches_material)
             
                 logger.info(f"Material filter: {before_count} → {len(candidate_products)} products")
             
@@ -1382,12 +1414,12 @@ class ProductDecisionTree:
                 logger.info(f"Filtering by brand: '{requested_brand}'")
             
                 before_count = len(candidate_products)
-                brand_matched_products = []
-            
-                for product in candidate_products:
-                    product_brand = product['product_name'].split(' ')[0].lower()
-                    if requested_brand in product_brand or product_brand in requested_brand:
-                        brand_matched_products.append(product)
+
+                def matches_brand(product_name: str) -> bool:
+                    product_brand = product_name.split(' ')[0].lower()
+                    return requested_brand in product_brand or product_brand in requested_brand
+
+                brand_matched_products = self._filter_products(state.catalog, candidate_products, 'product_name', matches_brand)
             
                 if brand_matched_products:
                     candidate_products = brand_matched_products
@@ -1542,7 +1574,8 @@ class ProductDecisionTree:
                             logger.info(f"REVISED SELECTION: {selected_product['product_name']} in {selected_product['color']}")
                             break
             
-            # Add category and return
+            # Add category and return, on a copy: the catalog's products are shared (and a store's are read-only)
+                selected_product = dict(selected_product)
                 selected_product['category'] = original_category
                 return selected_product  # Add this line!
         
@@ -1574,6 +1607,14 @@ class ProductDecisionTree:
         logger.info("=== PRODUCT SELECTION FAILED WITH ERROR ===")
         return None
     
+    @staticmethod
+    def _filter_products(catalog: Catalog, products: List[Dict], field: str, predicate) -> List[Dict]:
+        """Products whose field satisfies predicate; with a store, it's checked once per distinct value."""
+        if catalog.store is None or not products:
+            return [p for p in products if predicate(p[field])]
+        keep = catalog.store.mask(field, catalog.rows_of(products), predicate)
+        return [p for p, kept in zip(products, keep.tolist()) if kept]
+
     def get_product_by_style_color(self, style: str, color: str) -> Optional[Dict]:
         """Get product by style number and color"""
         key = f"{style}_{color}"
@@ -1585,533 +1626,86 @@ class ProductDecisionTree:
         logger.info(f"Set original intent context: {intent}")
     
     def init_product_data(self):
-        """Initialize the product data with preset prices and details"""
-        # T-Shirts category
-        self.categories['t-shirt'] = ProductCategory('T-Shirts', claude_client=self.claude_client)
-        
-        # JERZEES - Dri-Power 50/50 T-Shirt
-        jerzees_colors = [
-            "White", "Black", "Aquatic_Blue", "Ash", "Athletic_Heather", "Black_Heather", 
-            "Burnt_Orange", "California_Blue", "Cardinal", "Charcoal_Grey", "Classic_Pink", 
-            "Columbia_Blue", "Cool_Mint", "Cyber_Pink", "Deep_Purple", "Forest_Green", 
-            "Gold", "Irish_Green_Heather", "Island_Yellow", "J._Navy", "Jade", "Kelly", 
-            "Kiwi", "Light_Blue", "Maroon", "Military_Green", "Neon_Green", "Neon_Pink", 
-            "Neon_Yellow", "Oxford", "Royal", "Safety_Green", "Safety_Orange", "Scuba_Blue", 
-            "Silver", "Tennessee_Orange", "True_Red", "Vintage_Heather_Blue", 
-            "Vintage_Heather_Maroon", "Vintage_Heather_Navy", "Vintage_Heather_Red", "Violet"
-        ]
-        for color in jerzees_colors:
-            self.categories['t-shirt'].add_product({
-                'style_number': '29M',
-                'product_name': 'JERZEES - Dri-Power 50/50 T-Shirt',
-                'color': color.replace("_", " "),
-                'price': '$11.36',
-                'material': 'Cotton/Poly Blend',
-                'weight': 'midweight',
-                'fit': 'regular',
-                'has_youth_sizes': True,
-                'has_adult_sizes': True,
-                'youth_sizes': 'XS-XL',
-                'adult_sizes': 'S-5XL',
-                'features': [
-                    'Advanced moisture-management performance',
-                    'Noticeably softer hand & excellent printability',
-                    'Shoulder-to-shoulder taping',
-                    'Tear away label'
-                ],
-                'images': {
-                    'front': f'/productimages/29MR/JERZEES_29MR_{color}_Front_High.jpg',
-                    'back': f'/productimages/29MR/JERZEES_29MR_{color}_Back_High.jpg'
-                }
-            })
-            
-        # Sport-Tek PosiCharge Competitor Tee
-        sporttek_colors = [
-            {"display": "Atomic Blue", "filename": "ST350_Atomic Blue_Flat"},
-            {"display": "Black", "filename": "ST350_Black_flat"},
-            {"display": "Cardinal", "filename": "ST350_cardinal_flat"},
-            {"display": "Carolina Blue", "filename": "ST350_Carolina Blue_Flat"},
-            {"display": "Deep Orange", "filename": "ST350_Deep Orange_Flat"},
-            {"display": "Deep Red", "filename": "ST350_DEEP RED_Flat"},
-            {"display": "Forest Green", "filename": "ST350_Forest Green_Flat"},
-            {"display": "Gold", "filename": "ST350_gold_flat"},
-            {"display": "Grey Concrete", "filename": "ST350_Grey Concrete_Flat"},
-            {"display": "Grey Concrete Heather", "filename": "ST350_Grey Concrete Heather_Flat"},
-            {"display": "Iron Grey", "filename": "ST350_Iron Grey_Flat"},
-            {"display": "Iron Grey Heather", "filename": "ST350_Iron Grey Heather_Flat"},
-            {"display": "Kelly Green", "filename": "ST350_Kelly Green_Flat"},
-            {"display": "Lime Shock", "filename": "ST350_Lime Shock_Flat"},
-            {"display": "Maroon", "filename": "ST350_maroon_flat"},
-            {"display": "Neon Orange", "filename": "ST350_Neon Orange_Flat"},
-            {"display": "Neon Pink", "filename": "ST350_Neon Pink_Flat"},
-            {"display": "Neon Yellow", "filename": "ST350_Neon Yellow_Flat"},
-            {"display": "Purple", "filename": "ST350_purple_flat"},
-            {"display": "Royal", "filename": "ST350_Royal_Flat"},
-            {"display": "Silver", "filename": "ST350_silver_flat"},
-            {"display": "Texas Orange", "filename": "ST350_Texas Orange_Flat"},
-            {"display": "Tropic Blue", "filename": "ST350_Tropic Blue_Flat"},
-            {"display": "True Navy", "filename": "ST350_True Navy_Flat"},
-            {"display": "True Red", "filename": "ST350_True Red_Flat"},
-            {"display": "True Royal Heather", "filename": "ST350_True Royal Heather_Flat"},
-            {"display": "White", "filename": "ST350_white_flat"}
-        ]
-        for color in sporttek_colors:
-            self.categories['t-shirt'].add_product({
-                'style_number': 'ST350',
-                'product_name': 'Sport-Tek PosiCharge Competitor Tee',
-                'color': color["display"],
-                'price': '$12.99',
-                'material': '100% Polyester',
-                'weight': 'lightweight',
-                'fit': 'athletic',
-                'has_youth_sizes': True,
-                'has_adult_sizes': True,
-                'youth_sizes': 'XS-XL',
-                'adult_sizes': 'XS-4XL',
-                'features': [
-                    'Moisture-wicking',
-                    'PosiCharge technology to lock in color',
-                    'Removable tag for comfort and relabeling'
-                ],
-                'images': {
-                    'front': f'/productimages/ST350/{color["filename"]}_Front.jpg',
-                    'back': f'/productimages/ST350/{color["filename"]}_Back.jpg'
-                }
-            })
-            
-        # Bella + Canvas Jersey Tee
-        bella_colors = [
-            "White", "Black", "Ash", "Asphalt", "Berry", "Blue_Storm", "Cardinal", 
-            "Carolina_Blue", "Dark_Grey", "Dusty_Blue", "Forest", "Gold", "Kelly", 
-            "Lavender_Blue", "Light_Violet", "Maroon", "Mauve", "Military_Green", "Mint", 
-            "Mustard", "Natural", "Navy", "Peach", "Pink", "Red", "Royal_Purple", "Silver", 
-            "Soft_Cream", "Solid_Athletic_Grey", "Steel_Blue", "Storm", "Tan", "Teal", 
-            "Team_Purple", "Toast", "True_Royal", "Vintage_Black", "Vintage_White"
-        ]
-        for color in bella_colors:
-            self.categories['t-shirt'].add_product({
-                'style_number': '3001',
-                'product_name': 'Bella + Canvas Jersey Tee',
-                'color': color.replace("_", " "),
-                'price': '$12.99',
-                'material': '100% Cotton',
-                'weight': 'lightweight',
-                'fit': 'retail fit',
-                'has_youth_sizes': True,
-                'has_adult_sizes': True,
-                'youth_sizes': 'XS-XL',
-                'adult_sizes': 'S-5XL',
-                'features': [
-                    'Airlume combed and ring-spun cotton',
-                    'Pre-shrunk',
-                    'Shoulder-to-shoulder taping',
-                    'Tear away label'
-                ],
-                'images': {
-                    'front': f'/productimages/3001/BELLA_+_CANVAS_3001_{color}_Front_High.jpg',
-                    'back': f'/productimages/3001/BELLA_+_CANVAS_3001_{color}_Back_High.jpg'
-                }
-            })
-            
-        # Comfort Colors - Garment-Dyed Heavyweight T-Shirt
-        comfort_colors = [
-            "White", "Black", "Blossom", "Blue_Jean", "Butter", "Chalky_Mint", "Chambray", 
-            "China_Blue", "Crimson", "Crunchberry", "Denim", "Flo_Blue", "Granite", "Grey", 
-            "Ice_Blue", "Island_Green", "Island_Reef", "Lagoon", "Melon", "Neon_Pink", 
-            "Orchid", "Pepper", "Royal_Caribe", "Seafoam", "Terracotta", "Topaz_Blue", 
-            "True_Navy", "Violet", "Washed_Denim", "Watermelon"
-        ]
-        for color in comfort_colors:
-            self.categories['t-shirt'].add_product({
-                'style_number': '1717',
-                'product_name': 'Comfort Colors - Garment-Dyed Heavyweight T-Shirt',
-                'color': color.replace("_", " "),
-                'price': '$14.46',
-                'material': '100% Cotton',
-                'weight': 'heavyweight',
-                'fit': 'relaxed',
-                'has_youth_sizes': True,
-                'has_adult_sizes': True,
-                'youth_sizes': 'XS-XL',
-                'adult_sizes': 'S-5XL',
-                'features': [
-                    'Garment-dyed for that lived in feel',
-                    'Almost no shrinkage',
-                    'Made with OEKO-TEX certified low-impact dyes'
-                ],
-                'images': {
-                    'front': f'/productimages/1717/Comfort_Colors_1717_{color}_Front_High.jpg',
-                    'back': f'/productimages/1717/Comfort_Colors_1717_{color}_Back_High.jpg'
-                }
-            })
-        
-        # Long Sleeve Shirts category
-        self.categories['long-sleeve'] = ProductCategory('Long Sleeve Shirts', claude_client=self.claude_client)
-        gildan_ls_colors = [
-            "White", "Black", "Carolina_Blue", "Forest_Green", "Gold", "Irish_Green", 
-            "Navy", "Purple", "Red", "Royal", "Sport_Grey"
-        ]
-        for color in gildan_ls_colors:
-            self.categories['long-sleeve'].add_product({
-                'style_number': '5400',
-                'product_name': 'Gildan - Heavy Cotton Long Sleeve T-Shirt',
-                'color': color.replace("_", " "),
-                'price': '$13.17',
-                'material': '100% Cotton',
-                'weight': 'heavyweight',
-                'fit': 'classic',
-                'has_youth_sizes': True,
-                'has_adult_sizes': True,
-                'youth_sizes': 'XS-XL',
-                'adult_sizes': 'S-3XL',
-                'features': [
-                    'Taped neck and shoulders for comfort and durability',
-                    'Rib cuffs',
-                    'Tear away label'
-                ],
-                'images': {
-                    'front': f'/productimages/5400/5400_{color}_Front.jpg',
-                    'back': f'/productimages/5400/5400_{color}_Back.jpg'
-                }
-            })
-            
-        sporttek_ls_colors = [
-            {"display": "Atomic Blue", "filename": "ST350LS_Atomic Blue_Flat"},
-            {"display": "Black", "filename": "ST350LS_black_flat"},
-            {"display": "Carolina Blue", "filename": "ST350LS_Carolina Blue_Flat"},
-            {"display": "Deep Red", "filename": "ST350LS_DEEP RED_Flat"},
-            {"display": "Forest Green", "filename": "ST350LS_Forest Green_Flat"},
-            {"display": "Gold", "filename": "ST350LS_gold_flat"},
-            {"display": "Grey Concrete", "filename": "ST350LS_GREY CONCRETE_Flat"},
-            {"display": "Grey Concrete Heather", "filename": "ST350LS_GREY CONCRETE HEATHER_Flat"},
-            {"display": "Iron Grey", "filename": "ST350LS_Iron Grey_Flat"},
-            {"display": "Iron Grey Heather", "filename": "ST350LS_IRON GREY HEATHER_Flat"},
-            {"display": "Lime Shock", "filename": "ST350LS_Lime Shock_Flat"},
-            {"display": "Maroon", "filename": "ST350LS_maroon_flat"},
-            {"display": "Neon Orange", "filename": "ST350LS_Neon Orange_Flat"},
-            {"display": "Neon Pink", "filename": "ST350LS_Neon Pink_Flat"},
-            {"display": "Purple", "filename": "ST350LS_purple_flat"},
-            {"display": "Royal", "filename": "ST350LS_Royal_Flat"},
-            {"display": "Silver", "filename": "ST350LS_silver_flat"},
-            {"display": "True Navy", "filename": "ST350LS_True Navy_Flat"},
-            {"display": "True Red", "filename": "ST350LS_True Red_Flat"},
-            {"display": "True Royal", "filename": "ST350LS_TRUE ROYAL_Flat"},
-            {"display": "White", "filename": "ST350LS_white_flat"}
-        ]
-        for color in sporttek_ls_colors:
-            self.categories['long-sleeve'].add_product({
-                'style_number': 'ST350LS',
-                'product_name': 'Sport-Tek Long Sleeve PosiCharge Competitor Tee',
-                'color': color["display"],
-                'price': '$13.99',
-                'material': '100% Polyester',
-                'weight': 'lightweight',
-                'fit': 'athletic',
-                'has_youth_sizes': True,
-                'has_adult_sizes': True,
-                'youth_sizes': 'XS-XL',
-                'adult_sizes': 'XS-4XL',
-                'features': [
-                    'Moisture-wicking',
-                    'PosiCharge technology to lock in color',
-                    'Removable tag for comfort and relabeling'
-                ],
-                'images': {
-                    'front': f'/productimages/ST350LS/{color["filename"]}_Front.jpg',
-                    'back': f'/productimages/ST350LS/{color["filename"]}_Back.jpg'
-                }
-            })
-        
-        # Hoodies category (maps to "Sweatshirt" in Claude)
-        self.categories['hoodie'] = ProductCategory('Hoodies', claude_client=self.claude_client)
-        hanes_hoodie_colors = [
-            "White", "Black", "Ash", "Carolina_Blue", "Charcoal_Heather", "Deep_Forest", 
-            "Deep_Red", "Deep_Royal", "Gold", "Heather_Navy", "Heather_Red", "Light_Blue", 
-            "Light_Steel", "Maroon", "Navy", "Pale_Pink", "Smoke_Grey", "Teal"
-        ]
-        for color in hanes_hoodie_colors:
-            self.categories['hoodie'].add_product({
-                'style_number': 'P170',
-                'product_name': 'Hanes Ecosmart Hooded Sweatshirt',
-                'color': color.replace("_", " "),
-                'price': '$18.40',
-                'material': 'Cotton/Poly Blend',
-                'weight': 'midweight',
-                'fit': 'standard',
-                'has_youth_sizes': True,
-                'has_adult_sizes': True,
-                'youth_sizes': 'XS-XL',
-                'adult_sizes': 'S-5XL',
-                'features': [
-                    'Patented, low-pill, high-stitch density PrintPro XP fleece',
-                    'Dyed-to-match drawcord',
-                    'Pouch pocket',
-                    'Ribbed cuffs and waistband'
-                ],
-                'images': {
-                    'front': f'/productimages/P170/Hanes_P170_{color}_Front_High.jpg',
-                    'back': f'/productimages/P170/Hanes_P170_{color}_Back_High.jpg'
-                }
-            })
-            
-        # Augusta Sportswear 60/40 Fleece Hoodie
-        augusta_hoodie_colors = [
-            "White", "Black", "Carbon_Heather", "Charcoal_Heather", "Columbia_Blue", 
-            "Dark_Green", "Graphite", "Kelly", "Maroon", "Navy", "Orange", "Power_Pink", 
-            "Purple", "Red", "Royal", "Vegas_Gold"
-        ]
-        for color in augusta_hoodie_colors:
-            self.categories['hoodie'].add_product({
-                'style_number': '5414',
-                'product_name': 'Augusta Sportswear 60/40 Fleece Hoodie',
-                'color': color.replace("_", " "),
-                'price': '$26.50',
-                'material': 'Cotton/Poly Blend',
-                'weight': 'heavyweight',
-                'fit': 'athletic',
-                'has_youth_sizes': True,
-                'has_adult_sizes': True,
-                'youth_sizes': 'S-L',
-                'adult_sizes': 'S-5XL',
-                'features': [
-                    'Jersey lined hood',
-                    'Drawcord in hood',
-                    'Pouch pocket',
-                    'Rib-knit cuffs and bottom band'
-                ],
-                'images': {
-                    'front': f'/productimages/5414/Augusta_Sportswear_5414_{color}_Front_High.jpg',
-                    'back': f'/productimages/5414/Augusta_Sportswear_5414_{color}_Back_High.jpg'
-                }
-            })
-
-        # Hoodies category - add JERZEES NuBlend Hoodie to existing hoodie category
-        jerzees_hoodie_colors = [
-            "Ash", "Athletic_Heather", "Black", "Black_Heather", "Burnt_Orange", 
-            "Charcoal_Grey", "Cyber_Pink", "Deep_Purple", "Forest_Green", "J._Navy", 
-            "Kelly", "Maroon", "Neon_Green", "Neon_Pink", "Royal", "Safety_Green", 
-            "Scuba_Blue", "True_Red", "Vintage_Heather_Blue", "Vintage_Heather_Navy", 
-            "Vintage_Heather_Red", "White"
-        ]
-        for color in jerzees_hoodie_colors:
-            self.categories['hoodie'].add_product({
-        'style_number': '996',
-        'product_name': 'JERZEES - NuBlend Hooded Sweatshirt',
-        'color': color.replace("_", " "),
-        'price': '$20.99',
-        'material': 'Cotton/Poly Blend',
-        'weight': 'midweight',
-        'fit': 'standard',
-        'has_youth_sizes': True,
-        'has_adult_sizes': True,
-        'youth_sizes': 'S-XL',
-        'adult_sizes': 'S-5XL',
-        'features': [
-            'NuBlend pill-resistant fleece',
-            'High-stitch density for smooth printing',
-            '2-ply hood with grommets and drawcord',
-            'Pouch pocket',
-            'Ribbed cuffs and waistband'
-        ],
-        'images': {
-            'front': f'/productimages/996/JERZEES_996MR_{color}_Front_High.jpg',
-            'back': f'/productimages/996/JERZEES_996MR_{color}_Back_High.jpg'
-        }
-        })
-
-            # Tank Top category (new)
-        self.categories['tank-top'] = ProductCategory('Tank Tops', claude_client=self.claude_client)
-        augusta_tank_colors = [
-            "Black", "Columbia_Blue", "Gold", "Graphite", "Kelly", "Lime", "Navy", 
-            "Orange", "Power_Blue", "Power_Yellow", "Purple", "Red", "Royal", 
-            "Silver_Grey", "White"
-        ]
-        for color in augusta_tank_colors:
-            self.categories['tank-top'].add_product({
-            'style_number': '703',
-            'product_name': 'Augusta Sportswear - Wicking Tank Top',
-        'color': color.replace("_", " "),
-        'price': '$14.99',
-        'material': '100% Polyester',
-        'weight': 'lightweight',
-        'fit': 'athletic',
-        'has_youth_sizes': True,
-        'has_adult_sizes': True,
-        'youth_sizes': 'S-L',
-        'adult_sizes': 'S-3XL',
-        'features': [
-            'Moisture-wicking performance fabric',
-            'Self-fabric binding at neck and armholes',
-            'Double-needle hemmed bottom',
-            'Tear away label'
-        ],
-        'images': {
-            'front': f'/productimages/703/Augusta_Sportswear_703_{color}_Front_High.jpg',
-            'back': f'/productimages/703/Augusta_Sportswear_703_{color}_Back_High.jpg'
-        }
-        })
-
-            # Shorts category (new)
-        self.categories['shorts'] = ProductCategory('Shorts', claude_client=self.claude_client)
-        badger_shorts_colors = [
-            "Black", "Brown", "Burnt_Orange", "Cardinal", "Columbia_Blue", "Forest", 
-            "Gold", "Graphite", "Kelly", "Maroon", "Navy", "Purple", "Red", "Royal", 
-            "Silver", "Vegas_Gold", "White"
-        ]
-        for color in badger_shorts_colors:
-            self.categories['shorts'].add_product({
-        'style_number': '7207',
-        'product_name': 'Badger - Mesh Athletic Shorts',
-        'color': color.replace("_", " "),
-        'price': '$15.99',
-        'material': '100% Polyester',
-        'weight': 'lightweight',
-        'fit': 'athletic',
-        'has_youth_sizes': True,
-        'has_adult_sizes': True,
-        'youth_sizes': 'S-L',
-        'adult_sizes': 'S-3XL',
-        'features': [
-            '100% polyester mesh',
-            'Polyester tricot liner',
-            'Athletic cut for superior fit',
-            'Covered elastic waistband with drawcord'
-        ],
-        'images': {
-            'front': f'/productimages/7207/Badger_7207_{color}_Front_High.jpg',
-            'back': f'/productimages/7207/Badger_7207_{color}_Back_High.jpg'
+        """Load the product catalog, from the compiled store when it matches the catalog file"""
+        self._state = self._load_state()
+
+    def _load_state(self) -> CatalogState:
+        """
+        Catalog and color index of the catalog file, read from the memory-mapped store. The
+        store is compiled (and the file validated) first if it's missing or was built from
+        another version of the file, the color tables and features, or the product images.
+        Without CATALOG_STORE_PATH the file is validated and indexed in memory instead.
+        """
+        source, signature = read_source(self.catalog_path)
+        if not CATALOG_STORE_PATH:
+            return self._build_state(Catalog.parse(source, self.catalog_path, CATALOG_IMAGES_DIR, signature))
+        digest = hashlib.sha256(source)
+        digest.update(json.dumps([self.COLOR_HEX_MAP, COLOR_FAMILIES, COLOR_FEATURES_VERSION],
+                                 sort_keys=True).encode("utf-8"))
+        source_hash = digest.hexdigest()
+        store = CatalogStore.open(CATALOG_STORE_PATH, source_hash, CATALOG_IMAGES_DIR)
+        if store is None:
+            # Taken before validating, so an image added meanwhile recompiles the store next time
+            images = image_dirs(CATALOG_IMAGES_DIR)
+            catalog = Catalog.parse(source, self.catalog_path, CATALOG_IMAGES_DIR, signature)
+            data = compile_store(catalog, self._build_color_index(catalog), source_hash, images)
+            try:
+                write_store(CATALOG_STORE_PATH, data)
+                store = CatalogStore.open(CATALOG_STORE_PATH, source_hash)
+                logger.info(f"Compiled catalog store {CATALOG_STORE_PATH} ({len(data)} bytes)")
+            except OSError as e:
+                logger.warning(f"Could not write catalog store {CATALOG_STORE_PATH}, keeping it in memory: {e}")
+            if store is None:
+                store = CatalogStore.from_bytes(data)
+        return self._build_state(store.catalog(self.catalog_path, signature))
+
+    def _build_state(self, catalog: Catalog) -> CatalogState:
+        categories = {
+            key: ProductCategory(catalog.category_names[key], products, claude_client=self.claude_client)
+            for key, products in catalog.categories.items()
         }
-        })    
-        
-        # Crewneck sweatshirts
-        self.categories['crewneck'] = ProductCategory('Crewneck Sweatshirts', claude_client=self.claude_client)
-        gildan_crewneck_colors = [
-            "White", "Black", "Dark_Heather", "Forest", "Maroon", "Navy", 
-            "Red", "Royal", "Safety_Pink", "Sport_Grey"
-        ]
-        for color in gildan_crewneck_colors:
-            self.categories['crewneck'].add_product({
-                'style_number': '18000',
-                'product_name': 'Gildan - Heavy Blend Sweatshirt',
-                'color': color.replace("_", " "),
-                'price': '$14.95',
-                'material': 'Cotton/Poly Blend',
-                'weight': 'heavyweight',
-                'fit': 'classic',
-                'has_youth_sizes': True,
-                'has_adult_sizes': True,
-                'youth_sizes': 'XS-XL',
-                'adult_sizes': 'XS-5XL',
-                'features': [
-                    'Made with finer yarns and new MVS Air spinning technology',
-                    '1x1 rib with spandex for enhanced stretch and recovery',
-                    'Tear away label'
-                ],
-                'images': {
-                    'front': f'/productimages/18000/Gildan_18000_{color}_Front_High.jpg',
-                    'back': f'/productimages/18000/Gildan_18000_{color}_Back_High.jpg'
-                }
-            })
-            
-        # Sweatpants
-        self.categories['sweatpants'] = ProductCategory('Sweatpants', claude_client=self.claude_client)
-        jerzees_sweatpants_colors = [
-            "Black", "Ash", "Forest_Green", "J._Navy", "Maroon", "Oxford", "Royal", "True_Red"
-        ]
-        for color in jerzees_sweatpants_colors:
-            self.categories['sweatpants'].add_product({
-                'style_number': '973M',
-                'product_name': 'JERZEES - NuBlend Sweatpants',
-                'color': color.replace("_", " "),
-                'price': '$17.50',
-                'material': 'Cotton/Poly Blend',
-                'weight': 'heavyweight',
-                'fit': 'relaxed',
-                'has_youth_sizes': True,
-                'has_adult_sizes': True,
-                'youth_sizes': 'S-XL',
-                'adult_sizes': 'S-3XL',
-                'features': [
-                    'NuBlend pill-resistant fleece',
-                    'High-stitch density for a smooth printing canvas',
-                    'Double-needle stitched covered waistband with internal drawcord',
-                    'Elastic bottom leg openings'
-                ],
-                'images': {
-                    'front': f'/productimages/973M/JERZEES_973MR_{color}_Front_High.jpg',
-                    'back': f'/productimages/973M/JERZEES_973MR_{color}_Back_High.jpg'
-                }
-            })
-
-        # Polos category
-        self.categories['polo'] = ProductCategory('Polos', claude_client=self.claude_client)
-
-        # Gildan DryBlend Polo (8800)
-        gildan_polo_colors = [
-            "Black", "Gold", "Light_Blue", "Maroon", "Navy", 
-            "Red", "Royal", "Sport_Grey", "White"
-        ]
-        for color in gildan_polo_colors:
-            self.categories['polo'].add_product({
-                'style_number': '8800',
-                'product_name': 'Gildan - DryBlend Pique Polo',
-                'color': color.replace("_", " "),
-                'price': '$15.99',
-                'material': 'Cotton/Poly Blend',
-                'weight': 'midweight',
-                'fit': 'classic',
-                'has_youth_sizes': True,
-                'has_adult_sizes': True,
-                'youth_sizes': 'S-XL',
-                'adult_sizes': 'S-5XL',
-                'features': [
-                'DryBlend moisture-wicking technology',
-                'Three-button placket',
-                'Contoured welt collar and cuffs',
-                'Tear away label'
-            ],
-                'images': {
-                'front': f'/productimages/8800/Gildan_8800_{color}_Front_High.jpg',
-                'back': f'/productimages/8800/Gildan_8800_{color}_Back_High.jpg'
-            }
-        })
-
-
-# AllPro Performance Polo (41800)
-        allpro_polo_colors = [
-            "Black", "Carolina_Blue", "Forest_Green", "Greystone", "Heather_Navy",
-            "Heather_Steel", "Maroon", "Navy", "Pacific_Blue", "Red", "Royal", "White"
-            ]
-        for color in allpro_polo_colors:
-            self.categories['polo'].add_product({
-                'style_number': '41800',
-                'product_name': 'AllPro - Performance Polo',
-                'color': color.replace("_", " "),
-                'price': '$16.99',
-                'material': '100% Polyester',
-                'weight': 'lightweight',
-                'fit': 'standard',
-                'has_youth_sizes': True,
-                'has_adult_sizes': True,
-                'youth_sizes': 'S-XL',
-                'adult_sizes': 'S-3XL',
-                'features': [
-                    'Moisture-management properties',
-                    'Snag resistant',
-                    'Three-button placket',
-                    'UPF rating of 50',
-                    'Tear away label'
-                ],
-                'images': {
-                    'front': f'/productimages/41800/AllPro_41800_{color}_Front_High.jpg',
-                    'back': f'/productimages/41800/AllPro_41800_{color}_Back_High.jpg'
-                }
-            })
-
-        # Map all products to make lookup easier by style number and color
-        for category in self.categories.values():
-            for product in category.products:
-                style = product['style_number']
-                color = product['color']
-                key = f"{style}_{color}"
-                self.product_data[key] = product
\ No newline at end of file
+        if catalog.store is None:
+            color_index = self._build_color_index(catalog)
+        else:
+            # Color features precomputed in the store, shared with the other workers
+            names, features = catalog.store.color_features()
+            color_index = ColorIndex(names, self._color_hex_of(catalog), determine_color_family,
+                                     determine_color_modifiers, features=features)
+            color_index.set_category_rows(catalog.store.category_color_rows())
+        return CatalogState(catalog, categories, color_index)
+
+    def _build_color_index(self, catalog: Catalog) -> ColorIndex:
+        # Color features for every catalog color, computed once for get_closest_products_by_color
+        return ColorIndex.build(catalog.categories, self._color_hex_of(catalog),
+                                determine_color_family, determine_color_modifiers)
+
+    def _color_hex_of(self, catalog: Catalog):
+        # No fallback here: ColorIndex substitutes its own and doesn't memoize it
+        return lambda color: catalog.color_hex.get(color) or self.get_color_hex(color, fallback=False)
+
+    def reload_catalog(self) -> Catalog:
+        """
+        Load the catalog file again and swap it in. Requests already running finish on the
+        version they started with; raises CatalogError and keeps the current one if the file is invalid.
+        """
+        with self._reload_lock:
+            state = self._load_state()
+            previous = self._state.catalog
+            self._state = state
+        logger.info(f"Catalog reloaded: v{previous.version} -> v{state.catalog.version}, "
+                    f"{len(previous.by_key)} -> {len(state.catalog.by_key)} products")
+        return state.catalog
+
+    def reload_catalog_if_changed(self) -> bool:
+        """Reload the catalog if its file changed since it was loaded; True if a new version was swapped in."""
+        signature = file_signature(self.catalog_path)
+        if signature is None or signature in (self._state.catalog.signature, self._rejected_signature):
+            return False
+        try:
+            self.reload_catalog()
+            return True
+        except CatalogError as e:
+            # Not retried until the file changes again
+            self._rejected_signature = signature
+            logger.error(f"Keeping catalog v{self._state.catalog.version}: {e}")
+            return False
@@ -1,9 +1,6 @@
 # Main prompt for understanding customer intent and guiding the conversation
 INTENT_UNDERSTANDING_PROMPT = """
-You are Plato, a goal-oriented print shop AI sales assistant guiding customers through their custom apparel order to complete the sale. Your immediate task is to analyze this customer message:
-
-Current order state: {order_state_summary}
-Previous context: {conversation_history}
+You are Plato, a goal-oriented print shop AI sales assistant guiding customers through their custom apparel order to complete the sale. Your immediate task is to analyze the customer message that follows, using the current order state and previous context provided with it.
 
 Determine which stage this message most relates to by matching it to one of these core stages:
 
@@ -31,17 +28,19 @@ Consider:
 - If a goal is partially complete, factor in what's known
 - When goals overlap, choose the most immediate need
 
-Output ONLY ONE of these four stage names with no additional text:
-- product_selection
-- quantity_collection
-- design_placement
+Record the stage with the record_stage tool.
 """
 
+# Per-turn context for the intent prompts, kept separate so the static prompt can be cached
+INTENT_CONTEXT_PROMPT = """
+Current order state: {order_state_summary}
+Previous context: {conversation_history}
+"""
 
-PRODUCT_ANALYSIS_PROMPT = """
-You are Plato, a print shop AI Customer Service Assistant. Your task is to analyze a customer's request for apparel products and extract key information.
 
-MOST IMPORTANT: Categorize the garment into EXACTLY ONE of these predefined categories, only select none if you are sure we do not have the product they are requesting (for example "hats"):
+# Shared by the product analysis and combined intent + analysis prompts
+PRODUCT_FIELDS_GUIDE = """
+MOST IMPORTANT: Categorize the garment into EXACTLY ONE of these predefined categories, only select "None" if you are sure we do not have the product they are requesting (for example "hats"):
 - T-Shirt
 - Sweatshirt
 - Long Sleeve Shirt
@@ -52,29 +51,46 @@ MOST IMPORTANT: Categorize the garment into EXACTLY ONE of these predefined cate
 - Shorts
 - None
 
-For material, ONLY use one of these categories if mentioned:
-- 100% Cotton (soft, natural fabric)
-- Athletic/Polyester (moisture-wicking, performance fabric)
-- Cotton/Poly Blend (mixed fabric)
-- None (if not specified)
+For material, ONLY use one of these if mentioned:
+- "100% Cotton" (soft, natural fabric)
+- "100% Polyester" (athletic, moisture-wicking, performance fabric)
+- "Cotton/Poly Blend" (mixed fabric)
 
 For all other preferences, identify:
 1. Color preferences (be specific and prioritize this)
-2. Any specific brand preferences mentioned 
-3. Price point indicators (budget/affordable vs premium/quality)
+2. Any specific brand preferences mentioned
+3. Price point indicators: "Affordable", "Quality" or "Premium"
 4. Fit preferences
 5. Size requirements
 
-Your response MUST follow this EXACT format:
-Category: [MUST be one of the predefined categories listed above]
-Color: [specific color or "None"]
-Material: [MUST be one of: "100% Cotton", "100% Polyester", "Cotton/Poly Blend", or "None"]
-Brand: [brand or "None"]
-Price Point: [Must be one of: "Affordable", "Qualty", "Premium", or "None"]
-Fit: [fit or "None"]
-Size: [size or "None"]
+Use null for anything the customer did not mention.
+"""
+
+PRODUCT_ANALYSIS_PROMPT = """
+You are Plato, a print shop AI Customer Service Assistant. Your task is to analyze a customer's request for apparel products and extract key information.
+""" + PRODUCT_FIELDS_GUIDE + """
+Record the preferences with the record_product_analysis tool.
 """
 
+# Intent classification and product analysis in one call, so a product request doesn't pay for two round trips
+INTENT_ANALYSIS_PROMPT = """
+You are Plato, a goal-oriented print shop AI sales assistant guiding customers through their custom apparel order. Analyze the customer message that follows, using the current order state and previous context provided with it.
+
+First decide which stage the message relates to:
+- product_selection: exploring product options, asking about specific items, materials, styles, colors or pricing (the default)
+- design_placement: ONLY for the message "I'd like to share this design with you"
+- quantity_collection: ONLY for size inputs in the format "x X" where x is a quantity and X a size, e.g. "30 L" or "10 M, 10 L, 10 XL"
+
+Then extract the customer's product preferences from the message, even when the stage is not product_selection.
+""" + PRODUCT_FIELDS_GUIDE + """
+Record the stage and preferences with the record_intent_analysis tool.
+"""
+
+# Appended to INTENT_ANALYSIS_PROMPT when several conversations are classified in one call
+INTENT_ANALYSIS_BATCH_PROMPT = """
+The customer messages below are numbered items from different customers' conversations, each with its own order state and previous context. Analyze every item on its own, exactly as described above, without letting one item influence another.
+Instead of one record_intent_analysis call per message, record all of them in a single record_intent_analyses call, with one result per item number.
+"""
 
 # Keep original get_response_prompt exactly as is
 # Update the function definition to include the category parameter
@@ -108,16 +124,12 @@ Your response should be direct, brief, and ready to show to the customer.
 DESIGN_PLACEMENT_PROMPT = """
 You are Plato, a sales-focused print shop assistant. The customer has just COMPLETED placing their design on a product using our self-service tool. The message "I'd like to share this design with you" is system-generated and indicates they've saved their design placement.
 
-Context:
-Product: {product_context}
-Category: {product_category}
-Design: {design_context}
-Previous: {previous_context}
+The product, category, design and size ranges are given in the context that follows.
 
 Create a brief response that:
 1. Acknowledge their completed design placement with a positive, naturally-varied compliment
-2. Use a naturally varied phrase like "Your design looks amazing on the {product_category}!" or similar
-3. Then follow with this sentence: "This {product_category} comes in both youth sizes {youth_sizes} and adult sizes {adult_sizes}. How many of each size would you like to order?"
+2. Use a naturally varied phrase like "Your design looks amazing on the [category]!" or similar
+3. Then follow with this sentence: "This [category] comes in both youth sizes [youth sizes] and adult sizes [adult sizes]. How many of each size would you like to order?"
 
 Important guidelines:
 - Keep your response to 2 sentences
@@ -127,6 +139,17 @@ Important guidelines:
 - Focus on moving the sale forward to quantity collection
 """
 
+# Per-turn context for DESIGN_PLACEMENT_PROMPT
+DESIGN_PLACEMENT_CONTEXT_PROMPT = """
+Context:
+Product: {product_context}
+Category: {product_category}
+Design: {design_context}
+Previous: {previous_context}
+Youth sizes: {youth_sizes}
+Adult sizes: {adult_sizes}
+"""
+
 QUANTITY_PROMPT = """
 You are Plato, collecting quantity information.
 Product: {product_context}
@@ -150,38 +173,24 @@ Your ONLY task is to analyze customer messages and extract name, address, and em
 CRITICAL RULES:
 - Extract ONLY if information is present and you are highly confident
 - Do not make assumptions or guess
-- Follow exact formatting requirements
-- Do not include any other text or explanations
-
-OUTPUT FORMAT:
-CUSTOMER_INFO:
-NAME: [full name if present with high confidence, or "none"]
-ADDRESS: [complete address with city, state, zip if all present, or "none"]
-EMAIL: [valid email address if present, or "none"]
+- Use null for any field that is missing or uncertain
 
 VALIDATION RULES:
 - Names: Must be full name (first and last)
 - Addresses: Must have street, city, state, and zip
 - Emails: Must contain @ and valid domain structure
 
-Example responses:
+Record the details with the record_customer_info tool.
+
+Examples:
 For: "Hi, I'm John Smith from 123 Main St, Boston MA 02108, email is john@email.com"
-CUSTOMER_INFO:
-NAME: John Smith
-ADDRESS: 123 Main St, Boston MA 02108
-EMAIL: john@email.com
+name: "John Smith", address: "123 Main St, Boston MA 02108", email: "john@email.com"
 
 For: "My name is Jane Doe"
-CUSTOMER_INFO:
-NAME: Jane Doe
-ADDRESS: none
-EMAIL: none
+name: "Jane Doe", address: null, email: null
 
 For: "Here's my info: bob@example.com"
-CUSTOMER_INFO:
-NAME: none
-ADDRESS: none
-EMAIL: bob@example.com
+name: null, address: null, email: "bob@example.com"
 """
 
 INCOMPLETE_INFO_PROMPT = """You are Plato, a helpful print shop assistant. 
@@ -190,10 +199,12 @@ Current order information:
 Name: {customer_name}
 Address: {shipping_address}
 Email: {email}
+Unfinished order step: {missing_step}
 
 If a field shows 'None' or is empty, you must request ONLY that specific information.
 Be direct and polite. Do not make small talk or add unnecessary text.
-If multiple fields are missing, only ask for one at a time, prioritizing in this order: name -> address -> email."""
+If multiple fields are missing, only ask for one at a time, prioritizing in this order: name -> address -> email.
+If name, address and email are all present, thank the customer and tell them we still need the unfinished order step; only ask them to confirm their details when that step is 'None'."""
 
 ORDER_COMPLETION_PROMPT = """You are Plato, providing final order confirmation.
 
@@ -344,7 +355,43 @@ def get_intent_prompt(message: str, context: dict) -> str:
     """
     Create a prompt for intent/goal understanding.
     """
-    return create_context_aware_prompt(INTENT_UNDERSTANDING_PROMPT, context)  
+    return INTENT_UNDERSTANDING_PROMPT + create_context_aware_prompt(INTENT_CONTEXT_PROMPT, context)
+
+def get_intent_analysis_messages(message: str, context: dict) -> list:
+    """
+    Create combined intent + product analysis messages, with the static prompt marked for
+    prompt caching and the per-turn context after it.
+    """
+    return [
+        {"role": "system", "content": INTENT_ANALYSIS_PROMPT, "cache": True},
+        {"role": "system", "content": create_context_aware_prompt(INTENT_CONTEXT_PROMPT, context)},
+        {"role": "user", "content": message}
+    ]
+
+def get_intent_analysis_batch_messages(items: list) -> list:
+    """
+    Intent + product analysis messages for several conversations at once; items are
+    (message, context) pairs, numbered from 1 in the prompt.
+    """
+    numbered = [
+        f"Item {number}\n{create_context_aware_prompt(INTENT_CONTEXT_PROMPT, context).strip()}\nCustomer message: {message}"
+        for number, (message, context) in enumerate(items, 1)
+    ]
+    return [
+        {"role": "system", "content": INTENT_ANALYSIS_PROMPT, "cache": True},
+        {"role": "system", "content": INTENT_ANALYSIS_BATCH_PROMPT, "cache": True},
+        {"role": "user", "content": "\n\n".join(numbered)}
+    ]
+
+def get_design_placement_messages(message: str, context: dict) -> list:
+    """
+    Create design placement messages with the static prompt marked for prompt caching.
+    """
+    return [
+        {"role": "system", "content": DESIGN_PLACEMENT_PROMPT, "cache": True},
+        {"role": "system", "content": create_context_aware_prompt(DESIGN_PLACEMENT_CONTEXT_PROMPT, context)},
+        {"role": "user", "content": message}
+    ]
 
 def get_product_preference_inquiry_prompt(previous_product_details: dict) -> str:
     """
@@ -359,4 +406,38 @@ def get_product_preference_inquiry_prompt(previous_product_details: dict) -> str
         previous_product_category=previous_product_details.get('category', 'product'),
         previous_product_price=previous_product_details.get('price', 'Unknown'),
         previous_product_material=material
-    )
\ No newline at end of file
+    )
+
+
+PITCH_COPY_PROMPT = """
+You are Plato, a helpful and enthusiastic print shop AI assistant. Write product pitches that are shown
+when a customer is offered this product for their custom order:
+- Product: {product_name}
+- Color: {color}
+- Category: {category}
+- Material: {material}
+- Features: {features}
+
+Write {variants} different pitches. Each one must:
+1. Show enthusiasm about the product as a good match for a custom order
+2. Mention the product name, color and material naturally
+3. Present the price as "Plato's Price of {{price}}", writing the placeholder {{price}} literally; it is filled in later
+4. Refer to the product using its correct category (not just "shirt")
+5. Be at most 2 sentences, professional but conversational, and not mention that you are an AI
+
+Vary the wording between pitches. Respond with ONLY a JSON array of {variants} strings.
+"""
+
+def get_pitch_copy_messages(product: dict, category: str, variants: int) -> list:
+    """Messages asking for several pre-generated pitches for one catalog product."""
+    return [
+        {"role": "system", "content": PITCH_COPY_PROMPT.format(
+            product_name=product.get('product_name'),
+            color=product.get('color'),
+            category=category,
+            material=product.get('material') or "not specified",
+            features="; ".join(product.get('features') or []) or "none listed",
+            variants=variants
+        )},
+        {"role": "user", "content": "Write the pitches."}
+    ]
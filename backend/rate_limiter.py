@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from deadline import current_deadline
+
+logger = logging.getLogger(__name__)
+
+class RateLimitExceeded(Exception):
+    """Raised when a request would have to queue longer than allowed, so it is shed instead of sent."""
+
+@dataclass
+class Reservation:
+    """Capacity taken for one request, settled against the real usage once the response arrives."""
+    # What was actually taken from each bucket, i.e. the estimate clipped to the bucket's limit
+    input_tokens: int
+    output_tokens: int
+    wait_seconds: float = 0.0
+
+def estimate_input_tokens(messages: List[Dict]) -> int:
+    """Rough input token count (~4 characters per token) used to reserve input TPM before sending."""
+    return sum(len(str(msg.get("content", ""))) for msg in messages) // 4 + 1
+
+class RateLimiter:
+    """
+    Client-side token buckets for requests, input tokens and output tokens per minute.
+
+    Each bucket refills continuously at limit/60 per second. A request takes its cost from
+    every bucket up front and may drive a bucket negative; the deficit is the time it has to
+    wait before sending, so queued requests go out in arrival order at the configured rate.
+    Requests that would wait longer than max_wait_seconds (or past the turn deadline) are shed.
+
+    Output tokens are reserved at max_tokens, as Anthropic does, and the difference is
+    refunded when the real usage is known. With a state path, bucket levels live in a SQLite
+    file so every gunicorn worker on the host draws from the same budget.
+    """
+
+    PAUSE = "paused_until"
+
+    def __init__(self, name: str, requests_per_minute: int = 0, input_tokens_per_minute: int = 0,
+                 output_tokens_per_minute: int = 0, max_wait_seconds: float = 10.0, state_path: Optional[str] = None):
+        self.name = name
+        # A limit of 0 leaves that dimension unlimited
+        self.limits = {
+            "requests": requests_per_minute,
+            "input_tokens": input_tokens_per_minute,
+            "output_tokens": output_tokens_per_minute
+        }
+        self.max_wait_seconds = max_wait_seconds
+        self.state_path = state_path or None
+        self._state: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._paused_until = 0.0
+        self.admitted = 0
+        self.shed = 0
+        self.queued = 0
+        self.wait_seconds = 0.0
+
+        if self.state_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+                with self._connect() as conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS rate_limits (bucket TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)"
+                    )
+                logger.info(f"Rate limiter '{name}' sharing state at {self.state_path}")
+            except sqlite3.Error as e:
+                logger.error(f"Could not open rate limiter state, limiting per process: {e}")
+                self.state_path = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; SQLite connections can't be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.state_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _transact(self, update: Callable[[Dict[str, tuple]], object]):
+        """Run update() on the bucket state atomically, in process or across workers."""
+        if not self.state_path:
+            with self._lock:
+                return update(self._state)
+
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            state = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT bucket, level, updated FROM rate_limits")}
+            before = dict(state)
+            try:
+                result = update(state)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            changed = [(bucket, level, updated) for bucket, (level, updated) in state.items() if before.get(bucket) != (level, updated)]
+            conn.executemany("INSERT OR REPLACE INTO rate_limits (bucket, level, updated) VALUES (?, ?, ?)", changed)
+            conn.execute("COMMIT")
+            return result
+        except sqlite3.Error as e:
+            logger.warning(f"Rate limiter state unavailable, falling back to per-process limits: {e}")
+            self.state_path = None
+            with self._lock:
+                return update(self._state)
+
+    def _level(self, state: Dict[str, tuple], bucket: str, now: float) -> float:
+        limit = self.limits[bucket]
+        level, updated = state.get(bucket, (limit, now))
+        return min(limit, level + (now - updated) * limit / 60.0)
+
+    def _take(self, costs: Dict[str, int], max_wait: float) -> float:
+        def update(state: Dict[str, tuple]) -> float:
+            now = time.time()
+            paused_until = max(state.get(self.PAUSE, (0.0, 0.0))[0], self._paused_until)
+            state[self.PAUSE] = (paused_until, now)
+            wait = max(0.0, paused_until - now)
+            levels = {}
+            for bucket, cost in costs.items():
+                limit = self.limits[bucket]
+                if not limit:
+                    continue
+                level = self._level(state, bucket, now) - cost
+                levels[bucket] = level
+                if level < 0:
+                    wait = max(wait, -level * 60.0 / limit)
+            if wait > max_wait:
+                raise RateLimitExceeded(f"{self.name}: would queue {wait:.1f}s (limit {max_wait:.1f}s)")
+            for bucket, level in levels.items():
+                state[bucket] = (level, now)
+            return wait
+
+        return self._transact(update)
+
+    def _refund(self, costs: Dict[str, int]) -> None:
+        def update(state: Dict[str, tuple]) -> None:
+            now = time.time()
+            for bucket, amount in costs.items():
+                if self.limits[bucket] and amount:
+                    state[bucket] = (min(self.limits[bucket], self._level(state, bucket, now) + amount), now)
+
+        self._transact(update)
+
+    def _charge(self, bucket: str, tokens: int) -> int:
+        # A single request bigger than the bucket still gets through, one full bucket later
+        limit = self.limits[bucket]
+        return min(tokens, limit) if limit else tokens
+
+    def reserve(self, input_tokens: int, output_tokens: int) -> Reservation:
+        """
+        Take capacity for one request and return how long it must wait before sending.
+
+        Raises RateLimitExceeded, without taking anything, when the wait would exceed
+        max_wait_seconds or the current turn's remaining deadline.
+        """
+        max_wait = self.max_wait_seconds
+        deadline = current_deadline()
+        if deadline is not None:
+            max_wait = min(max_wait, deadline.remaining())
+        input_tokens = self._charge("input_tokens", input_tokens)
+        output_tokens = self._charge("output_tokens", output_tokens)
+        costs = {"requests": 1, "input_tokens": input_tokens, "output_tokens": output_tokens}
+        try:
+            wait = self._take(costs, max_wait)
+        except RateLimitExceeded:
+            self.shed += 1
+            raise
+        self.admitted += 1
+        if wait > 0:
+            self.queued += 1
+            self.wait_seconds += wait
+            logger.info(f"{self.name}: queueing request for {wait:.2f}s to stay under rate limits")
+        return Reservation(input_tokens, output_tokens, wait)
+
+    def acquire(self, input_tokens: int, output_tokens: int) -> Reservation:
+        """Reserve capacity and sleep until the request may be sent."""
+        reservation = self.reserve(input_tokens, output_tokens)
+        if reservation.wait_seconds > 0:
+            time.sleep(reservation.wait_seconds)
+        return reservation
+
+    async def aacquire(self, input_tokens: int, output_tokens: int) -> Reservation:
+        """Async version of acquire(); SQLite state is touched off the event loop."""
+        if self.state_path:
+            reservation = await asyncio.to_thread(self.reserve, input_tokens, output_tokens)
+        else:
+            reservation = self.reserve(input_tokens, output_tokens)
+        if reservation.wait_seconds > 0:
+            await asyncio.sleep(reservation.wait_seconds)
+        return reservation
+
+    def settle(self, reservation: Reservation, usage: Optional[Dict]) -> None:
+        """
+        Correct a reservation with the tokens the request actually used.
+
+        Prompt cache reads don't count against input TPM, so only uncached input and cache
+        writes are charged. Without usage (the request failed) only the output reservation
+        is returned. Usage is clipped like the reservation, so an oversized request costs
+        one full bucket either way.
+        """
+        usage = usage or {}
+        used_output = self._charge("output_tokens", usage.get("output_tokens") or 0)
+        refund = {"output_tokens": reservation.output_tokens - used_output}
+        if usage:
+            used_input = (usage.get("input_tokens") or 0) + (usage.get("cache_creation_input_tokens") or 0)
+            refund["input_tokens"] = reservation.input_tokens - self._charge("input_tokens", used_input)
+        self._refund(refund)
+
+    async def asettle(self, reservation: Reservation, usage: Optional[Dict]) -> None:
+        if self.state_path:
+            await asyncio.to_thread(self.settle, reservation, usage)
+        else:
+            self.settle(reservation, usage)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every new request for seconds, e.g. after a 429 with retry-after."""
+        until = time.time() + seconds
+        if until > self._paused_until:
+            self._paused_until = until
+            logger.warning(f"{self.name}: rate limited upstream, pausing new requests for {seconds:.1f}s")
+
+    def stats(self) -> Dict:
+        def read(state: Dict[str, tuple]) -> Dict:
+            now = time.time()
+            return {bucket: round(self._level(state, bucket, now), 1) for bucket, limit in self.limits.items() if limit}
+
+        return {
+            "limits": self.limits,
+            "available": self._transact(read),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "avg_queue_seconds": round(self.wait_seconds / self.queued, 4) if self.queued else 0.0
+        }
@@ -0,0 +1,146 @@
+"""
+Templated replies for turns that only restate structured facts (the product pitch, the
+order confirmation, requests for missing customer details).
+
+Each template has a few phrasings filled from the product and order fields; a phrasing is
+picked at random so repeated turns don't read identically. Which call sites use templates
+instead of Claude is set by TEMPLATED_REPLY_SITES. The first phrasing of each template is
+also the degraded-mode text in rules_fallback.
+"""
+import logging
+import random
+from typing import Dict, Optional
+from config import TEMPLATED_REPLY_SITES
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES: Dict[str, tuple] = {
+    "product_pitch": (
+        "Here's the {product_name} in {color} at Plato's Price of {price} per garment. "
+        "Upload your design to see how it looks, or ask me for other colors or styles.",
+        "Great news, the {product_name} in {color}{material_phrase} is a perfect fit for your {category} order "
+        "at Plato's Price of {price}. Upload your design to see it on the {category}!",
+        "I found the {product_name} in {color} for you{material_phrase}, at Plato's Price of {price} per {category}. "
+        "Want to upload your design, or see other colors?",
+    ),
+    "cheaper": (
+        "Here's a less expensive option: the {product_name} in {color} at Plato's Price of {price}, "
+        "compared to {previous_price} for the {previous_name}.",
+        "Good news, the {product_name} in {color} comes in at Plato's Price of {price}, "
+        "below the {previous_price} of the {previous_name}.",
+    ),
+    "more_expensive": (
+        "Here's a premium option: the {product_name} in {color} at Plato's Price of {price}, "
+        "a step up from the {previous_name} at {previous_price}.",
+        "For a higher-end {category}, the {product_name} in {color} is Plato's Price of {price}, "
+        "compared to {previous_price} for the {previous_name}.",
+    ),
+    # Appended as-is; SIZE_MENTIONED_PROMPT asks Claude for the same note
+    "size_note": (
+        "P.S I saw your mention of quantities. Don't worry we'll handle that after we finalize your product.",
+    ),
+    # ORDER_COMPLETION_PROMPT pins Claude to this exact text, with the product name pluralized
+    "completion": (
+        "Dear {customer_name}, Thank you for your order of {quantities} Custom {product}, totaling {total_price}. "
+        "We confirm your order will be delivered to {shipping_address} by {received_by_date}, as requested. "
+        "Should you have any questions about your order, please don't hesitate to contact us at "
+        "orders@platosprints.ai. Warm regards, Plato",
+    ),
+    # INCOMPLETE_INFO_PROMPT asks for one field at a time: name -> address -> email, then an unfinished order step
+    "missing_name": (
+        "Could you please provide your full name for the order?",
+        "What name should we put on the order?",
+    ),
+    "missing_address": (
+        "Could you please provide your shipping address?",
+        "Where should we ship the order? Please send the full shipping address.",
+    ),
+    "missing_email": (
+        "Could you please provide your email address for the PayPal invoice?",
+        "What email address should we send the PayPal invoice to?",
+    ),
+    "missing_step": (
+        "Thanks, I have your details. We still need your {step} before I can finish the order.",
+        "Got it, thank you! To complete the order we still need your {step}.",
+    ),
+    "missing_confirmation": (
+        "Could you please confirm your name, shipping address and email for the order?",
+    ),
+}
+
+# Steps OrderState.is_complete requires besides the customer's details, in conversation order
+ORDER_STEPS = (
+    ("product_selected", "product choice"),
+    ("design_uploaded", "design"),
+    ("quantities_collected", "quantities for each size"),
+)
+
+def enabled(site: str) -> bool:
+    """True when the call site is configured to answer from templates instead of Claude."""
+    return site in TEMPLATED_REPLY_SITES
+
+def render(name: str, variant: Optional[int] = None, **values) -> str:
+    """Fill one phrasing of a template; a random phrasing unless variant is given."""
+    phrasings = TEMPLATES[name]
+    template = phrasings[variant] if variant is not None else random.choice(phrasings)
+    return template.format(**values)
+
+def _material_phrase(material: Optional[str]) -> str:
+    return f", made from {material}," if material else ""
+
+def product_pitch(product_name: str, color: str, price: str, category: Optional[str] = None,
+                  material: Optional[str] = None, size_note: bool = False, variant: Optional[int] = None) -> str:
+    text = render(
+        "product_pitch", variant,
+        product_name=product_name, color=color, price=price,
+        category=category or "product", material_phrase=_material_phrase(material)
+    )
+    if size_note:
+        text += "\n\n" + render("size_note")
+    return text
+
+def comparison_pitch(kind: str, product: Dict, previous_product: Dict, variant: Optional[int] = None) -> str:
+    """Pitch for the cheaper or more_expensive alternative to the product shown before."""
+    return render(
+        kind, variant,
+        product_name=product.get("product_name"), color=product.get("color"), price=product.get("price"),
+        category=product.get("category") or "product",
+        previous_name=previous_product.get("product_name"), previous_price=previous_product.get("price")
+    )
+
+def _plural(product_name: str) -> str:
+    """Product name with its garment noun pluralized: "Softstyle T-Shirt" -> "Softstyle T-Shirts", "Shorts" stays."""
+    if not product_name or product_name[-1] in "sS":
+        return product_name
+    return f"{product_name}s"
+
+def completion(order_state, variant: Optional[int] = None) -> str:
+    details = order_state.product_details or {}
+    return render(
+        "completion", variant,
+        customer_name=order_state.customer_name or "Customer",
+        quantities=", ".join(f"{qty} {size.upper()}" for size, qty in order_state.sizes.items()) if order_state.sizes else "Unknown Quantities",
+        product=f"{_plural(details.get('product_name', 'Unknown Product'))} in {details.get('color', 'Unknown Color')}",
+        total_price=f"${order_state.total_price:.2f}" if order_state.total_price else "Unknown Price",
+        shipping_address=order_state.shipping_address or "your address",
+        received_by_date=order_state.received_by_date or "the requested date"
+    )
+
+def missing_step(order_state) -> Optional[str]:
+    """The first order step still unfinished (e.g. "design"), or None."""
+    for flag, step in ORDER_STEPS:
+        if not getattr(order_state, flag, False):
+            return step
+    return None
+
+def incomplete_info(order_state, variant: Optional[int] = None) -> str:
+    if not order_state.customer_name:
+        return render("missing_name", variant)
+    if not order_state.shipping_address:
+        return render("missing_address", variant)
+    if not order_state.email:
+        return render("missing_email", variant)
+    step = missing_step(order_state)
+    if step:
+        return render("missing_step", variant, step=step)
+    return render("missing_confirmation", variant)
@@ -1,7 +1,14 @@
 import logging
-from flask import jsonify, request, send_from_directory, send_file
+from flask import jsonify, request, send_from_directory, send_file, Response
 from plato_bot import PlatoBot
+from async_runtime import iterate_sync
+from llm_metrics import metrics as llm_metrics
+from deadline import Deadline
+from config import CHAT_TURN_BUDGET_SECONDS, ADMIN_TOKEN
+from catalog import CatalogError
+import hmac
 import asyncio
+import json
 from flask_cors import CORS  # Add CORS support
 import requests
 from io import BytesIO
@@ -49,9 +56,37 @@ def init_routes(app, plato_bot):
         if design_url:
             logger.info(f"Design URL provided: {design_url}")
 
-        response = plato_bot.process_message(user_id, message, design_url)
-        logger.info(f"Chat response: {response}")
+        deadline = Deadline(CHAT_TURN_BUDGET_SECONDS)
+        response = plato_bot.process_message(user_id, message, design_url, deadline=deadline)
+        logger.info(f"Chat response: {response} ({deadline})")
         return jsonify(response)
+
+    @app.route('/chat/stream', methods=['POST'])
+    def chat_stream():
+        logger.info("Received /api/chat/stream request")
+        data = request.json
+        user_id = data.get('user_id', 'default_user')
+        message = data.get('message')
+        design_url = data.get('design_url')
+
+        if not message:
+            logger.error("No message provided in /api/chat/stream request")
+            return jsonify({"error": "No message provided"}), 400
+
+        logger.info(f"Streaming chat request for user: {user_id}")
+
+        deadline = Deadline(CHAT_TURN_BUDGET_SECONDS)
+
+        def generate():
+            for event, payload in iterate_sync(plato_bot.aprocess_message_stream(user_id, message, design_url, deadline)):
+                if event == "done":
+                    logger.info(f"Chat response: {payload}")
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+        return Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
     
     @app.route('/remove-background', methods=['POST'])
     def remove_background():
@@ -165,12 +200,50 @@ def init_routes(app, plato_bot):
     @app.route('/health', methods=['GET'])
     def health_check():
         logger.info("Received /api/health request")
+        breaker = plato_bot.claude.breaker.stats()
         return jsonify({
-            "status": "healthy",
+            "status": "degraded" if breaker["state"] == "open" else "healthy",
             "ss_connected": plato_bot.ss is not None,
-            "sonar_connected": True
+            "sonar_connected": True,
+            "llm_cache": plato_bot.claude.cache.stats() if plato_bot.claude.cache else None,
+            "claude_usage": plato_bot.claude.usage_totals,
+            "single_flight": plato_bot.claude.inflight.stats() if plato_bot.claude.inflight else None,
+            "claude_breaker": breaker,
+            "claude_rate_limiter": plato_bot.claude.rate_limiter.stats() if plato_bot.claude.rate_limiter else None,
+            "intent_classifier": plato_bot.intent_classifier.stats() if plato_bot.intent_classifier else None,
+            "speculation": plato_bot.speculation.stats() if plato_bot.speculation else None,
+            "pitch_copy": plato_bot.pitch_copy.stats() if plato_bot.pitch_copy else None,
+            "model_cascade": llm_metrics.cascade_stats(),
+            "intent_batcher": plato_bot.intent_batcher.stats() if plato_bot.intent_batcher else None,
+            "catalog": plato_bot.product_tree.catalog.stats()
         })
 
+    @app.route('/admin/catalog/reload', methods=['POST'])
+    def reload_catalog():
+        """Swap in the catalog file's current version in this worker; the others pick it up from the file watch."""
+        token = request.headers.get('X-Admin-Token', '')
+        if not ADMIN_TOKEN or not hmac.compare_digest(token, ADMIN_TOKEN):
+            return jsonify({'error': 'Forbidden'}), 403
+        try:
+            catalog = plato_bot.reload_catalog()
+        except CatalogError as e:
+            logger.error(f"Catalog reload rejected: {e}")
+            return jsonify({'success': False, 'errors': e.errors}), 400
+        return jsonify({'success': True, 'catalog': catalog.stats()})
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        breaker = plato_bot.claude.breaker.stats()
+        lines = [
+            "# HELP plato_llm_degraded 1 while the Claude circuit breaker is open and replies come from rules",
+            "# TYPE plato_llm_degraded gauge",
+            f"plato_llm_degraded {int(breaker['state'] == 'open')}",
+            "# TYPE plato_llm_breaker_opened_total counter",
+            f"plato_llm_breaker_opened_total {breaker['times_opened']}",
+        ]
+        body = llm_metrics.render_prometheus() + "\n".join(lines) + "\n"
+        return Response(body, mimetype='text/plain; version=0.0.4')
+
     @app.route('/context/product', methods=['GET'])
     def get_product_context():
         logger.info("Received /api/context/product request")
@@ -0,0 +1,97 @@
+"""
+Rules-based stand-ins for Claude, used in degraded mode (Claude's circuit breaker is open)
+or when a call fails. Each function produces output in the same shape the LLM call would.
+"""
+import logging
+import re
+from typing import Dict, List, Optional
+from product_decision_tree import SEMANTIC_COLOR_MAP
+import response_templates
+
+logger = logging.getLogger(__name__)
+
+# Checked in order, so more specific garments come before plain "shirt"
+CATEGORY_KEYWORDS = [
+    ("Long Sleeve Shirt", ["long sleeve", "long-sleeve", "longsleeve"]),
+    ("Sweatshirt", ["hoodie", "hoodies", "hoody", "hooded", "sweatshirt", "sweatshirts"]),
+    ("Crewneck", ["crewneck", "crewnecks", "crew neck"]),
+    ("Sweatpants", ["sweatpants", "joggers", "sweats"]),
+    ("Polo", ["polo", "polos"]),
+    ("Tank Top", ["tank", "tanks", "tank top", "tank tops"]),
+    ("Shorts", ["shorts"]),
+    ("T-Shirt", ["t-shirt", "t-shirts", "tshirt", "tshirts", "t shirt", "t shirts", "tee", "tees", "shirt", "shirts"]),
+]
+
+MATERIAL_KEYWORDS = [
+    ("Cotton/Poly Blend", ["blend", "50/50", "cotton/poly", "cotton poly"]),
+    ("100% Polyester", ["polyester", "poly", "athletic", "moisture", "dri-fit", "dri fit", "performance"]),
+    ("100% Cotton", ["cotton"]),
+]
+
+PRICE_KEYWORDS = [
+    ("Affordable", ["cheap", "cheaper", "affordable", "budget", "inexpensive", "low cost", "lowest price"]),
+    ("Premium", ["premium", "high end", "high-end", "luxury", "best quality", "top quality"]),
+]
+
+# Longest first so "light blue" wins over "blue"
+_COLOR_TERMS = sorted(SEMANTIC_COLOR_MAP.keys(), key=len, reverse=True)
+
+def _find_keyword(text: str, table: List) -> Optional[str]:
+    for label, keywords in table:
+        for keyword in keywords:
+            if re.search(rf"\b{re.escape(keyword)}\b", text):
+                return label
+    return None
+
+def analyze_product_request(message: str) -> Dict:
+    """Keyword version of PRODUCT_ANALYSIS_PROMPT, returning the same dict as utils.normalize_product_analysis."""
+    text = message.lower()
+    color = None
+    for term in _COLOR_TERMS:
+        if re.search(rf"\b{re.escape(term.lower())}\b", text):
+            color = term.title()
+            break
+
+    analysis = {
+        "category": _find_keyword(text, CATEGORY_KEYWORDS),
+        "color": color,
+        "material": _find_keyword(text, MATERIAL_KEYWORDS),
+        "brand": None,
+        "price": _find_keyword(text, PRICE_KEYWORDS),
+        "fit": None,
+        "size": None,
+    }
+    logger.info(f"Local product analysis for '{message}': {analysis}")
+    return analysis
+
+def preference_inquiry_reply(previous_product: Dict) -> str:
+    return (
+        f"No problem! What would you like to change from the {previous_product.get('product_name', 'previous option')}: "
+        f"a different material (it's {previous_product.get('material', 'a cotton/poly blend')}), "
+        f"a different price point (it's {previous_product.get('price', 'listed above')}), or a different style or color?"
+    )
+
+def size_first_reply() -> str:
+    return (
+        "Happy to help with your order! What type of garment would you like: "
+        "t-shirts, long sleeves, hoodies, crewnecks, polos, tank tops, shorts or sweatpants?"
+    )
+
+def placement_reply(context: Dict) -> str:
+    category = context.get("product_category") or "product"
+    return (
+        f"Your design looks great on the {category}! "
+        f"This {category} comes in both youth sizes {context.get('youth_sizes')} and adult sizes "
+        f"{context.get('adult_sizes')}. How many of each size would you like to order?"
+    )
+
+def quantity_reply() -> str:
+    return "How many of each size would you like? For example: 10 M, 15 L, 5 XL."
+
+def incomplete_info_reply(order_state) -> str:
+    # Same priority order as INCOMPLETE_INFO_PROMPT: name -> address -> email -> order step
+    return response_templates.incomplete_info(order_state, variant=0)
+
+def completion_reply(order_state) -> str:
+    """Same confirmation format ORDER_COMPLETION_PROMPT asks Claude for."""
+    return response_templates.completion(order_state, variant=0)
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from deadline import DeadlineExceeded, current_deadline
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls so only one of them reaches the upstream API.
+
+    The first caller for a key (the leader) makes the call; callers that arrive while
+    it is in flight wait for it and share its result. Nothing is kept once the call
+    finishes, so this only removes duplicate concurrent work; caching is LLMCache's job.
+
+    The call runs under the leader's deadline, so a follower waits no longer than its own
+    (raising DeadlineExceeded) and doesn't inherit the leader's failure: when the call
+    raised, or returned a result shareable rejects, the follower makes the call itself.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.shared = 0
+        self.retried = 0
+        self.wait_seconds = 0.0
+
+    def do(self, key: str, fn: Callable[[], Any], shareable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Run fn() for key, or wait for an identical call already in flight on another thread."""
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not is_leader:
+            deadline = current_deadline()
+            start = time.monotonic()
+            finished = call.done.wait(deadline.remaining() if deadline else None)
+            self._record_wait(time.monotonic() - start)
+            if not finished:
+                raise DeadlineExceeded(f"Deadline of {deadline.budget:.1f}s exceeded waiting for an in-flight call")
+            if call.error is None and (shareable is None or shareable(call.result)):
+                logger.info(f"{self.name}: shared result of an in-flight call")
+                return call.result
+            self._record_retry()
+            return fn()
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]],
+                  shareable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Await fn() for key, or join an identical call already in flight on this event loop."""
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(key)
+        if task is not None and not task.done() and task.get_loop() is loop:
+            with self._lock:
+                self.shared += 1
+            deadline = current_deadline()
+            start = time.monotonic()
+            try:
+                # asyncio.wait neither cancels the call on timeout nor when this caller gives up
+                done, _ = await asyncio.wait({task}, timeout=deadline.remaining() if deadline else None)
+            finally:
+                self._record_wait(time.monotonic() - start)
+            if not done:
+                raise DeadlineExceeded(f"Deadline of {deadline.budget:.1f}s exceeded waiting for an in-flight call")
+            if not task.cancelled() and task.exception() is None and (shareable is None or shareable(task.result())):
+                logger.info(f"{self.name}: shared result of an in-flight call")
+                return task.result()
+            self._record_retry()
+            return await fn()
+
+        with self._lock:
+            self.leaders += 1
+        task = loop.create_task(fn())
+        self._tasks[key] = task
+
+        def _forget(finished: asyncio.Task) -> None:
+            if self._tasks.get(key) is finished:
+                del self._tasks[key]
+
+        task.add_done_callback(_forget)
+        return await asyncio.shield(task)
+
+    def _record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.wait_seconds += seconds
+
+    def _record_retry(self) -> None:
+        logger.info(f"{self.name}: in-flight call failed, making it again")
+        with self._lock:
+            self.retried += 1
+
+    def stats(self) -> Dict:
+        total = self.leaders + self.shared
+        return {
+            "upstream_calls": self.leaders + self.retried,
+            "shared": self.shared,
+            "retried": self.retried,
+            "saved_ratio": round((self.shared - self.retried) / total, 4) if total else 0.0,
+            "wait_seconds_total": round(self.wait_seconds, 3),
+            "avg_wait_seconds": round(self.wait_seconds / self.shared, 3) if self.shared else 0.0
+        }
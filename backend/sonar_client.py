@@ -1,12 +1,18 @@
+import hashlib
+import json
 import logging
 import requests
 from typing import Dict, List
 from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from config import SONAR_API_KEY, SONAR_BASE_URL
+from config import SONAR_API_KEY, SONAR_BASE_URL, SINGLE_FLIGHT_ENABLED
+from single_flight import SingleFlight
+from http_retry import post_with_retries
+from deadline import DeadlineExceeded
 
 logger = logging.getLogger(__name__)
 
+ERROR_RESPONSE = "I encountered an error. Please try again or contact support if the issue persists."
+
 class SonarClient:
     def __init__(self):
         if not SONAR_API_KEY:
@@ -14,21 +20,29 @@ class SonarClient:
             raise Exception("Missing SONAR_API_KEY")
             
         self.session = self._setup_session()
+        self.inflight = SingleFlight("sonar") if SINGLE_FLIGHT_ENABLED else None
         
     def _setup_session(self) -> requests.Session:
-        """Setup requests session with retry logic."""
+        """Setup pooled requests session; retries are bounded by the turn deadline in http_retry."""
         session = requests.Session()
-        retries = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["POST", "GET"]
-        )
-        session.mount('https://', HTTPAdapter(max_retries=retries))
+        session.mount('https://', HTTPAdapter())
         return session
         
     def call_api(self, messages: List[Dict], temperature: float = 0.7) -> str:
-        """Call Sonar API with messages."""
+        """Call Sonar API with messages, sharing the result with identical calls already in flight."""
+        if self.inflight is None:
+            return self._call_api(messages, temperature)
+        key = hashlib.sha256(
+            json.dumps({"messages": messages, "temperature": temperature}, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        try:
+            return self.inflight.do(key, lambda: self._call_api(messages, temperature),
+                                    shareable=lambda response: response != ERROR_RESPONSE)
+        except DeadlineExceeded as e:
+            logger.warning(f"Sonar API: {e}")
+            return ERROR_RESPONSE
+
+    def _call_api(self, messages: List[Dict], temperature: float) -> str:
         logger.info(f"Calling Sonar API with messages: {messages}")
         try:
             headers = {
@@ -41,8 +55,10 @@ class SonarClient:
                 "temperature": temperature
             }
             
-            response = self.session.post(
+            response = post_with_retries(
+                self.session,
                 SONAR_BASE_URL,
+                label="Sonar API",
                 headers=headers,
                 json=data,
                 timeout=60
@@ -53,4 +69,4 @@ class SonarClient:
             
         except Exception as e:
             logger.exception("Error in Sonar API call")
-            return "I encountered an error. Please try again or contact support if the issue persists."
\ No newline at end of file
+            return ERROR_RESPONSE
\ No newline at end of file
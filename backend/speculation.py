@@ -0,0 +1,81 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from llm_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class SpeculativeCache:
+    """
+    Per-conversation results computed ahead of the turn that is likely to need them.
+
+    Entries are keyed by the inputs they were computed from, so a follow-up turn only hits
+    when it asks exactly the question that was speculated. Each conversation's entries
+    expire together after ttl_seconds; the least recently used conversations are dropped
+    beyond max_conversations.
+    """
+
+    def __init__(self, ttl_seconds: float = 300.0, max_conversations: int = 5000):
+        self.ttl_seconds = ttl_seconds
+        self.max_conversations = max_conversations
+        self._entries: "OrderedDict[str, Tuple[float, Dict[Hashable, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+
+    def put(self, user_id: str, key: Hashable, value: Any) -> None:
+        with self._lock:
+            expires_at, values = self._entries.get(user_id, (0.0, {}))
+            if expires_at < time.time():
+                values = {}
+            values[key] = value
+            self._entries[user_id] = (time.time() + self.ttl_seconds, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_conversations:
+                self._entries.popitem(last=False)
+            self.stored += 1
+
+    def get(self, user_id: str, key: Hashable) -> Tuple[bool, Any]:
+        """(True, value) for a live speculated entry, (False, None) otherwise; None is a valid value."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] < time.time():
+                del self._entries[user_id]
+                entry = None
+            if entry is not None and key in entry[1]:
+                self.hits += 1
+                found = (True, entry[1][key])
+            else:
+                self.misses += 1
+                found = (False, None)
+        metrics.increment("speculation", "hit" if found[0] else "miss")
+        return found
+
+    def get_or_compute(self, user_id: str, key: Hashable, fn: Callable, *args):
+        """Speculated value for key, or fn(*args) computed now."""
+        hit, value = self.get(user_id, key)
+        if hit:
+            logger.info(f"Speculation hit for user {user_id}: {key[0] if isinstance(key, tuple) else key}")
+            return value
+        return fn(*args)
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """Drop one conversation's entries, or everything (e.g. after the catalog changes)."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "conversations": len(self._entries),
+            "stored": self.stored,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -3,7 +3,7 @@ import base64
 import requests
 from typing import Optional
 from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from http_retry import request_with_retries
 
 class SSClient:
     def __init__(self, username: str, api_key: str):
@@ -12,15 +12,8 @@ class SSClient:
         encoded_auth = base64.b64encode(auth_str.encode()).decode()
         
         self.session = requests.Session()
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=0.5,
-            status_forcelist=[500, 502, 503, 504],
-            allowed_methods=["GET"]
-        )
-        
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        self.session.mount("https://", adapter)
+        # Retries happen in request_with_retries so they respect the chat turn deadline
+        self.session.mount("https://", HTTPAdapter())
         
         self.session.headers.update({
             "Authorization": f"Basic {encoded_auth}",
@@ -43,7 +36,14 @@ class SSClient:
                 "fields": "colorName,customerPrice"
             }
             
-            response = self.session.get(url, params=params, timeout=30)
+            response = request_with_retries(
+                self.session, "GET", url,
+                backoff_factor=0.5,
+                retry_statuses={500, 502, 503, 504},
+                label="S&S API",
+                params=params,
+                timeout=30
+            )
             
             if response.status_code == 200:
                 data = response.json()
@@ -0,0 +1,209 @@
+"""
+Tool-use schemas for the LLM call sites that extract structured data, plus the validation
+and repair step shared by ClaudeClient.call_tool and acall_tool.
+
+Each extraction call forces Claude to call one tool, so the answer arrives as a JSON object
+(the tool input) instead of free text to be re-parsed. The input is checked against the
+tool's schema; an invalid one gets a single repair turn that sends the validation errors
+back as the tool result.
+"""
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GOALS = ["product_selection", "design_placement", "quantity_collection", "customer_information"]
+CATEGORIES = ["T-Shirt", "Sweatshirt", "Long Sleeve Shirt", "Crewneck", "Sweatpants", "Polo", "Tank Top", "Shorts", "None"]
+MATERIALS = ["100% Cotton", "100% Polyester", "Cotton/Poly Blend"]
+
+def _nullable(schema: Dict) -> Dict:
+    return {**schema, "type": [schema.get("type", "string"), "null"]}
+
+_PRODUCT_PROPERTIES = {
+    "category": {"type": "string", "enum": CATEGORIES, "description": "Garment category"},
+    "color": _nullable({"type": "string", "description": "Requested color, as specific as the customer said it"}),
+    "material": _nullable({"type": "string", "enum": MATERIALS + [None]}),
+    "brand": _nullable({"type": "string"}),
+    "price_point": _nullable({"type": "string", "enum": ["Affordable", "Quality", "Premium", None]}),
+    "fit": _nullable({"type": "string"}),
+    "size": _nullable({"type": "string"}),
+}
+
+# Optional on the stage tools; "low" makes the model cascade escalate a fast-model answer
+_CONFIDENCE = {"type": "string", "enum": ["high", "low"], "description": "low if the message could fit more than one stage"}
+
+PRODUCT_ANALYSIS_TOOL = {
+    "name": "record_product_analysis",
+    "description": "Record the product preferences in the customer's message. Use null for anything not mentioned.",
+    "input_schema": {
+        "type": "object",
+        "properties": _PRODUCT_PROPERTIES,
+        "required": list(_PRODUCT_PROPERTIES)
+    }
+}
+
+INTENT_ANALYSIS_TOOL = {
+    "name": "record_intent_analysis",
+    "description": "Record the ordering stage of the customer's message and the product preferences in it.",
+    "input_schema": {
+        "type": "object",
+        "properties": {"goal": {"type": "string", "enum": GOALS[:3]}, "confidence": _CONFIDENCE, **_PRODUCT_PROPERTIES},
+        "required": ["goal"] + list(_PRODUCT_PROPERTIES)
+    }
+}
+
+INTENT_ANALYSIS_BATCH_TOOL = {
+    "name": "record_intent_analyses",
+    "description": "Record the stage and product preferences of every numbered customer message.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "results": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"item": {"type": "integer", "description": "Item number"},
+                                   **INTENT_ANALYSIS_TOOL["input_schema"]["properties"]},
+                    "required": ["item"] + INTENT_ANALYSIS_TOOL["input_schema"]["required"]
+                }
+            }
+        },
+        "required": ["results"]
+    }
+}
+
+INTENT_TOOL = {
+    "name": "record_stage",
+    "description": "Record the ordering stage the customer's message relates to.",
+    "input_schema": {
+        "type": "object",
+        "properties": {"goal": {"type": "string", "enum": GOALS}, "confidence": _CONFIDENCE},
+        "required": ["goal"]
+    }
+}
+
+CUSTOMER_INFO_TOOL = {
+    "name": "record_customer_info",
+    "description": "Record the customer details present in the message. Use null for anything missing or uncertain.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "name": _nullable({"type": "string", "description": "Full name (first and last)"}),
+            "address": _nullable({"type": "string", "description": "Complete address with street, city, state and zip"}),
+            "email": _nullable({"type": "string", "pattern": "@", "description": "Email address"})
+        },
+        "required": ["name", "address", "email"]
+    }
+}
+
+def product_selection_tool(option_count: int) -> Dict:
+    """Tool for picking one of the numbered product options in the rerank prompt."""
+    return {
+        "name": "select_product",
+        "description": "Select the product option that best matches the customer's request.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "reasoning": {"type": "string", "description": "Brief explanation of how the option matches the requirements"},
+                "option": {"type": "integer", "minimum": 1, "maximum": option_count, "description": "Number of the selected option"}
+            },
+            "required": ["reasoning", "option"]
+        }
+    }
+
+_TYPES = {
+    "object": dict, "array": list, "string": str, "boolean": bool, "null": type(None),
+    "integer": int, "number": (int, float)
+}
+
+def validate(schema: Dict, value: Any, path: str = "input") -> List[str]:
+    """
+    Errors for value against the JSON schema subset the tools use: type (or list of types),
+    enum, required, properties, items, minimum, maximum and pattern (a required substring).
+    """
+    types = schema.get("type")
+    if types is not None:
+        types = types if isinstance(types, list) else [types]
+        # bool is an int subclass, so it must not pass as a number
+        if isinstance(value, bool) and "boolean" not in types:
+            return [f"{path} must be {' or '.join(types)}"]
+        if not any(isinstance(value, _TYPES[t]) for t in types):
+            return [f"{path} must be {' or '.join(types)}"]
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path} must be one of {[v for v in schema['enum'] if v is not None]}"]
+    errors = []
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}.{key} is required")
+        for key, sub in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(validate(sub, value[key], f"{path}.{key}"))
+    elif isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate(schema["items"], item, f"{path}[{i}]"))
+    elif isinstance(value, (int, float)):
+        if "minimum" in schema and value < schema["minimum"]:
+            errors.append(f"{path} must be at least {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            errors.append(f"{path} must be at most {schema['maximum']}")
+    elif isinstance(value, str) and "pattern" in schema and schema["pattern"] not in value:
+        errors.append(f"{path} is not valid")
+    return errors
+
+def decode(response: str, tool: Dict) -> Tuple[Optional[Dict], List[str]]:
+    """
+    The tool_use block ({"id", "name", "input"}) ClaudeClient returned for a tool call, and the
+    input's validation errors. The block is None when Claude failed or didn't call the tool.
+    """
+    try:
+        block = json.loads(response)
+    except (TypeError, ValueError):
+        return None, ["no tool call in response"]
+    if not isinstance(block, dict) or block.get("name") != tool["name"]:
+        return None, ["no tool call in response"]
+    return block, validate(tool["input_schema"], block.get("input"))
+
+def split_batch(response: str, batch_tool: Dict, item_tool: Dict, count: int) -> List[Optional[Dict]]:
+    """
+    Per-item inputs from a batch tool call whose input holds a "results" array of numbered
+    items (1..count). Items that are missing, duplicated or invalid for item_tool are None,
+    so the caller can retry just those.
+    """
+    block, _ = decode(response, batch_tool)
+    inputs: List[Optional[Dict]] = [None] * count
+    results = (block or {}).get("input", {}).get("results")
+    if not isinstance(results, list):
+        return inputs
+    seen = set()
+    for result in results:
+        if not isinstance(result, dict) or not isinstance(result.get("item"), int):
+            continue
+        index = result["item"] - 1
+        if not 0 <= index < count:
+            continue
+        if index in seen:
+            # Two answers for one item: trust neither
+            inputs[index] = None
+            continue
+        seen.add(index)
+        tool_input = {k: v for k, v in result.items() if k != "item"}
+        errors = validate(item_tool["input_schema"], tool_input)
+        if errors:
+            logger.warning(f"Invalid {batch_tool['name']} item {result['item']}: {'; '.join(errors)}")
+            continue
+        inputs[index] = tool_input
+    return inputs
+
+def repair_messages(messages: List[Dict], block: Dict, errors: List[str]) -> List[Dict]:
+    """The original messages plus the invalid tool call and its errors, asking Claude to call the tool again."""
+    return messages + [
+        {"role": "assistant", "content": [{"type": "tool_use", "id": block["id"], "name": block["name"], "input": block["input"]}]},
+        {"role": "user", "content": [{
+            "type": "tool_result",
+            "tool_use_id": block["id"],
+            "is_error": True,
+            "content": "Invalid input: " + "; ".join(errors) + f". Call {block['name']} again with corrected input."
+        }]}
+    ]
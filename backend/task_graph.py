@@ -0,0 +1,150 @@
+import asyncio
+import contextvars
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar, Union
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class _Node:
+    def __init__(self, name: str, deps: List["_Node"]):
+        self.name = name
+        self.deps = deps
+        self.task: Optional[asyncio.Task] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def seconds(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+class TaskGraph:
+    """
+    Dependency graph of the steps in one chat turn.
+
+    Steps are added as they become known and start as soon as everything they run after
+    has finished, so independent I/O (Firestore writes, catalog lookups, the pitch) overlaps.
+    Blocking callables run on the default executor. join() waits for whatever is still in
+    flight and logs how much work ran, the wall time it took and the critical path.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.created = time.monotonic()
+        self._nodes: List[_Node] = []
+
+    def _resolve(self, after: Iterable[Union[str, asyncio.Task]]) -> List[_Node]:
+        # A name refers to every step added under it so far
+        deps = []
+        for ref in after:
+            deps.extend(n for n in self._nodes if n.name == ref or n.task is ref)
+        return deps
+
+    def add(self, name: str, fn: Callable[..., Any], *args, after: Iterable[Union[str, asyncio.Task]] = (),
+            **kwargs) -> asyncio.Task:
+        """
+        Schedule fn(*args, **kwargs) to run once the steps in after have finished.
+
+        Returns the step's task; await it for the result. If a dependency fails, the step
+        fails with the same exception without running.
+        """
+        node = _Node(name, self._resolve(after))
+
+        async def run():
+            for dep in node.deps:
+                await asyncio.shield(dep.task)
+            node.started = time.monotonic()
+            try:
+                if asyncio.iscoroutinefunction(fn):
+                    return await fn(*args, **kwargs)
+                return await asyncio.to_thread(fn, *args, **kwargs)
+            finally:
+                node.finished = time.monotonic()
+
+        # The task copies the current context, so the turn deadline and reply stream carry over
+        node.task = asyncio.ensure_future(run())
+        self._nodes.append(node)
+        return node.task
+
+    def critical_path(self) -> List[_Node]:
+        """Chain of steps ending at the last one to finish, following the dependency it waited on longest."""
+        done = [n for n in self._nodes if n.finished is not None]
+        if not done:
+            return []
+        path = [max(done, key=lambda n: n.finished)]
+        while True:
+            deps = [d for d in path[-1].deps if d.finished is not None]
+            if not deps:
+                break
+            path.append(max(deps, key=lambda d: d.finished))
+        return path[::-1]
+
+    def timing(self) -> Dict:
+        """Work done by the steps, the wall time they covered and the difference saved by overlapping them."""
+        intervals = sorted((n.started, n.finished) for n in self._nodes if n.started is not None and n.finished is not None)
+        work = sum(end - start for start, end in intervals)
+        busy = 0.0
+        span_start = span_end = None
+        for start, end in intervals:
+            if span_end is None or start > span_end:
+                if span_end is not None:
+                    busy += span_end - span_start
+                span_start, span_end = start, end
+            else:
+                span_end = max(span_end, end)
+        if span_end is not None:
+            busy += span_end - span_start
+        return {
+            "steps": len(intervals),
+            "work_seconds": round(work, 4),
+            "busy_seconds": round(busy, 4),
+            "saved_seconds": round(work - busy, 4),
+            "wall_seconds": round(time.monotonic() - self.created, 4),
+            "critical_path": [(n.name, round(n.seconds, 4)) for n in self.critical_path()]
+        }
+
+    async def join(self) -> Dict:
+        """Wait for every step (including ones added while waiting), log the turn's timing and return it."""
+        while True:
+            pending = [n.task for n in self._nodes if not n.task.done()]
+            if not pending:
+                break
+            await asyncio.wait(pending)
+        for node in self._nodes:
+            if not node.task.cancelled() and node.task.exception() is not None:
+                logger.warning(f"Step '{node.name}' of {self.name} failed: {node.task.exception()}")
+
+        timing = self.timing()
+        if timing["steps"]:
+            path = " -> ".join(f"{name} {seconds:.3f}s" for name, seconds in timing["critical_path"])
+            logger.info(
+                f"{self.name}: {timing['steps']} steps, {timing['work_seconds']:.3f}s of work in "
+                f"{timing['busy_seconds']:.3f}s (saved {timing['saved_seconds']:.3f}s), "
+                f"turn wall {timing['wall_seconds']:.3f}s; critical path: {path}"
+            )
+        return timing
+
+_current_graph: contextvars.ContextVar[Optional[TaskGraph]] = contextvars.ContextVar("task_graph", default=None)
+
+def current_graph() -> Optional[TaskGraph]:
+    return _current_graph.get()
+
+async def run_in_graph(name: str, coro: Awaitable[T]) -> T:
+    """
+    Await coro with a fresh TaskGraph as the current one, then join the graph.
+
+    Nested calls reuse the enclosing graph, so a handler called from a turn joins with the turn.
+    """
+    if _current_graph.get() is not None:
+        return await coro
+    graph = TaskGraph(name)
+    token = _current_graph.set(graph)
+    try:
+        return await coro
+    finally:
+        _current_graph.reset(token)
+        await graph.join()
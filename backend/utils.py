@@ -5,40 +5,31 @@ from typing import Dict, Optional
 
 logger = logging.getLogger(__name__)
 
-def parse_customer_info(extraction_response: str) -> dict:
+PRODUCT_ANALYSIS_FIELDS = ("category", "color", "material", "brand", "price", "fit", "size")
+
+# Category of a garment the customer asked for that we don't carry (the tools' explicit "None"),
+# as opposed to None when they didn't name one
+CATEGORY_NOT_CARRIED = "None"
+
+def normalize_product_analysis(tool_input: Dict) -> Dict:
     """
-    Parse the customer info extraction response.
-    Expected format:
-    CUSTOMER_INFO:
-    NAME: John Smith
-    ADDRESS: 123 Main St, Boston MA 02108
-    EMAIL: john@email.com
+    Product analysis dict from a record_product_analysis or record_intent_analysis tool input.
+
+    Returns a dict with every PRODUCT_ANALYSIS_FIELDS key (None when not mentioned or "None",
+    except an explicit "None" category, which becomes CATEGORY_NOT_CARRIED) plus "goal" when present.
     """
-    info = {
-        'name': 'none',
-        'address': 'none',
-        'email': 'none'
-    }
-    
-    try:
-        # Remove CUSTOMER_INFO: prefix if present
-        if 'CUSTOMER_INFO:' in extraction_response:
-            extraction_response = extraction_response.split('CUSTOMER_INFO:', 1)[1]
-            
-        lines = extraction_response.strip().split('\n')
-        for line in lines:
-            line = line.strip()
-            if line.startswith('NAME: '):
-                info['name'] = line.replace('NAME: ', '').strip()
-            elif line.startswith('ADDRESS: '):
-                info['address'] = line.replace('ADDRESS: ', '').strip()
-            elif line.startswith('EMAIL: '):
-                info['email'] = line.replace('EMAIL: ', '').strip()
-                
-        return info
-    except Exception as e:
-        logger.error(f"Error parsing customer info: {str(e)}")
-        return info
+    data = dict(tool_input)
+    data["price"] = data.pop("price_point", None)
+    analysis = {}
+    for field in PRODUCT_ANALYSIS_FIELDS + ("goal",):
+        value = data.get(field)
+        value = value.strip() if isinstance(value, str) else ""
+        analysis[field] = value if value and value.lower() not in ("none", "null") else None
+    if isinstance(data.get("category"), str) and data["category"].strip().lower() == "none":
+        analysis["category"] = CATEGORY_NOT_CARRIED
+    if analysis["goal"] is None:
+        del analysis["goal"]
+    return analysis
 
 def extract_size_info(message: str) -> Dict[str, int]:
     """
@@ -97,6 +88,78 @@ def clean_response(text: str) -> str:
     text = re.sub(r'\[\d+\]', '', text)
     return ' '.join(text.split())
 
+class StreamCleaner:
+    """
+    Incremental version of clean_response for streamed text.
+
+    Text that could still turn into a tag or a citation marker is held back until
+    the next chunk (or flush) decides it, so joining everything feed() and flush()
+    return gives the same result as clean_response on the full text.
+    """
+
+    _CITATION_TAIL = re.compile(r'\[\d*$')
+
+    def __init__(self):
+        self._buffer = ""
+        self._in_think = False
+        self._started = False
+        self._pending_space = False
+
+    def feed(self, chunk: str) -> str:
+        """Add a streamed chunk and return whatever cleaned text is now safe to emit."""
+        self._buffer += chunk
+        return self._drain(final=False)
+
+    def flush(self) -> str:
+        """Return the remaining cleaned text once the stream has ended."""
+        return self._drain(final=True)
+
+    def _drain(self, final: bool) -> str:
+        output = []
+        while True:
+            if self._in_think:
+                end = self._buffer.find('</think>')
+                if end == -1:
+                    # Keep just enough to recognise a closing tag split across chunks
+                    self._buffer = "" if final else self._buffer[-(len('</think>') - 1):]
+                    return ''.join(output)
+                self._buffer = self._buffer[end + len('</think>'):]
+                self._in_think = False
+                continue
+            start = self._buffer.find('<think>')
+            if start == -1:
+                break
+            output.append(self._clean_segment(self._buffer[:start]))
+            self._buffer = self._buffer[start + len('<think>'):]
+            self._in_think = True
+
+        cut = len(self._buffer)
+        if not final:
+            open_tag = self._buffer.rfind('<')
+            if open_tag != -1 and '>' not in self._buffer[open_tag:]:
+                cut = open_tag
+            citation = self._CITATION_TAIL.search(self._buffer, 0, cut)
+            if citation:
+                cut = citation.start()
+        output.append(self._clean_segment(self._buffer[:cut]))
+        self._buffer = self._buffer[cut:]
+        return ''.join(output)
+
+    def _clean_segment(self, segment: str) -> str:
+        segment = re.sub(r'<[^>]+>', '', segment)
+        segment = re.sub(r'\*\*|\*', '', segment)
+        segment = re.sub(r'\[\d+\]', '', segment)
+        words = segment.split()
+        if not words:
+            if segment and self._started:
+                self._pending_space = True
+            return ''
+        text = ' ' if self._started and (self._pending_space or segment[0].isspace()) else ''
+        text += ' '.join(words)
+        self._pending_space = segment[-1].isspace()
+        self._started = True
+        return text
+
 def get_product_images(style_number: str, color: str) -> Optional[Dict[str, str]]:
     """Get front and back image paths for a product."""
     try: